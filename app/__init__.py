@@ -1,4 +1,5 @@
 import os
+import shutil
 from flask import Flask
 
 
@@ -6,11 +7,83 @@ def create_app():
     app = Flask(__name__, static_folder="static", template_folder="templates")
     app.config.from_mapping(
         JOB_CLEANUP_SECONDS=int(os.environ.get("JOB_CLEANUP_SECONDS", "3600")),
+        # Cap on stored job output; least recently viewed finished jobs are evicted first
+        JOB_MAX_BYTES=int(os.environ.get("JOB_MAX_BYTES", str(256 * 1024 * 1024))),
+        # "memory" (one process) or "sqlite" (shared by every app and worker process on the machine)
+        JOB_STORE=os.environ.get("JOB_STORE", "memory").lower(),
+        JOB_STORE_PATH=os.environ.get("JOB_STORE_PATH", ""),
+        # "inline" runs /api/execute jobs in the web process; "worker" leaves them to python -m app.worker
+        JOB_DISPATCH=os.environ.get("JOB_DISPATCH", "inline").lower(),
+        WORKER_MAX_JOBS=int(os.environ.get("WORKER_MAX_JOBS", "4")),
+        # SQLite store: unfinished jobs whose process stopped renewing this lease are failed
+        JOB_LEASE_SECONDS=float(os.environ.get("JOB_LEASE_SECONDS", "60")),
         SSH_DEFAULT_PORT=int(os.environ.get("SSH_DEFAULT_PORT", "22")),
         SSH_TIMEOUT_SECONDS=int(os.environ.get("SSH_TIMEOUT_SECONDS", "30")),
+        # TCP pre-probe of the SSH port on every /api/execute target; dead hosts fail fast as "unreachable"
+        PREFLIGHT_PROBE=os.environ.get("PREFLIGHT_PROBE", "0") == "1",
+        PROBE_TIMEOUT_SECONDS=float(os.environ.get("PROBE_TIMEOUT_SECONDS", "1.5")),
+        PROBE_CACHE_SECONDS=float(os.environ.get("PROBE_CACHE_SECONDS", "30")),
         MAX_PARALLEL=int(os.environ.get("MAX_PARALLEL", "30")),
+        # Shared scheduler limits (MAX_PARALLEL is the global cap); 0 = no per-job cap
+        SCHEDULER_PER_HOST_LIMIT=int(os.environ.get("SCHEDULER_PER_HOST_LIMIT", "4")),
+        SCHEDULER_PER_JOB_LIMIT=int(os.environ.get("SCHEDULER_PER_JOB_LIMIT", "0")),
+        # AIMD limit per operation type (commands, transfers, gather) below MAX_PARALLEL
+        ADAPTIVE_CONCURRENCY=os.environ.get("ADAPTIVE_CONCURRENCY", "0") == "1",
+        ADAPTIVE_INITIAL=int(os.environ.get("ADAPTIVE_INITIAL", "8")),
+        ADAPTIVE_MIN=int(os.environ.get("ADAPTIVE_MIN", "2")),
+        ADAPTIVE_LATENCY_TOLERANCE=float(os.environ.get("ADAPTIVE_LATENCY_TOLERANCE", "2.0")),
+        # How often /api/job/<id>/events checks running hosts for new output
+        JOB_EVENTS_INTERVAL_SECONDS=float(os.environ.get("JOB_EVENTS_INTERVAL_SECONDS", "0.5")),
+        # "thread" (default) or "asyncio" (needs asyncssh) for /api/execute fan-out
+        EXECUTION_ENGINE=os.environ.get("EXECUTION_ENGINE", "thread").lower(),
+        ASYNC_MAX_CONCURRENCY=int(os.environ.get("ASYNC_MAX_CONCURRENCY", "2000")),
+        # Per-host output capture: first/last N bytes kept in memory, optional full log on disk
+        OUTPUT_HEAD_BYTES=int(os.environ.get("OUTPUT_HEAD_BYTES", str(64 * 1024))),
+        OUTPUT_TAIL_BYTES=int(os.environ.get("OUTPUT_TAIL_BYTES", str(64 * 1024))),
+        OUTPUT_SPILL_TO_DISK=os.environ.get("OUTPUT_SPILL_TO_DISK", "0") == "1",
+        OUTPUT_SPILL_DIR=os.environ.get("OUTPUT_SPILL_DIR", ""),
+        # Relay distribution for file operations: server -> seeds -> host-to-host tree
+        RELAY_SEEDS=int(os.environ.get("RELAY_SEEDS", "2")),
+        RELAY_FANOUT=int(os.environ.get("RELAY_FANOUT", "2")),
+        RELAY_TIMEOUT_SECONDS=int(os.environ.get("RELAY_TIMEOUT_SECONDS", "3600")),
+        # /api/copy-from-vm streams source blocks to targets (no server temp file) unless disabled
+        COPY_PIPELINED=os.environ.get("COPY_PIPELINED", "1") == "1",
+        # /api/upload-copy streams the upload to targets as it arrives, spilling to disk only for laggards
+        UPLOAD_PIPELINED=os.environ.get("UPLOAD_PIPELINED", "1") == "1",
+        PIPELINE_BLOCK_BYTES=int(os.environ.get("PIPELINE_BLOCK_BYTES", str(1024 * 1024))),
+        # In-memory window per stream; with more targets than run at once, the overflow spills to instance/uploads
+        PIPELINE_BUFFER_BYTES=int(os.environ.get("PIPELINE_BUFFER_BYTES", str(64 * 1024 * 1024))),
+        # /api/upload-bundle tar compression: gzip, zstd (needs the zstandard package) or none
+        BUNDLE_COMPRESSION=os.environ.get("BUNDLE_COMPRESSION", "gzip").lower(),
+        # /api/gather: hosts read at once, archive format, per-file memory spool before spilling to disk
+        GATHER_CONCURRENCY=int(os.environ.get("GATHER_CONCURRENCY", "16")),
+        GATHER_FORMAT=os.environ.get("GATHER_FORMAT", "tar.gz").lower(),
+        GATHER_SPOOL_BYTES=int(os.environ.get("GATHER_SPOOL_BYTES", str(8 * 1024 * 1024))),
+        # Skip hosts whose file already has the same sha256; optionally send only changed blocks
+        SKIP_UNCHANGED=os.environ.get("SKIP_UNCHANGED", "1") == "1",
+        DELTA_SYNC=os.environ.get("DELTA_SYNC", "0") == "1",
+        DELTA_BLOCK_BYTES=int(os.environ.get("DELTA_BLOCK_BYTES", str(1024 * 1024))),
+        # Pooled SSH transports: idle eviction and per-host channel cap
+        SSH_POOL_IDLE_SECONDS=int(os.environ.get("SSH_POOL_IDLE_SECONDS", "300")),
+        SSH_POOL_MAX_CHANNELS_PER_HOST=int(os.environ.get("SSH_POOL_MAX_CHANNELS_PER_HOST", "8")),
+        SSH_POOL_KEEPALIVE_TIMEOUT=float(os.environ.get("SSH_POOL_KEEPALIVE_TIMEOUT", "10")),
+        # SSH channel window / max packet size; 0 keeps paramiko's defaults
+        SSH_WINDOW_BYTES=int(os.environ.get("SSH_WINDOW_BYTES", "0")),
+        SSH_MAX_PACKET_BYTES=int(os.environ.get("SSH_MAX_PACKET_BYTES", "0")),
+        # SFTP upload engine: local read block, write request size, unacknowledged requests, resume attempts
+        SFTP_BLOCK_BYTES=int(os.environ.get("SFTP_BLOCK_BYTES", str(1024 * 1024))),
+        SFTP_REQUEST_BYTES=int(os.environ.get("SFTP_REQUEST_BYTES", str(32 * 1024))),
+        SFTP_MAX_OUTSTANDING=int(os.environ.get("SFTP_MAX_OUTSTANDING", "64")),
+        SFTP_RETRIES=int(os.environ.get("SFTP_RETRIES", "2")),
         SSH_USERNAME=os.environ.get("SSH_USERNAME", "user"),
         SSH_PASSWORD=os.environ.get("SSH_PASSWORD", "palmedia1"),
+        # Key auth (tried before the password): a private key file and/or keys from the ssh-agent
+        SSH_PRIVATE_KEY_FILE=os.environ.get("SSH_PRIVATE_KEY_FILE", ""),
+        SSH_PRIVATE_KEY_PASSPHRASE=os.environ.get("SSH_PRIVATE_KEY_PASSPHRASE", ""),
+        SSH_USE_AGENT=os.environ.get("SSH_USE_AGENT", "0") == "1",
+        # Host key checking: "accept-new" (trust and record first-seen hosts), "strict" or "off"
+        SSH_HOST_KEY_POLICY=os.environ.get("SSH_HOST_KEY_POLICY", "accept-new").lower(),
+        SSH_KNOWN_HOSTS_FILE=os.environ.get("SSH_KNOWN_HOSTS_FILE", ""),
         # 2GB upload limit; adjust via env if needed
         MAX_CONTENT_LENGTH=int(os.environ.get("MAX_CONTENT_LENGTH", str(2 * 1024 * 1024 * 1024))),
     )
@@ -22,9 +95,137 @@ def create_app():
     except Exception:
         pass
 
+    # Credentials shared by both engines: client key parsed once, known_hosts loaded once
+    from .credentials import HostKeyStore, load_private_key_file
+
+    key_file = app.config["SSH_PRIVATE_KEY_FILE"]
+    passphrase = app.config["SSH_PRIVATE_KEY_PASSPHRASE"] or None
+    client_keys = [load_private_key_file(key_file, passphrase)] if key_file else []
+    host_keys = HostKeyStore(
+        app.config["SSH_KNOWN_HOSTS_FILE"] or os.path.join(app.instance_path, "known_hosts"),
+        app.config["SSH_HOST_KEY_POLICY"],
+    )
+    app.extensions["host_keys"] = host_keys
+
+    # Shared SSH connection pool used by command runs and file operations
+    from .ssh_pool import SSHConnectionPool
+
+    app.extensions["ssh_pool"] = SSHConnectionPool(
+        idle_timeout=app.config["SSH_POOL_IDLE_SECONDS"],
+        max_channels_per_host=app.config["SSH_POOL_MAX_CHANNELS_PER_HOST"],
+        keepalive_timeout=app.config["SSH_POOL_KEEPALIVE_TIMEOUT"],
+        window_size=app.config["SSH_WINDOW_BYTES"],
+        max_packet_size=app.config["SSH_MAX_PACKET_BYTES"],
+        client_keys=client_keys,
+        use_agent=app.config["SSH_USE_AGENT"],
+        host_keys=host_keys,
+    )
+
+    # SFTP upload engine shared by the file operations
+    from .sftp_transfer import SFTPUploader
+
+    app.extensions["sftp_uploader"] = SFTPUploader(
+        block_bytes=app.config["SFTP_BLOCK_BYTES"],
+        request_bytes=app.config["SFTP_REQUEST_BYTES"],
+        max_outstanding=app.config["SFTP_MAX_OUTSTANDING"],
+        retries=app.config["SFTP_RETRIES"],
+    )
+
+    # Pre-flight reachability probe, with its answers cached across runs
+    from .probe import TCPProber
+
+    app.extensions["prober"] = TCPProber(
+        timeout=app.config["PROBE_TIMEOUT_SECONDS"],
+        ttl=app.config["PROBE_CACHE_SECONDS"],
+    )
+
+    # One bounded scheduler for every fan-out (commands and file operations)
+    from .adaptive import OPERATION_KINDS, AdaptiveLimiter
+    from .scheduler import FleetScheduler
+
+    limiters = None
+    if app.config["ADAPTIVE_CONCURRENCY"]:
+        limiters = {
+            kind: AdaptiveLimiter(
+                kind,
+                initial=app.config["ADAPTIVE_INITIAL"],
+                minimum=app.config["ADAPTIVE_MIN"],
+                maximum=app.config["MAX_PARALLEL"],
+                latency_tolerance=app.config["ADAPTIVE_LATENCY_TOLERANCE"],
+            )
+            for kind in OPERATION_KINDS
+        }
+    app.extensions["scheduler"] = FleetScheduler(
+        max_workers=app.config["MAX_PARALLEL"],
+        per_host_limit=app.config["SCHEDULER_PER_HOST_LIMIT"],
+        per_job_limit=app.config["SCHEDULER_PER_JOB_LIMIT"],
+        limiters=limiters,
+    )
+
+    if app.config["EXECUTION_ENGINE"] == "asyncio":
+        from .async_executor import AsyncExecutionEngine
+
+        app.extensions["async_engine"] = AsyncExecutionEngine(
+            max_concurrency=app.config["ASYNC_MAX_CONCURRENCY"],
+            max_channels_per_host=app.config["SSH_POOL_MAX_CHANNELS_PER_HOST"],
+            idle_timeout=app.config["SSH_POOL_IDLE_SECONDS"],
+            client_keys=[key_file] if key_file else (),
+            passphrase=passphrase,
+            agent_path=os.environ.get("SSH_AUTH_SOCK") if app.config["SSH_USE_AGENT"] else None,
+            host_keys=host_keys,
+        )
+
     # Register routes
-    from .routes import bp as routes_bp
+    from . import routes
+
+    app.register_blueprint(routes.bp)
+
+    if app.config["JOB_STORE"] == "sqlite":
+        from .job_store import SQLiteJobManager
+
+        routes.job_manager = SQLiteJobManager(
+            app.config["JOB_STORE_PATH"] or os.path.join(app.instance_path, "jobs.sqlite3"),
+            lease_seconds=app.config["JOB_LEASE_SECONDS"],
+        )
+    elif app.config["JOB_DISPATCH"] == "worker":
+        raise RuntimeError("JOB_DISPATCH=worker requires JOB_STORE=sqlite")
+    job_manager = routes.job_manager
+
+    # Expire finished jobs and drop their spilled logs along with them
+    log_dir = app.config["OUTPUT_SPILL_DIR"] or os.path.join(app.instance_path, "job-logs")
+
+    def remove_job_logs(job_id):
+        shutil.rmtree(os.path.join(log_dir, job_id), ignore_errors=True)
+
+    job_manager.configure(
+        ttl_seconds=app.config["JOB_CLEANUP_SECONDS"],
+        max_bytes=app.config["JOB_MAX_BYTES"],
+        on_evict=remove_job_logs,
+    )
+
+    # Scrape-time gauges for /metrics (phase histograms and SSH counters record themselves)
+    from .metrics import REGISTRY
 
-    app.register_blueprint(routes_bp)
+    pool = app.extensions["ssh_pool"]
+    scheduler = app.extensions["scheduler"]
+    REGISTRY.gauge("fleet_jobs_active", "Jobs still running", lambda: job_manager.stats()["running"])
+    REGISTRY.gauge("fleet_jobs_retained", "Jobs held in memory", lambda: job_manager.stats()["jobs"])
+    REGISTRY.gauge("fleet_jobs_retained_bytes", "Bytes of stored job results", lambda: job_manager.stats()["retainedBytes"])
+    REGISTRY.gauge("fleet_scheduler_queue_depth", "Tasks waiting for a scheduler worker",
+                   lambda: scheduler.metrics()["queueDepth"])
+    REGISTRY.gauge("fleet_scheduler_active_workers", "Scheduler workers running a task",
+                   lambda: scheduler.metrics()["activeWorkers"])
+    if limiters:
+        REGISTRY.gauge("fleet_adaptive_limit", "Current adaptive concurrency limit by operation type",
+                       lambda: {(("op", kind),): s["limit"] for kind, s in scheduler.metrics()["limiters"].items()})
+        REGISTRY.gauge("fleet_adaptive_inflight", "Operations running under each adaptive limit",
+                       lambda: {(("op", kind),): s["inflight"] for kind, s in scheduler.metrics()["limiters"].items()})
+    REGISTRY.gauge("fleet_ssh_pool_connections", "Pooled SSH transports", lambda: pool.stats()["connections"])
+    REGISTRY.gauge("fleet_ssh_pool_channels_in_use", "Channels open on pooled transports",
+                   lambda: pool.stats()["channelsInUse"])
+    REGISTRY.gauge("fleet_known_hosts", "Hosts with a recorded SSH host key", lambda: host_keys.stats()["knownHosts"])
+    engine = app.extensions.get("async_engine")
+    if engine is not None:
+        REGISTRY.gauge("fleet_async_active", "Hosts in flight on the asyncio engine", lambda: engine.stats()["active"])
 
     return app
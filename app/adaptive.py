@@ -0,0 +1,160 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+import paramiko
+
+from . import metrics
+from .credentials import HostKeyError
+
+DECISIONS = metrics.REGISTRY.counter(
+    "fleet_adaptive_decisions_total", "Adaptive concurrency limit changes by operation type and decision"
+)
+
+
+class Feedback:
+    """What one scheduled operation saw of the SSH layer, reported as it ran."""
+
+    __slots__ = ("epoch", "connects", "failed", "overload")
+
+    def __init__(self, epoch: int):
+        self.epoch = epoch
+        # Seconds for each new connection (TCP connect, key exchange and auth)
+        self.connects: List[float] = []
+        self.failed = False
+        self.overload = False
+
+
+_current: ContextVar[Optional[Feedback]] = ContextVar("adaptive_feedback", default=None)
+
+
+@contextmanager
+def observe(feedback: Feedback) -> Iterator[Feedback]:
+    """Route SSH-layer reports made in this thread/task to feedback."""
+    token = _current.set(feedback)
+    try:
+        yield feedback
+    finally:
+        _current.reset(token)
+
+
+def report_connect(seconds: float):
+    feedback = _current.get()
+    if feedback is not None:
+        feedback.connects.append(seconds)
+
+
+def report_failure(error: BaseException, handshake: bool = False):
+    """Note a failed SSH operation. Only handshake failures after the TCP
+    connect succeeded (banner, reset, timeout: what sshd MaxStartups and a
+    saturated link produce) count as overload; a host that does not answer
+    TCP at all is down, not overloaded; neither is one that rejects our
+    credentials or presents an unexpected host key.
+    """
+    feedback = _current.get()
+    if feedback is None:
+        return
+    feedback.failed = True
+    if handshake and not isinstance(error, (paramiko.AuthenticationException, HostKeyError)):
+        feedback.overload = True
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit for one type of operation (commands, transfers, ...).
+
+    Starts at `initial` and grows by one per successful operation (slow
+    start) until the first back-off, then by about one per limit's worth of
+    successes, like TCP congestion avoidance. It only grows while the limit
+    is actually reached and new connections are not getting slower than
+    `latency_tolerance` times the fastest recently seen. A handshake
+    overload halves it (`backoff`), at most once per window: failures of
+    operations started before the last cut do not cut again.
+
+    Not thread-safe on its own; the scheduler calls it under its lock.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        minimum: int = 1,
+        maximum: int = 1000,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.inflight = 0
+        self._epoch = 0
+        self._slow_start = True
+        self._baseline: Optional[float] = None
+        self._decisions: Dict[str, int] = {"increase": 0, "decrease": 0, "hold": 0}
+
+    def available(self) -> bool:
+        return self.inflight < int(self.limit)
+
+    def acquire(self) -> Feedback:
+        self.inflight += 1
+        return Feedback(self._epoch)
+
+    def release(self, feedback: Feedback):
+        """Account for a finished operation and adjust the limit from what it saw."""
+        at_limit = self.inflight >= int(self.limit)
+        self.inflight -= 1
+        if feedback.overload:
+            if feedback.epoch == self._epoch:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._epoch += 1
+                self._slow_start = False
+                self._decide("decrease")
+            return
+        slow = any(self._congested(seconds) for seconds in feedback.connects)
+        if feedback.failed or not at_limit:
+            return
+        if slow:
+            self._decide("hold")
+            return
+        step = 1.0 if self._slow_start else 1.0 / self.limit
+        if self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + step)
+            self._decide("increase")
+
+    def stats(self) -> Dict:
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "slowStart": self._slow_start,
+            "connectBaselineSeconds": round(self._baseline, 4) if self._baseline is not None else None,
+            "decisions": dict(self._decisions),
+        }
+
+    def _congested(self, seconds: float) -> bool:
+        """Whether a connect took much longer than the recent best; updates the baseline."""
+        if self._baseline is None:
+            self._baseline = seconds
+            return False
+        # A slowly rising floor, so one lucky fast connect does not set the bar forever
+        self._baseline = min(seconds, self._baseline * 1.01)
+        # Below a few ms the ratio is noise
+        return seconds > 0.05 and seconds > self._baseline * self.latency_tolerance
+
+    def _decide(self, decision: str):
+        self._decisions[decision] += 1
+        DECISIONS.inc(op=self.name, decision=decision)
+
+
+def operation_kind(job_key: str) -> str:
+    """Limiter an operation belongs to, from its scheduler job key prefix."""
+    prefix = job_key.split("-", 1)[0]
+    if prefix in ("file", "bundle"):
+        return "transfer"
+    if prefix == "gather":
+        return "gather"
+    return "command"
+
+
+OPERATION_KINDS = ("command", "transfer", "gather")
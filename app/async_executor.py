@@ -0,0 +1,303 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import paramiko
+
+try:
+    import asyncssh
+except ImportError:  # optional dependency, only needed for EXECUTION_ENGINE=asyncio
+    asyncssh = None
+
+from . import metrics
+from .credentials import HostKeyError, HostKeyStore, credential_fingerprint
+from .output_buffer import OutputBuffer
+from .ssh_executor import READ_CHUNK_BYTES, output_result, wrap_login_shell
+
+
+class AsyncExecutionEngine:
+    """Event-loop fan-out engine for very large host lists.
+
+    All SSH sessions are multiplexed on one asyncio loop running in a
+    background thread, so a waiting host costs a coroutine rather than an OS
+    thread. `submit` is thread-safe and returns a concurrent Future resolving
+    to the same result dict as `execute_command_on_host`, so routes can treat
+    both engines alike. Connections are cached per (host, port, user and
+    password fingerprint) and closed after `idle_timeout` seconds without use.
+
+    Authentication matches the thread engine: the private key files in
+    `client_keys` (loaded once) and the agent at `agent_path`, then the
+    password; host keys are checked against `host_keys` before auth.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 2000,
+        max_channels_per_host: int = 8,
+        idle_timeout: float = 300,
+        client_keys: Sequence[str] = (),
+        passphrase: Optional[str] = None,
+        agent_path: Optional[str] = None,
+        host_keys: Optional[HostKeyStore] = None,
+    ):
+        if asyncssh is None:
+            raise RuntimeError("EXECUTION_ENGINE=asyncio requires the 'asyncssh' package")
+        keys = asyncssh.load_keypairs(list(client_keys), passphrase) if client_keys else []
+        # None turns public key auth off; () lets asyncssh ask the agent
+        self._auth = {"client_keys": keys or (() if agent_path else None), "agent_path": agent_path}
+        if host_keys is not None and host_keys.policy != "off":
+            # An empty trusted list sends every host key to _HostKeyClient
+            self._auth.update(known_hosts=([], [], []), client_factory=partial(_HostKeyClient, host_keys))
+        else:
+            self._auth["known_hosts"] = None
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_channels_per_host = max(1, max_channels_per_host)
+        self.idle_timeout = idle_timeout
+        self._host_sems: Dict[Tuple[str, int, str, str], asyncio.Semaphore] = {}
+        # Coroutines holding or waiting for each key's semaphore; it is dropped once none are left
+        self._host_users: Dict[Tuple[str, int, str, str], int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._conns: Dict[Tuple[str, int, str, str], list] = {}
+        self._connecting: Dict[Tuple[str, int, str, str], asyncio.Future] = {}
+        self._active = 0
+        self._start_lock = threading.Lock()
+
+    def submit(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: Optional[str],
+        command: str,
+        timeout: int,
+        on_start: Optional[Callable[[], None]] = None,
+        stdout_buffer: Optional[OutputBuffer] = None,
+        stderr_buffer: Optional[OutputBuffer] = None,
+    ) -> Future:
+        loop = self._ensure_loop()
+        out_buf = stdout_buffer if stdout_buffer is not None else OutputBuffer()
+        err_buf = stderr_buffer if stderr_buffer is not None else OutputBuffer()
+        coro = self._run(host, int(port), username, password, command, timeout, on_start, out_buf, err_buf)
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def stats(self):
+        return {"active": self._active, "connections": len(self._conns)}
+
+    def close(self):
+        loop = self._loop
+        if loop is None:
+            return
+        fut = asyncio.run_coroutine_threadsafe(self._close_all(), loop)
+        try:
+            fut.result(timeout=5)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+
+    # -- internals --------------------------------------------------------
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def _main():
+                    asyncio.set_event_loop(loop)
+                    self._sem = asyncio.Semaphore(self.max_concurrency)
+                    self._reaper = loop.create_task(self._reap_loop())
+                    ready.set()
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=_main, name="async-ssh-engine", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+        return self._loop
+
+    async def _run(self, host, port, username, password, command, timeout, on_start, out_buf, err_buf):
+        # A cached connection only serves callers with the password it was opened with
+        key = (host, port, username, credential_fingerprint(password, None))
+        host_sem = self._host_sems.get(key)
+        if host_sem is None:
+            host_sem = self._host_sems[key] = asyncio.Semaphore(self.max_channels_per_host)
+        self._host_users[key] = self._host_users.get(key, 0) + 1
+        try:
+            return await self._run_on(key, host_sem, password, command, timeout, on_start, out_buf, err_buf)
+        finally:
+            left = self._host_users[key] - 1
+            if left:
+                self._host_users[key] = left
+            else:
+                del self._host_users[key]
+                self._prune(key)
+
+    async def _run_on(self, key, host_sem, password, command, timeout, on_start, out_buf, err_buf):
+        # Each coroutine runs in its own context, so phases collect per host
+        submitted = time.perf_counter()
+        with metrics.collect() as timings:
+            waiting = submitted
+            async with self._sem, host_sem:
+                metrics.add_phase("queue", time.perf_counter() - waiting)
+                self._active += 1
+                loop = asyncio.get_running_loop()
+                try:
+                    # Callbacks and spill files may block (job store lock, SQLite, disk);
+                    # keep them off the loop that every other host is running on
+                    if on_start is not None:
+                        await loop.run_in_executor(None, on_start)
+                    try:
+                        with metrics.phase("connect"):
+                            entry = await self._connection(key, password, timeout)
+                    except (asyncssh.Error, OSError, asyncio.TimeoutError) as e:
+                        metrics.count_failure(e)
+                        raise RuntimeError(f"SSH error: {str(e) or type(e).__name__}")
+                    entry[2] += 1
+                    try:
+                        with metrics.phase("command"):
+                            exit_status = await self._stream(entry[0], command, timeout, out_buf, err_buf)
+                    except (asyncssh.Error, OSError, asyncio.TimeoutError) as e:
+                        metrics.count_failure(e)
+                        raise RuntimeError(f"SSH error: {str(e) or type(e).__name__}")
+                    finally:
+                        entry[2] -= 1
+                        entry[1] = time.monotonic()
+                        await loop.run_in_executor(None, _close_buffers, out_buf, err_buf)
+                        if entry[0].is_closed():
+                            self._drop(key, entry)
+                    timings["total"] = round(time.perf_counter() - submitted, 4)
+                    return dict(output_result(exit_status, out_buf, err_buf), timings=dict(timings))
+                finally:
+                    self._active -= 1
+
+    @staticmethod
+    async def _stream(conn, command, timeout, out_buf: OutputBuffer, err_buf: OutputBuffer) -> int:
+        """Run command, draining stdout and stderr into bounded buffers as it goes.
+
+        `timeout` bounds inactivity of both streams together, like the thread
+        engine's `drain_channel`: a command quiet on stderr while it writes
+        to stdout (or the other way round) is not timed out.
+        """
+        loop = asyncio.get_running_loop()
+        async with conn.create_process(wrap_login_shell(command), encoding=None) as proc:
+            last_output = time.monotonic()
+
+            async def pump(reader, buf):
+                nonlocal last_output
+                while True:
+                    chunk = await reader.read(READ_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    last_output = time.monotonic()
+                    if buf.spill_path:
+                        await loop.run_in_executor(None, buf.write, chunk)
+                    else:
+                        buf.write(chunk)
+
+            pumps = asyncio.gather(pump(proc.stdout, out_buf), pump(proc.stderr, err_buf))
+            try:
+                while not pumps.done():
+                    idle = time.monotonic() - last_output
+                    if idle >= timeout:
+                        raise asyncio.TimeoutError(f"No output for {timeout}s")
+                    await asyncio.wait([pumps], timeout=timeout - idle)
+            finally:
+                if not pumps.done():
+                    pumps.cancel()
+                    await asyncio.gather(pumps, return_exceptions=True)
+            await pumps
+            await asyncio.wait_for(proc.wait(), timeout)
+            return proc.exit_status if proc.exit_status is not None else -1
+
+    async def _connection(self, key, password, timeout):
+        """Return the cached [conn, last_used, in_use] entry for key, connecting if needed."""
+        entry = self._conns.get(key)
+        if entry is not None and not entry[0].is_closed():
+            entry[1] = time.monotonic()
+            return entry
+        # Coalesce concurrent connects to the same host into one handshake
+        pending = self._connecting.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        pending = asyncio.get_running_loop().create_future()
+        self._connecting[key] = pending
+        host, port, username, _ = key
+        try:
+            conn = await asyncio.wait_for(
+                asyncssh.connect(
+                    host,
+                    port=port,
+                    username=username,
+                    password=password,
+                    **self._auth,
+                ),
+                timeout=timeout,
+            )
+            entry = [conn, time.monotonic(), 0]
+            self._conns[key] = entry
+            pending.set_result(entry)
+            return entry
+        except BaseException as e:
+            pending.set_exception(e)
+            # Mark retrieved so a connect with no other waiters does not warn
+            pending.exception()
+            raise
+        finally:
+            self._connecting.pop(key, None)
+
+    def _drop(self, key, entry):
+        if self._conns.get(key) is entry:
+            del self._conns[key]
+            self._prune(key)
+        entry[0].close()
+
+    def _prune(self, key):
+        """Forget key's channel semaphore once it has no connection and no coroutine."""
+        if key not in self._conns and key not in self._host_users:
+            self._host_sems.pop(key, None)
+
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 2))
+            now = time.monotonic()
+            for key, entry in list(self._conns.items()):
+                conn, last_used, in_use = entry
+                if conn.is_closed() or (in_use == 0 and now - last_used > self.idle_timeout):
+                    self._drop(key, entry)
+
+    async def _close_all(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for entry in list(self._conns.values()):
+            entry[0].close()
+        self._conns.clear()
+
+
+def _close_buffers(*buffers: OutputBuffer):
+    for buf in buffers:
+        buf.close()
+
+
+if asyncssh is not None:
+
+    class _HostKeyClient(asyncssh.SSHClient):
+        """Checks server host keys against a HostKeyStore, like the thread engine's pool."""
+
+        def __init__(self, store: HostKeyStore):
+            self.store = store
+
+        def validate_host_public_key(self, host, addr, port, key) -> bool:
+            pkey = paramiko.PKey.from_type_string(key.get_algorithm(), key.public_data)
+            try:
+                self.store.check(host, port, pkey)
+            except HostKeyError:
+                return False
+            return True
@@ -0,0 +1,207 @@
+import gzip
+import os
+import posixpath
+import shlex
+import tarfile
+import time
+import uuid
+from concurrent.futures import wait
+from functools import partial
+from typing import Iterator, List, Optional, Tuple
+
+from . import metrics
+from .file_ops import FILE_MODE, FleetTransfer
+from .scheduler import FleetScheduler
+from .sftp_transfer import transfer_stats
+from .ssh_executor import execute_command_on_host
+from .ssh_pool import SSHConnectionPool
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, only needed for zstd bundles
+    zstandard = None
+
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+# Mode applied to directories created by a bundle (files get FILE_MODE)
+DIR_MODE = "775"
+
+# Suffix of the local bundle file per compression
+_SUFFIXES = {"gzip": ".tar.gz", "zstd": ".tar.zst", "none": ".tar"}
+
+# Matching `tar -x` flag on the target
+_TAR_FLAGS = {"gzip": "-z", "zstd": "--zstd", "none": ""}
+
+_READ_BYTES = 1024 * 1024
+
+
+def member_path(name: str) -> Optional[str]:
+    """Normalized relative path for an uploaded file name, None if it would escape the destination.
+
+    Browsers send directory uploads as `dir/sub/file`; Windows clients may use backslashes.
+    """
+    path = posixpath.normpath(name.replace("\\", "/")).lstrip("/")
+    if path in ("", ".") or path == ".." or path.startswith("../"):
+        return None
+    return path
+
+
+def bundle_suffix(compression: str) -> str:
+    return _SUFFIXES[compression]
+
+
+def write_bundle(path: str, members: List[Tuple[str, str]], compression: str, owner: str, group: str) -> int:
+    """Write (archive name, local file) pairs as a tar at path; returns its size.
+
+    Every entry carries owner/group by name and the placement modes, so a
+    plain `tar -x --same-owner -p` on the target applies them. Parent
+    directories get their own entries.
+    """
+    if compression == "zstd" and zstandard is None:
+        raise RuntimeError("zstd bundles require the 'zstandard' package")
+    with open(path, "wb") as raw:
+        if compression == "gzip":
+            out = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0)
+        elif compression == "zstd":
+            out = zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        else:
+            out = raw
+        now = int(time.time())
+
+        def info(name, kind, mode, size=0):
+            ti = tarfile.TarInfo(name)
+            ti.type = kind
+            ti.mode = int(mode, 8)
+            ti.size = size
+            ti.mtime = now
+            ti.uname, ti.gname = owner, group
+            return ti
+
+        with tarfile.open(fileobj=out, mode="w|", format=tarfile.GNU_FORMAT) as tar:
+            dirs = set()
+            for name, local in members:
+                parent = posixpath.dirname(name)
+                missing = []
+                while parent and parent not in dirs:
+                    missing.append(parent)
+                    dirs.add(parent)
+                    parent = posixpath.dirname(parent)
+                for d in reversed(missing):
+                    tar.addfile(info(d, tarfile.DIRTYPE, DIR_MODE))
+                with open(local, "rb") as f:
+                    tar.addfile(info(name, tarfile.REGTYPE, FILE_MODE, os.fstat(f.fileno()).st_size), f)
+        if out is not raw:
+            out.close()
+    return os.path.getsize(path)
+
+
+def extract_command(dest_dir: str, owner: str, group: str, compression: str) -> str:
+    """Shell that reads the sudo password as the first stdin line, then
+    extracts the tar stream on the rest of stdin into dest_dir with one sudo.
+
+    The password is only fed to sudo when it actually prompts (no NOPASSWD
+    and no cached credentials), so it can never end up in the tar stream.
+    """
+    extract = (
+        f'mkdir -p -- "$0" && exec tar -x {_TAR_FLAGS[compression]} -f - '
+        f'--same-owner --same-permissions --no-overwrite-dir -C "$0"'
+    )
+    sudo_args = f"sh -c {shlex.quote(extract)} {shlex.quote(dest_dir)}"
+    return (
+        f"IFS= read -r PW || exit 203; "
+        f'OWNER="{owner}"; GROUP="{group}"; '
+        f'id -u "$OWNER" >/dev/null 2>&1 || {{ echo "Owner not found: $OWNER"; exit 200; }}; '
+        f'getent group "$GROUP" >/dev/null 2>&1 || {{ echo "Group not found: $GROUP"; exit 201; }}; '
+        f"if sudo -n true 2>/dev/null; then sudo -n {sudo_args}; "
+        f"else {{ printf '%s\\n' \"$PW\"; cat; }} | sudo -S -k -p '' {sudo_args}; fi"
+    )
+
+
+class BundleDistribution(FleetTransfer):
+    """A tar bundle of many files unpacked into `dest_dir` on a set of hosts.
+
+    Each host gets the bundle over a single exec channel: the bundle is
+    written to the command's stdin and unpacked by one `sudo tar -x`, which
+    also applies owner, group and mode. No staging file, no per-file SFTP
+    opens and no separate placement commands.
+    """
+
+    def __init__(
+        self,
+        pool: SSHConnectionPool,
+        scheduler: FleetScheduler,
+        port: int,
+        username: str,
+        password: str,
+        timeout: int,
+        bundle_path: str,
+        dest_dir: str,
+        compression: str,
+        file_count: int,
+        owner: str = "",
+        group: str = "",
+    ):
+        super().__init__()
+        self.pool = pool
+        self.scheduler = scheduler
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.bundle_path = bundle_path
+        self.dest_dir = dest_dir
+        self.compression = compression
+        self.file_count = file_count
+        # Default ownership to the SSH username
+        self.owner = owner or username
+        self.group = group or username
+        self.op_key = f"bundle-{uuid.uuid4()}"
+
+    def distribute(self, ips: List[str]):
+        """Send and unpack the bundle on every host, recording each outcome."""
+        wait([self.scheduler.submit(self.op_key, ip, self._place, ip) for ip in ips])
+
+    def _place(self, ip: str):
+        with self.timed(ip):
+            self._send(ip)
+
+    def _send(self, ip: str):
+        self.started(ip)
+        size = os.path.getsize(self.bundle_path)
+        sent = [0]
+        started = time.monotonic()
+        try:
+            with metrics.phase("transfer"):
+                res = execute_command_on_host(
+                    host=ip,
+                    port=self.port,
+                    username=self.username,
+                    password=self.password,
+                    private_key=None,
+                    command=extract_command(self.dest_dir, self.owner, self.group, self.compression),
+                    timeout=self.timeout,
+                    pool=self.pool,
+                    stdin_blocks=self._stdin(ip, size, sent),
+                )
+        except Exception as e:
+            self.record(ip, {"ok": False, "error": str(e)})
+            return
+        if not res.get("ok"):
+            error = (res.get("stderr") or res.get("stdout") or "").strip() or f"tar exited with {res.get('exit_code')}"
+            self.record(ip, {"ok": False, "error": error, "exit_code": res.get("exit_code")})
+            return
+        self.record(ip, dict(
+            {"ok": True, "dest": self.dest_dir, "files": self.file_count},
+            **transfer_stats(sent[0], time.monotonic() - started),
+        ))
+
+    def _stdin(self, ip: str, size: int, sent: List[int]) -> Iterator[bytes]:
+        """The password line, then the bundle, reporting progress as it goes."""
+        yield f"{self.password}\n".encode()
+        self.progress(ip, 0, size)
+        with open(self.bundle_path, "rb") as f:
+            for block in iter(partial(f.read, _READ_BYTES), b""):
+                yield block
+                metrics.TRANSFER_BYTES.inc(len(block), direction="upload")
+                sent[0] += len(block)
+                self.progress(ip, sent[0], size)
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import shlex
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+# Read size when hashing local files
+_HASH_READ_BYTES = 1024 * 1024
+# Digests are cached per (path, size, mtime, block size); a handful of recent files is enough
+_CACHE_ENTRIES = 64
+
+_cache: "OrderedDict[Tuple, object]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(path: str, block_bytes: int, compute):
+    st = os.stat(path)
+    key = (os.path.realpath(path), st.st_size, st.st_mtime_ns, block_bytes)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    value = compute()
+    with _cache_lock:
+        _cache[key] = value
+        while len(_cache) > _CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return value
+
+
+def file_digest(path: str) -> str:
+    """sha256 hex digest of a local file, cached until the file changes."""
+
+    def compute():
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_READ_BYTES), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    return _cached(path, 0, compute)
+
+
+def block_digests(path: str, block_bytes: int) -> List[str]:
+    """sha256 hex digest of each fixed-size block of a local file, cached like file_digest."""
+
+    def compute():
+        with open(path, "rb") as f:
+            return [hashlib.sha256(b).hexdigest() for b in iter(lambda: f.read(block_bytes), b"")]
+
+    return _cached(path, block_bytes, compute)
+
+
+def remote_probe_command(path: str) -> str:
+    """Shell printing `<sha256> <owner>:<group>:<mode>` for path, or nothing if it is not a file."""
+    p = shlex.quote(path)
+    return (
+        f'[ -f {p} ] && echo "$(sha256sum -- {p} | cut -d" " -f1) $(stat -c %U:%G:%a -- {p})"; true'
+    )
+
+
+def parse_probe(stdout: str) -> Optional[Tuple[str, str]]:
+    """(digest, owner:group:mode) from remote_probe_command output, None if absent or unreadable."""
+    parts = (stdout or "").strip().split()
+    if len(parts) != 2 or len(parts[0]) != 64:
+        return None
+    return parts[0], parts[1]
+
+
+def remote_blocks_command(path: str, block_bytes: int) -> str:
+    """Shell printing the sha256 of each `block_bytes` block of path, one per line.
+
+    Uses python3 when the host has it, otherwise one dd per block.
+    """
+    p = shlex.quote(path)
+    b = int(block_bytes)
+    py = (
+        "import hashlib,sys;f=open(sys.argv[1],'rb');"
+        "[print(hashlib.sha256(c).hexdigest()) for c in iter(lambda:f.read(int(sys.argv[2])),b'')]"
+    )
+    return (
+        f"if command -v python3 >/dev/null 2>&1; then python3 -c {shlex.quote(py)} {p} {b}; "
+        f"else n=$(( ($(stat -c %s -- {p}) + {b} - 1) / {b} )); i=0; "
+        f"while [ $i -lt $n ]; do dd if={p} bs={b} skip=$i count=1 2>/dev/null | sha256sum | cut -d' ' -f1; "
+        f"i=$((i+1)); done; fi"
+    )
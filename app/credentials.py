@@ -0,0 +1,228 @@
+import base64
+import hashlib
+import io
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import paramiko
+from paramiko.hostkeys import HostKeyEntry
+
+# Parsed keys kept in memory; a handful of distinct keys is the norm
+_CACHE_ENTRIES = 64
+
+_cache: "OrderedDict[str, paramiko.PKey]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+_PEM_HEADER = re.compile(r"-----BEGIN ([A-Z0-9 ]+) PRIVATE KEY-----")
+
+# Key classes by PEM label and by OpenSSH key type name (DSA is gone from newer paramiko)
+_PEM_TYPES = {"RSA": paramiko.RSAKey, "EC": paramiko.ECDSAKey, "DSA": getattr(paramiko, "DSSKey", None)}
+_OPENSSH_TYPES = {"ssh-rsa": paramiko.RSAKey, "ssh-ed25519": paramiko.Ed25519Key, "ssh-dss": getattr(paramiko, "DSSKey", None)}
+
+HOST_KEY_POLICIES = ("off", "accept-new", "strict")
+
+
+class HostKeyError(paramiko.SSHException):
+    """A host presented a key that does not match, or is unknown under the strict policy."""
+
+
+def key_fingerprint(text: str, passphrase: Optional[str] = None) -> str:
+    """SHA-256 of a private key's text (and passphrase), the key's cache identity."""
+    h = hashlib.sha256(text.strip().encode())
+    if passphrase:
+        h.update(b"\0" + passphrase.encode())
+    return h.hexdigest()
+
+
+def credential_fingerprint(password: Optional[str], pkey: Optional[paramiko.PKey]) -> str:
+    """Digest of the credentials a connection was authenticated with, so a
+    pooled connection is only reused by callers presenting the same ones."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(b"p\0" + (password or "").encode())
+    if pkey is not None:
+        h.update(b"\0k\0" + pkey.asbytes())
+    return h.hexdigest()
+
+
+def key_class(text: str):
+    """The paramiko key class for a private key, read from its PEM label or,
+    for OpenSSH-format keys, from the key type in its public part.
+    Raises ValueError for formats paramiko cannot load.
+    """
+    match = _PEM_HEADER.search(text)
+    if match is None:
+        raise ValueError("Not a PEM or OpenSSH private key")
+    label = match.group(1)
+    if label == "OPENSSH":
+        name = _openssh_key_type(text)
+        cls = paramiko.ECDSAKey if name.startswith("ecdsa-sha2-") else _OPENSSH_TYPES.get(name)
+    else:
+        cls = _PEM_TYPES.get(label)
+    if cls is None:
+        raise ValueError(f"Unsupported private key type: {label if label != 'OPENSSH' else name}")
+    return cls
+
+
+def _openssh_key_type(text: str) -> str:
+    body = "".join(line.strip() for line in text.strip().splitlines() if not line.startswith("-----"))
+    blob = base64.b64decode(body)
+    magic = b"openssh-key-v1\0"
+    if not blob.startswith(magic):
+        raise ValueError("Malformed OpenSSH private key")
+    pos = len(magic)
+
+    def string() -> bytes:
+        nonlocal pos
+        (n,) = struct.unpack(">I", blob[pos:pos + 4])
+        pos += 4 + n
+        return blob[pos - n:pos]
+
+    string(), string(), string()  # cipher, kdf name, kdf options
+    pos += 4  # number of keys
+    public = string()
+    (n,) = struct.unpack(">I", public[:4])
+    return public[4:4 + n].decode("ascii", "replace")
+
+
+def load_private_key(text: str, passphrase: Optional[str] = None) -> paramiko.PKey:
+    """Parse a private key once; later calls with the same text get the cached key.
+
+    The key type is detected up front, so each key costs one parse instead
+    of a round of failed attempts. Raises ValueError if it cannot be loaded.
+    """
+    fingerprint = key_fingerprint(text, passphrase)
+    with _cache_lock:
+        if fingerprint in _cache:
+            _cache.move_to_end(fingerprint)
+            return _cache[fingerprint]
+    cls = key_class(text)
+    try:
+        pkey = cls.from_private_key(io.StringIO(text.strip() + "\n"), password=passphrase or None)
+    except paramiko.PasswordRequiredException:
+        raise ValueError("Private key is encrypted; a passphrase is required")
+    except paramiko.SSHException as e:
+        raise ValueError(f"Cannot load private key: {e}")
+    with _cache_lock:
+        _cache[fingerprint] = pkey
+        while len(_cache) > _CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return pkey
+
+
+def load_private_key_file(path: str, passphrase: Optional[str] = None) -> paramiko.PKey:
+    with open(os.path.expanduser(path)) as f:
+        return load_private_key(f.read(), passphrase)
+
+
+class HostKeyStore:
+    """known_hosts file loaded once into memory and checked per connection.
+
+    Plain host names are looked up in a dict; hashed entries (`|1|...`)
+    are matched by hashing the name, once per name. With the `accept-new`
+    policy a host seen for the first time has its key trusted and appended
+    to the file; `strict` refuses unknown hosts; `off` checks nothing. A
+    key that differs from the stored one is always refused (except `off`).
+    """
+
+    def __init__(self, path: str, policy: str = "accept-new"):
+        if policy not in HOST_KEY_POLICIES:
+            raise ValueError(f"Unknown host key policy: {policy}")
+        self.path = path
+        self.policy = policy
+        self._known: Dict[str, Dict[str, paramiko.PKey]] = {}
+        self._hashed: List[HostKeyEntry] = []
+        self._lock = threading.Lock()
+        if policy != "off":
+            self._load()
+
+    def check(self, host: str, port: int, key: paramiko.PKey):
+        """Raise HostKeyError unless key is acceptable for host:port."""
+        if self.policy == "off":
+            return
+        self.check_name(host if int(port) == 22 else f"[{host}]:{port}", key)
+
+    def check_name(self, name: str, key: paramiko.PKey):
+        with self._lock:
+            known = self._lookup(name)
+            expected = known.get(key.get_name()) if known else None
+            if expected is None:
+                if self.policy == "strict":
+                    raise HostKeyError(f"Unknown host key for {name} ({key.get_name()})")
+                self._known.setdefault(name, {})[key.get_name()] = key
+                self._append(name, key)
+                return
+        if expected.asbytes() != key.asbytes():
+            raise HostKeyError(
+                f"Host key for {name} changed: expected {expected.fingerprint}, got {key.fingerprint}"
+            )
+
+    def missing_host_key_policy(self) -> paramiko.MissingHostKeyPolicy:
+        """Policy making a plain SSHClient consult this store."""
+        return _StorePolicy(self)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            known = sum(1 for keys in self._known.values() if keys)
+            return {"policy": self.policy, "knownHosts": known + len(self._hashed)}
+
+    def _lookup(self, name: str) -> Optional[Dict[str, paramiko.PKey]]:
+        known = self._known.get(name)
+        if known is not None or not self._hashed:
+            return known
+        # Hash the name against every hashed entry once; the outcome is remembered either way
+        known = self._known.setdefault(name, {})
+        for entry in self._hashed:
+            for hashed in entry.hostnames:
+                salt = hashed.split("|")[2]
+                if paramiko.HostKeys.hash_host(name, salt) == hashed:
+                    known[entry.key.get_name()] = entry.key
+        return known
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                entry = HostKeyEntry.from_line(line)
+            except Exception:
+                continue
+            if entry is None:
+                continue
+            if any(h.startswith("|1|") for h in entry.hostnames):
+                self._hashed.append(entry)
+                continue
+            for name in entry.hostnames:
+                self._known.setdefault(name, {})[entry.key.get_name()] = entry.key
+
+    def _append(self, name: str, key: paramiko.PKey):
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(f"{name} {key.get_name()} {key.get_base64()}\n")
+
+
+class _StorePolicy(paramiko.MissingHostKeyPolicy):
+    def __init__(self, store: HostKeyStore):
+        self.store = store
+
+    def missing_host_key(self, client, hostname, key):
+        self.store.check_name(hostname, key)
+
+
+def agent_keys() -> Tuple[Optional[paramiko.Agent], Tuple[paramiko.AgentKey, ...]]:
+    """Connect to the ssh-agent at SSH_AUTH_SOCK; (None, ()) when there is none."""
+    if not os.environ.get("SSH_AUTH_SOCK"):
+        return None, ()
+    try:
+        agent = paramiko.Agent()
+        return agent, tuple(agent.get_keys())
+    except Exception:
+        return None, ()
@@ -0,0 +1,199 @@
+import os
+import threading
+from collections import deque
+from typing import Deque, List, Optional
+
+
+class FanoutReader:
+    """One consumer's cursor into a BlockFanout stream."""
+
+    __slots__ = ("_fanout", "pos", "started", "done")
+
+    def __init__(self, fanout: "BlockFanout"):
+        self._fanout = fanout
+        self.pos = 0
+        self.started = False
+        self.done = False
+
+    def start(self) -> bool:
+        """Claim the stream from offset 0; False if its start was already dropped."""
+        return self._fanout._start(self)
+
+    def read(self) -> bytes:
+        """Next block of the stream, b"" at the end. Blocks until data is available."""
+        return self._fanout._read(self)
+
+    def detach(self):
+        """Stop consuming (finished or failed) so the producer no longer waits on us."""
+        self._fanout._detach(self)
+
+
+class BlockFanout:
+    """Broadcast a byte stream, block by block, to several concurrent readers.
+
+    The producer `publish`es blocks while readers (typically one per target
+    host) consume them at their own pace. At most `max_buffer_bytes` are kept
+    in memory. When that is exceeded:
+
+    - readers that have not started yet are dropped (their `start()` returns
+      False) so the caller can serve them from a fresh read of the source;
+    - with `spill_path`, the stream is appended to that file from then on and
+      lagging readers catch up from disk, so the producer never waits;
+    - otherwise the producer waits for the slowest started reader.
+
+    A stream that fits in the buffer is therefore read once for any number of
+    readers. Readers must be created before the first `publish`.
+    """
+
+    def __init__(self, max_buffer_bytes: int = 64 * 1024 * 1024, spill_path: Optional[str] = None):
+        self.max_buffer_bytes = max(1, max_buffer_bytes)
+        self.spill_path = spill_path
+        self._readers: List[FanoutReader] = []
+        self._blocks: Deque[bytes] = deque()
+        self._base = 0  # stream offset of the first in-memory block
+        self._end = 0  # bytes published so far
+        self._mem = 0
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._spill_fd: Optional[int] = None
+        self._spill_base = 0
+        self._cond = threading.Condition()
+
+    def reader(self) -> FanoutReader:
+        r = FanoutReader(self)
+        with self._cond:
+            self._readers.append(r)
+        return r
+
+    @property
+    def spilled(self) -> bool:
+        return self._spill_fd is not None
+
+    @property
+    def published_bytes(self) -> int:
+        return self._end
+
+    def publish(self, data: bytes) -> bool:
+        """Append a block; returns False once no reader is left to consume it."""
+        with self._cond:
+            # Don't race ahead of a fleet whose workers have not picked anything up yet
+            while self._end == 0 and self._live() and not any(r.started for r in self._live()):
+                self._cond.wait()
+            if not self._live():
+                return False
+            if data:
+                if self._spill_fd is not None:
+                    os.write(self._spill_fd, data)
+                self._blocks.append(data)
+                self._end += len(data)
+                self._mem += len(data)
+                self._cond.notify_all()
+            while True:
+                self._trim()
+                if self._mem <= self.max_buffer_bytes or not self._live():
+                    break
+                self._cond.wait()
+            return bool(self._live())
+
+    def close(self):
+        """End of stream: readers get b"" once they have consumed everything."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def abort(self, error: BaseException):
+        """The producer failed: every pending and future read raises."""
+        with self._cond:
+            self._error = error
+            self._closed = True
+            self._cond.notify_all()
+
+    def discard(self):
+        """Release memory and remove the spill file, if any."""
+        with self._cond:
+            self._blocks.clear()
+            self._mem = 0
+            if self._spill_fd is not None:
+                os.close(self._spill_fd)
+                self._spill_fd = None
+                try:
+                    os.remove(self.spill_path)
+                except OSError:
+                    pass
+
+    # -- reader side ------------------------------------------------------
+
+    def _start(self, r: FanoutReader) -> bool:
+        with self._cond:
+            if r.done:
+                return False
+            r.started = True
+            self._cond.notify_all()
+            return True
+
+    def _read(self, r: FanoutReader) -> bytes:
+        with self._cond:
+            while r.pos >= self._end and not self._closed:
+                self._cond.wait()
+            if self._error is not None:
+                raise RuntimeError(f"Source stream failed: {self._error}")
+            if r.pos >= self._end:
+                return b""
+            if r.pos >= self._base:
+                offset = self._base
+                for block in self._blocks:
+                    if r.pos < offset + len(block):
+                        data = block[r.pos - offset:]
+                        break
+                    offset += len(block)
+                r.pos += len(data)
+                self._trim()
+                self._cond.notify_all()
+                return data
+            # Behind the in-memory window: catch up from the spill file
+            fd, start = self._spill_fd, r.pos - self._spill_base
+            size = min(self._base - r.pos, 1024 * 1024)
+        data = os.pread(fd, size, start)
+        with self._cond:
+            r.pos += len(data)
+        return data
+
+    def _detach(self, r: FanoutReader):
+        with self._cond:
+            r.done = True
+            self._trim()
+            self._cond.notify_all()
+
+    # -- internals --------------------------------------------------------
+
+    def _live(self) -> List[FanoutReader]:
+        return [r for r in self._readers if not r.done]
+
+    def _trim(self):
+        """Drop in-memory blocks no reader still needs. Lock held."""
+        if self._mem > self.max_buffer_bytes:
+            if self.spill_path and self._spill_fd is None:
+                self._start_spill()
+            elif self._spill_fd is None:
+                # Out of room: late starters are served by a fresh read instead
+                for r in self._readers:
+                    if not r.started and not r.done and r.pos < self._base + len(self._blocks[0]):
+                        r.done = True
+        live = self._live()
+        floor = min((r.pos for r in live), default=self._end)
+        while self._blocks:
+            size = len(self._blocks[0])
+            spilled_over = self._spill_fd is not None and self._mem > self.max_buffer_bytes
+            if self._base + size > floor and not spilled_over:
+                break
+            self._blocks.popleft()
+            self._base += size
+            self._mem -= size
+
+    def _start_spill(self):
+        """Write the in-memory window to disk and keep appending from now on. Lock held."""
+        fd = os.open(self.spill_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+        for block in self._blocks:
+            os.write(fd, block)
+        self._spill_fd = fd
+        self._spill_base = self._base
@@ -0,0 +1,441 @@
+import os
+import re
+import shlex
+import threading
+import time
+import uuid
+from concurrent.futures import Future, wait
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from . import metrics
+from .checksum import block_digests, file_digest, parse_probe, remote_blocks_command, remote_probe_command
+from .credentials import load_private_key
+from .fanout import BlockFanout, FanoutReader
+from .scheduler import FleetScheduler
+from .sftp_transfer import SFTPUploader, transfer_stats
+from .ssh_executor import execute_command_on_host
+from .ssh_pool import SSHConnectionPool
+
+# Owner/group names accepted for chown; keeps them safe to splice into shell
+SAFE_NAME_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Mode applied to placed files, as `stat -c %a` prints it
+FILE_MODE = "664"
+
+
+@contextmanager
+def sftp_source(pool: SSHConnectionPool, ip: str, port: int, username: str, password: Optional[str], path: str,
+                timeout: int, block_bytes: int, private_key: Optional[str] = None) -> Iterator[Iterable[bytes]]:
+    """Open a remote file and yield an iterator over its contents in `block_bytes` blocks.
+
+    Reads are prefetched, so the source link stays busy. Responses are only
+    pulled off the channel as blocks are consumed, so a slow consumer holds
+    about one SSH channel window of data, not the file.
+    """
+    pkey = load_private_key(private_key) if private_key else None
+    with pool.sftp(ip, port, username, password, pkey, timeout) as sftp:
+        with sftp.open(path, "rb") as f:
+            f.prefetch(f.stat().st_size)
+            yield _counted(iter(partial(f.read, block_bytes), b""))
+
+
+def _counted(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    for block in blocks:
+        metrics.TRANSFER_BYTES.inc(len(block), direction="download")
+        yield block
+
+
+def remote_digest(pool: SSHConnectionPool, ip: str, port: int, username: str, password: Optional[str], path: str,
+                  timeout: int, private_key: Optional[str] = None) -> Optional[str]:
+    """sha256 of a file on a remote host, or None if it cannot be read."""
+    try:
+        res = execute_command_on_host(
+            host=ip,
+            port=port,
+            username=username,
+            password=password,
+            private_key=private_key,
+            command=remote_probe_command(path),
+            timeout=timeout,
+            pool=pool,
+        )
+    except Exception:
+        return None
+    probe = parse_probe(res.get("stdout")) if res.get("ok") else None
+    return probe[0] if probe else None
+
+
+class FleetTransfer:
+    """Per-host outcomes of a transfer to many hosts, safe to record from workers.
+
+    Outcomes accumulate in `results`/`statuses` (use `snapshot()` to read
+    them while workers are running). The optional hooks
+    `on_status(ip, status)`, `on_result(ip, result)` and
+    `on_progress(ip, bytes_done, total_bytes)` report the same events as
+    they happen, e.g. to a background job.
+
+    Work on a host runs inside `timed(ip)`, so the phases it goes through
+    (queue, connect, transfer, place, ...) are added to its result as
+    `timings`, even when they are spread over several tasks.
+    """
+
+    def __init__(self):
+        self.results: Dict[str, Dict] = {}
+        self.statuses: Dict[str, str] = {}
+        self.on_status: Optional[Callable[[str, str], None]] = None
+        self.on_result: Optional[Callable[[str, Dict], None]] = None
+        self.on_progress: Optional[Callable[[str, int, Optional[int]], None]] = None
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> Tuple[Dict, Dict]:
+        """Copies of (results, statuses) so far."""
+        with self._lock:
+            return dict(self.results), dict(self.statuses)
+
+    def timed(self, ip: str) -> ContextManager[Dict[str, float]]:
+        """Collect the phases timed in this block into ip's timings."""
+        with self._lock:
+            timings = self._timings.setdefault(ip, {})
+        return metrics.collect(timings)
+
+    def record(self, ip: str, result: Dict):
+        """Store ip's final result and report it."""
+        status = "completed" if result.get("ok") else "failed"
+        with self._lock:
+            timings = self._timings.pop(ip, None)
+        if timings:
+            result = dict(result, timings=dict(timings))
+        with self._lock:
+            self.results[ip] = result
+            self.statuses[ip] = status
+        if self.on_result is not None:
+            self.on_result(ip, result)
+
+    def started(self, ip: str):
+        """Report that work on ip has begun."""
+        if self.on_status is not None:
+            self.on_status(ip, "running")
+
+    def progress(self, ip: str, done: int, total: Optional[int]):
+        """Report bytes sent to ip so far (total None when unknown)."""
+        if self.on_progress is not None:
+            self.on_progress(ip, done, total)
+
+
+class FileDistribution(FleetTransfer):
+    """One file being placed at `dest_dir/filename` on a set of target hosts.
+
+    Every host gets the file staged under /tmp first (same path on all
+    hosts), then a single sudo step creates the destination directory,
+    moves the file into place and applies owner, group and mode.
+
+    With `digest` (sha256 of the file) set, `skip_unchanged` leaves hosts
+    that already hold identical bytes alone. With `delta_block_bytes` as
+    well, hosts holding an older version only receive the blocks that
+    differ, patched onto a copy of their current file.
+    """
+
+    def __init__(
+        self,
+        pool: SSHConnectionPool,
+        scheduler: FleetScheduler,
+        port: int,
+        username: str,
+        password: str,
+        timeout: int,
+        filename: str,
+        dest_dir: str,
+        owner: str = "",
+        group: str = "",
+        digest: Optional[str] = None,
+        delta_block_bytes: int = 0,
+        uploader: Optional[SFTPUploader] = None,
+    ):
+        super().__init__()
+        self.pool = pool
+        self.scheduler = scheduler
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.filename = filename
+        self.dest_dir = dest_dir
+        # Default ownership to the SSH username
+        self.owner = owner or username
+        self.group = group or username
+        self.dest = f"{dest_dir.rstrip('/')}/{filename}"
+        # Always upload to /tmp first, then move with sudo to destination
+        self.stage_path = f"/tmp/{uuid.uuid4()}-{filename}"
+        self.op_key = f"file-{uuid.uuid4()}"
+        self.digest = digest
+        self.delta_block_bytes = delta_block_bytes
+        self.uploader = uploader or SFTPUploader()
+        # Hosts found holding a different version of dest (delta candidates)
+        self._existing: Set[str] = set()
+
+    def upload(self, ip: str, local_path: str) -> Dict:
+        """Copy the local file to the staging path on ip over SFTP; returns transfer stats."""
+        with metrics.phase("transfer"):
+            if self.delta_block_bytes and ip in self._existing:
+                started = time.monotonic()
+                sent = self._upload_delta(ip, local_path)
+                if sent is not None:
+                    return transfer_stats(sent, time.monotonic() - started)
+            self.progress(ip, 0, os.path.getsize(local_path))
+            stats = self.uploader.upload(
+                self.pool, ip, self.port, self.username, self.password, self.timeout, local_path, self.stage_path,
+                progress=partial(self.progress, ip),
+            )
+        if "resumedFrom" in stats and not self.digest:
+            # finish() checks a resumed file against the digest before moving it
+            with metrics.phase("checksum"):
+                self.digest = file_digest(local_path)
+        return stats
+
+    def finish(self, ip: str, transfer: Optional[Dict] = None, verify: bool = False) -> Dict:
+        """Move the staged file into place with sudo, chown and chmod it.
+
+        `transfer` (bytes sent, timing) is merged into the result. With
+        `verify`, or when the upload was resumed after a drop, the staged
+        file's sha256 must match `digest` first.
+        """
+        move_cmd = self._place_command(move=True)
+        verify = verify or "resumedFrom" in (transfer or {})
+        if verify and self.digest:
+            stage = shlex.quote(self.stage_path)
+            move_cmd = (
+                f'echo "{self.digest}  "{stage} | sha256sum -c --status || '
+                f'{{ echo "Checksum mismatch: {self.stage_path}"; exit 202; }}; ' + move_cmd
+            )
+        with metrics.phase("place"):
+            res = self.run(ip, move_cmd, stdin_blocks=self.password_stdin())
+        if not res.get("ok"):
+            raise Exception(res.get("stderr") or res.get("stdout") or res.get("error") or "Move with sudo failed")
+        return dict({"ok": True, "dest": self.dest, "skipped": False, "transferredBytes": 0}, **(transfer or {}))
+
+    def skip_unchanged(self, ips: List[str]) -> List[str]:
+        """Checksum dest on every host; records hosts that already match `digest`
+        and returns the ones that still need the file.
+
+        Matching hosts whose owner, group or mode differ only get chown/chmod.
+        """
+
+        def check(ip):
+            with self.timed(ip):
+                return compare(ip)
+
+        def compare(ip):
+            try:
+                with metrics.phase("checksum"):
+                    res = self.run(ip, remote_probe_command(self.dest))
+            except Exception:
+                return False
+            probe = parse_probe(res.get("stdout")) if res.get("ok") else None
+            if probe is None:
+                return False
+            digest, meta = probe
+            if digest != self.digest:
+                self._existing.add(ip)
+                return False
+            try:
+                if meta != f"{self.owner}:{self.group}:{FILE_MODE}":
+                    with metrics.phase("place"):
+                        res = self.run(ip, self._place_command(move=False), stdin_blocks=self.password_stdin())
+                    if not res.get("ok"):
+                        raise Exception(res.get("stderr") or res.get("stdout") or res.get("error") or "chown/chmod failed")
+                self.record(ip, {"ok": True, "dest": self.dest, "skipped": True, "transferredBytes": 0})
+            except Exception as e:
+                self.record(ip, {"ok": False, "error": str(e), "skipped": True, "transferredBytes": 0})
+            return True
+
+        futures = {ip: self.scheduler.submit(self.op_key, ip, check, ip) for ip in ips}
+        wait(futures.values())
+        return [ip for ip, fut in futures.items() if not fut.result()]
+
+    def _place_command(self, move: bool) -> str:
+        """Shell that reads the sudo password as the first stdin line, then
+        places the file with one sudo: mkdir + mv (if move), chown and chmod.
+
+        As in `bundle.extract_command`, the password only goes to sudo when
+        it prompts, and never appears on a command line.
+        """
+        place = 'mkdir -p -- "$0" && mv -f -- "$1" "$2" && ' if move else ""
+        place += f'chown -- "$3" "$2" && chmod 0{FILE_MODE} -- "$2"'
+        args = (self.dest_dir, self.stage_path, self.dest, f"{self.owner}:{self.group}")
+        sudo_args = f"sh -c {shlex.quote(place)} " + " ".join(shlex.quote(a) for a in args)
+        # Validate existence of owner/group on target before applying
+        return (
+            f"IFS= read -r PW || exit 203; "
+            f'OWNER="{self.owner}"; GROUP="{self.group}"; '
+            f'id -u "$OWNER" >/dev/null 2>&1 || {{ echo "Owner not found: $OWNER"; exit 200; }}; '
+            f'getent group "$GROUP" >/dev/null 2>&1 || {{ echo "Group not found: $GROUP"; exit 201; }}; '
+            f"if sudo -n true 2>/dev/null; then sudo -n {sudo_args}; "
+            f"else printf '%s\\n' \"$PW\" | sudo -S -k -p '' {sudo_args}; fi"
+        )
+
+    def password_stdin(self) -> List[bytes]:
+        """stdin for commands that read the password as their first line."""
+        return [f"{self.password or ''}\n".encode()]
+
+    def _upload_delta(self, ip: str, local_path: str) -> Optional[int]:
+        """Stage a patched copy of ip's current dest, sending only changed blocks.
+
+        Returns bytes sent, or None when a full upload should be done instead.
+        """
+        block = self.delta_block_bytes
+        try:
+            res = self.run(ip, remote_blocks_command(self.dest, block))
+            remote = (res.get("stdout") or "").split() if res.get("ok") else []
+            local = block_digests(local_path, block)
+            changed = [i for i, d in enumerate(local) if i >= len(remote) or remote[i] != d]
+            if not remote or len(changed) == len(local):
+                return None
+            stage = shlex.quote(self.stage_path)
+            size = os.path.getsize(local_path)
+            total = sum(min(block, size - i * block) for i in changed)
+            res = self.run(ip, f"cp -- {shlex.quote(self.dest)} {stage} && truncate -s {size} {stage}")
+            if not res.get("ok"):
+                return None
+            sent = 0
+            self.progress(ip, 0, total)
+            with self.pool.sftp(ip, self.port, self.username, self.password, None, self.timeout) as sftp:
+                with self.uploader.open_remote(sftp, self.stage_path, "r+b") as f, open(local_path, "rb") as src:
+                    for i in changed:
+                        src.seek(i * block)
+                        data = src.read(block)
+                        f.seek(i * block)
+                        self.uploader.write(f, data)
+                        sent += len(data)
+                        self.progress(ip, sent, total)
+            return sent
+        except Exception:
+            return None
+
+    def run(self, ip: str, command: str, timeout: Optional[int] = None,
+            stdin_blocks: Optional[Iterable[bytes]] = None) -> Dict:
+        return execute_command_on_host(
+            host=ip,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            private_key=None,
+            command=command,
+            timeout=timeout or self.timeout,
+            pool=self.pool,
+            stdin_blocks=stdin_blocks,
+        )
+
+    def distribute(self, ips: List[str], local_path: str):
+        """Upload straight from the server to every host, recording each outcome."""
+        size = os.path.getsize(local_path)
+
+        def place(ip):
+            self.started(ip)
+            with self.timed(ip):
+                try:
+                    transfer = self.upload(ip, local_path)
+                    # A delta-patched file is checked against the digest before it is moved
+                    self.record(ip, self.finish(ip, transfer, verify=transfer["transferredBytes"] < size))
+                except Exception as e:
+                    self.record(ip, {"ok": False, "error": str(e)})
+
+        wait([self.scheduler.submit(self.op_key, ip, place, ip) for ip in ips])
+
+    def distribute_stream(
+        self,
+        ips: List[str],
+        open_source: Callable[[], ContextManager[Iterable[bytes]]],
+        buffer_bytes: int,
+        spill_path: Optional[str] = None,
+        verify: bool = False,
+        size: Optional[int] = None,
+    ):
+        """Copy a stream to every host while it is still being read; no local copy.
+
+        `open_source()` yields an iterable of blocks. Blocks are fanned out to
+        one SFTP writer per host with at most `buffer_bytes` held in memory, so
+        the source is throttled to the slowest running target. Hosts whose
+        writer had not started before the window moved on get another pass
+        over the source.
+
+        With `spill_path`, the source is read exactly once and never waits:
+        once targets fall `buffer_bytes` behind, the stream is also written
+        to that file and laggards catch up from it. With `verify`, staged
+        files are checked against `digest` before they are moved. `size`,
+        if known, is only used for progress reports.
+        """
+        pending = list(ips)
+        while pending:
+            fanout, futures = self.start_stream(pending, buffer_bytes, spill_path, verify, size)
+            self.feed_stream(fanout, open_source)
+            wait(futures.values())
+            fanout.discard()
+            pending = [ip for ip, fut in futures.items() if not fut.result()]
+
+    def start_stream(
+        self,
+        ips: List[str],
+        buffer_bytes: int,
+        spill_path: Optional[str] = None,
+        verify: bool = False,
+        size: Optional[int] = None,
+    ) -> Tuple[BlockFanout, Dict[str, Future]]:
+        """Queue one stream writer per host; returns the fanout to feed and their futures.
+
+        Each future resolves to False if its host missed the start of the
+        stream and needs another pass (never with `spill_path`).
+        """
+        fanout = BlockFanout(buffer_bytes, spill_path)
+        futures = {
+            ip: self.scheduler.submit(self.op_key, ip, self._receive_stream, ip, fanout.reader(), verify, size)
+            for ip in ips
+        }
+        return fanout, futures
+
+    @staticmethod
+    def feed_stream(fanout: BlockFanout, open_source: Callable[[], ContextManager[Iterable[bytes]]]):
+        """Publish the source's blocks to fanout; a source error fails the writers."""
+        try:
+            with open_source() as blocks:
+                for block in blocks:
+                    if not fanout.publish(block):
+                        break
+            fanout.close()
+        except Exception as e:
+            fanout.abort(e)
+
+    def _receive_stream(self, ip: str, reader: FanoutReader, verify: bool = False,
+                        size: Optional[int] = None) -> bool:
+        """Write the fanned-out stream to the staging path on ip, then move it into place."""
+        if not reader.start():
+            return False
+        with self.timed(ip):
+            return self._write_stream(ip, reader, verify, size)
+
+    def _write_stream(self, ip: str, reader: FanoutReader, verify: bool, size: Optional[int]) -> bool:
+        self.started(ip)
+        self.progress(ip, 0, size)
+        started = time.monotonic()
+        try:
+            with metrics.phase("transfer"):
+                with self.pool.sftp(ip, self.port, self.username, self.password, None, self.timeout) as sftp:
+                    with self.uploader.open_remote(sftp, self.stage_path) as f:
+                        while True:
+                            data = reader.read()
+                            if not data:
+                                break
+                            self.uploader.write(f, data)
+                            self.progress(ip, reader.pos, size)
+        except Exception as e:
+            self.record(ip, {"ok": False, "error": str(e)})
+            return True
+        finally:
+            reader.detach()
+        try:
+            self.record(ip, self.finish(ip, transfer_stats(reader.pos, time.monotonic() - started), verify=verify))
+        except Exception as e:
+            self.record(ip, {"ok": False, "error": str(e)})
+        return True
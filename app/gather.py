@@ -0,0 +1,340 @@
+import fnmatch
+import gzip
+import io
+import json
+import posixpath
+import queue
+import re
+import stat
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import deque
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import paramiko
+
+from . import metrics
+from .bundle import member_path
+from .scheduler import FleetScheduler
+from .ssh_pool import SSHConnectionPool
+
+FORMATS = ("tar.gz", "zip")
+
+MIMETYPES = {"tar.gz": "application/gzip", "zip": "application/zip"}
+
+# Written last at the top of the archive: per-host file counts, bytes and errors
+REPORT_NAME = "gather-report.json"
+
+_MAGIC_RE = re.compile(r"[*?[]")
+
+
+def sftp_glob(sftp: paramiko.SFTPClient, pattern: str) -> List[str]:
+    """Expand a shell-style pattern on the remote host, one path component at a time.
+
+    Components without wildcards are taken as-is (they may not exist);
+    hidden names only match patterns that start with a dot, like the shell.
+    """
+    if not _MAGIC_RE.search(pattern):
+        return [pattern]
+    paths = ["/" if pattern.startswith("/") else "."]
+    for part in (p for p in pattern.split("/") if p):
+        matched = []
+        for base in paths:
+            if not _MAGIC_RE.search(part):
+                matched.append(posixpath.join(base, part))
+                continue
+            try:
+                names = sftp.listdir(base)
+            except IOError:
+                continue
+            matched.extend(
+                posixpath.join(base, name) for name in sorted(names)
+                if fnmatch.fnmatchcase(name, part) and (part.startswith(".") or not name.startswith("."))
+            )
+        paths = matched
+    return [posixpath.normpath(p) for p in paths]
+
+
+def sftp_files(
+    sftp: paramiko.SFTPClient, path: str, errors: List[str]
+) -> Iterator[Tuple[str, paramiko.SFTPAttributes]]:
+    """Regular files at path: the file itself, or everything under a directory.
+
+    Symlinks to files are followed; symlinked directories are not, so a
+    link loop cannot make the walk endless. Subdirectories that cannot be
+    listed are noted in errors and skipped.
+    """
+    st = sftp.stat(path)
+    if stat.S_ISREG(st.st_mode):
+        yield path, st
+        return
+    if not stat.S_ISDIR(st.st_mode):
+        return
+    try:
+        entries = sorted(sftp.listdir_attr(path), key=lambda a: a.filename)
+    except IOError as e:
+        errors.append(f"{path}: {e}")
+        return
+    for attr in entries:
+        child = posixpath.join(path, attr.filename)
+        if stat.S_ISDIR(attr.st_mode):
+            yield from sftp_files(sftp, child, errors)
+        elif stat.S_ISREG(attr.st_mode):
+            yield child, attr
+        elif stat.S_ISLNK(attr.st_mode):
+            try:
+                target = sftp.stat(child)
+            except IOError:
+                continue
+            if stat.S_ISREG(target.st_mode):
+                yield child, target
+
+
+class _Sink:
+    """Write-only file object collecting archive bytes until the response takes them."""
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def write(self, data) -> int:
+        self._buf += data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+class ArchiveStream:
+    """A tar.gz or zip archive written entry by entry onto a non-seekable stream.
+
+    `add` is a generator that yields archive bytes as each block of the
+    entry is written, so a large entry never sits in memory as a whole.
+    """
+
+    def __init__(self, fmt: str, block_bytes: int = 1024 * 1024):
+        self.fmt = fmt
+        self.block_bytes = max(4096, block_bytes)
+        self._sink = _Sink()
+        if fmt == "zip":
+            self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6)
+        else:
+            self._gz = gzip.GzipFile(fileobj=self._sink, mode="wb", compresslevel=6)
+            self._tar_bytes = 0
+
+    def add(self, name: str, src, size: int, mtime: float, mode: int) -> Iterator[bytes]:
+        """Write size bytes read from src as name; yields output as it is produced."""
+        if self.fmt == "zip":
+            info = zipfile.ZipInfo(name, time.localtime(max(mtime, 315532800))[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = (stat.S_IFREG | (mode & 0o7777)) << 16
+            info.file_size = size
+            with self._zip.open(info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT) as out:
+                for block in iter(partial(src.read, self.block_bytes), b""):
+                    out.write(block)
+                    yield self._sink.take()
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = int(mtime)
+            info.mode = mode & 0o7777
+            self._tar_write(info.tobuf(tarfile.GNU_FORMAT, "utf-8", "surrogateescape"))
+            for block in iter(partial(src.read, self.block_bytes), b""):
+                self._tar_write(block)
+                yield self._sink.take()
+            self._tar_pad(tarfile.BLOCKSIZE)
+        yield self._sink.take()
+
+    def add_bytes(self, name: str, data: bytes) -> Iterator[bytes]:
+        yield from self.add(name, io.BytesIO(data), len(data), time.time(), 0o644)
+
+    def close(self) -> bytes:
+        """Finish the archive; returns its last bytes."""
+        if self.fmt == "zip":
+            self._zip.close()
+        else:
+            # End-of-archive marker, padded to a full record like tarfile does
+            self._tar_write(b"\0" * (2 * tarfile.BLOCKSIZE))
+            self._tar_pad(tarfile.RECORDSIZE)
+            self._gz.close()
+        return self._sink.take()
+
+    def _tar_write(self, data: bytes):
+        self._gz.write(data)
+        self._tar_bytes += len(data)
+
+    def _tar_pad(self, unit: int):
+        remainder = self._tar_bytes % unit
+        if remainder:
+            self._tar_write(b"\0" * (unit - remainder))
+
+
+class _HostDone:
+    def __init__(self, ip: str, report: Dict):
+        self.ip = ip
+        self.report = report
+
+
+class FleetGather:
+    """Pull the same path or glob from many hosts into one streamed archive.
+
+    Up to `concurrency` hosts are read at once over pooled SFTP. Each
+    matched file is downloaded into a spool (memory up to `spool_bytes`,
+    then a temp file) and queued; the response thread writes queued files
+    into the archive under `<ip>/<path>` while other hosts are still being
+    read. The queue holds at most `concurrency` files, so a slow client
+    throttles the downloads instead of the server staging every host's
+    files first. A `gather-report.json` with per-host outcomes closes the
+    archive, since the HTTP status is sent before any host is read.
+    """
+
+    def __init__(
+        self,
+        pool: SSHConnectionPool,
+        scheduler: FleetScheduler,
+        port: int,
+        username: str,
+        password: str,
+        timeout: int,
+        pattern: str,
+        fmt: str = "tar.gz",
+        concurrency: int = 16,
+        spool_bytes: int = 8 * 1024 * 1024,
+        block_bytes: int = 1024 * 1024,
+        spool_dir: Optional[str] = None,
+    ):
+        self.pool = pool
+        self.scheduler = scheduler
+        self.port = port
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.pattern = pattern
+        self.fmt = fmt
+        self.concurrency = max(1, concurrency)
+        self.spool_bytes = spool_bytes
+        self.block_bytes = max(4096, block_bytes)
+        self.spool_dir = spool_dir
+        self.op_key = f"gather-{uuid.uuid4()}"
+        self._ready: "queue.Queue" = queue.Queue(maxsize=self.concurrency)
+        self._pending: deque = deque()
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    def stream(self, ips: List[str]) -> Iterator[bytes]:
+        """Yield the archive; hosts are read while it is being sent."""
+        archive = ArchiveStream(self.fmt, self.block_bytes)
+        report: Dict[str, Dict] = {}
+        self._pending.extend(ips)
+        for _ in range(min(self.concurrency, len(ips))):
+            self._submit_next()
+        try:
+            while len(report) < len(ips):
+                item = self._ready.get()
+                if isinstance(item, _HostDone):
+                    report[item.ip] = item.report
+                    continue
+                name, spool, size, mtime, mode = item
+                with spool:
+                    yield from archive.add(name, spool, size, mtime, mode)
+            summary = {"pattern": self.pattern, "hosts": {ip: report[ip] for ip in ips}}
+            yield from archive.add_bytes(REPORT_NAME, json.dumps(summary, indent=2).encode())
+            yield archive.close()
+        finally:
+            # Client went away (or we are done): stop hosts and release queued spools
+            self._cancelled.set()
+            self._pending.clear()
+            self._drain()
+
+    # -- per host ---------------------------------------------------------
+
+    def _submit_next(self):
+        with self._lock:
+            if not self._pending or self._cancelled.is_set():
+                return
+            ip = self._pending.popleft()
+        self.scheduler.submit(self.op_key, ip, self._collect, ip)
+
+    def _collect(self, ip: str):
+        report = {"ok": False, "files": 0, "bytes": 0, "errors": [], "timings": {}}
+        with metrics.collect(report["timings"]):
+            self._collect_into(ip, report)
+
+    def _collect_into(self, ip: str, report: Dict):
+        try:
+            with self.pool.sftp(ip, self.port, self.username, self.password, None, self.timeout) as sftp:
+                for path in sftp_glob(sftp, self.pattern):
+                    try:
+                        files = list(sftp_files(sftp, path, report["errors"]))
+                    except IOError as e:
+                        report["errors"].append(f"{path}: {e}")
+                        continue
+                    for remote, attr in files:
+                        if self._cancelled.is_set():
+                            return
+                        try:
+                            self._fetch(sftp, ip, remote, attr, report)
+                        except IOError as e:
+                            report["errors"].append(f"{remote}: {e}")
+            if not report["files"] and not report["errors"]:
+                report["errors"].append(f"No match for {self.pattern}")
+            report["ok"] = report["files"] > 0
+        except Exception as e:
+            report["error"] = str(e)
+        finally:
+            if not self._cancelled.is_set():
+                self._put(_HostDone(ip, report))
+            self._submit_next()
+
+    def _fetch(self, sftp: paramiko.SFTPClient, ip: str, remote: str, attr, report: Dict):
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes, dir=self.spool_dir)
+        try:
+            with metrics.phase("download"), sftp.open(remote, "rb") as f:
+                # Size as read, not as stat'ed: logs may still be growing
+                f.prefetch(attr.st_size)
+                for block in iter(partial(f.read, self.block_bytes), b""):
+                    spool.write(block)
+                    metrics.TRANSFER_BYTES.inc(len(block), direction="download")
+            size = spool.tell()
+            spool.seek(0)
+        except BaseException:
+            spool.close()
+            raise
+        name = f"{ip}/{member_path(remote) or posixpath.basename(remote)}"
+        self._put((name, spool, size, attr.st_mtime or time.time(), attr.st_mode or 0o644))
+        report["files"] += 1
+        report["bytes"] += size
+
+    def _put(self, item):
+        # Block while the archive writer is behind, unless the stream was abandoned
+        while not self._cancelled.is_set():
+            try:
+                self._ready.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        if not isinstance(item, _HostDone):
+            item[1].close()
+
+    def _drain(self):
+        while True:
+            try:
+                item = self._ready.get_nowait()
+            except queue.Empty:
+                return
+            if not isinstance(item, _HostDone):
+                item[1].close()
@@ -0,0 +1,66 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+# "Oct 17 10:00:01 vm-042 systemd[1]: ..." (journal/syslog lines: timestamp then hostname)
+_SYSLOG = re.compile(r"\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) [ \d]\d \d\d:\d\d:\d\d(?:\.\d+)? \S+")
+# "Fri 2026-10-16 10:00:00 UTC", "2026-10-16T10:00:00.123+02:00"
+_DATETIME = re.compile(
+    r"\b(?:(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun),? )?\d{4}-\d\d-\d\d[T ]\d\d:\d\d(?::\d\d(?:[.,]\d+)?)?"
+    r"(?:Z|[+-]\d\d:?\d\d| [A-Z]{2,5}\b)?"
+)
+_TIME = re.compile(r"\b\d\d:\d\d:\d\d(?:[.,]\d+)?\b")
+# systemd's "; 2 days 3h ago"
+_AGO = re.compile(r"\b(?:\d+\s*[a-z]+\s+)+ago\b")
+
+
+def normalize_output(text: str, ip: str) -> str:
+    """Mask what legitimately differs between hosts running the same thing:
+    timestamps, syslog hostnames and the host's own IP (also in the
+    ip-10-0-0-5 form cloud hostnames use).
+    """
+    if not text:
+        return text
+    text = _SYSLOG.sub("<time> <host>", text)
+    text = _DATETIME.sub("<time>", text)
+    text = _TIME.sub("<time>", text)
+    text = _AGO.sub("<ago>", text)
+    text = re.sub(r"\b" + re.escape(ip) + r"\b", "<ip>", text)
+    return re.sub(r"\b" + re.escape(ip.replace(".", "-")) + r"\b", "<ip>", text)
+
+
+def group_results(
+    ips: List[str], statuses: Dict[str, Optional[str]], results: Dict[str, Dict], normalize: bool = False
+) -> Tuple[List[Dict], List[str]]:
+    """Group finished hosts by identical stdout, stderr and error.
+
+    Returns the groups, largest first, each with its output once and the
+    IPs, exit codes and statuses of its hosts (in `ips` order), plus the
+    IPs that have no result yet. Stored outputs are interned per job, so
+    without `normalize` equal outputs are usually the same string and
+    grouping costs one dict lookup per host.
+    """
+    groups: Dict[Tuple[str, str, str], Dict] = {}
+    pending = []
+    for ip in ips:
+        res = results.get(ip)
+        if not res:
+            pending.append(ip)
+            continue
+        stdout, stderr, error = res.get("stdout") or "", res.get("stderr") or "", res.get("error") or ""
+        if normalize:
+            stdout, stderr, error = (normalize_output(s, ip) for s in (stdout, stderr, error))
+        group = groups.get((stdout, stderr, error))
+        if group is None:
+            group = groups[(stdout, stderr, error)] = {
+                "stdout": stdout,
+                "stderr": stderr,
+                "error": error or None,
+                "ips": [],
+                "exitCodes": [],
+                "statuses": [],
+            }
+        group["ips"].append(ip)
+        group["exitCodes"].append(res.get("exit_code"))
+        group["statuses"].append(statuses.get(ip))
+    ordered = sorted(groups.values(), key=lambda g: -len(g["ips"]))
+    return ordered, pending
@@ -1,12 +1,139 @@
 import time
 import threading
-from typing import Dict, List
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
 
+from .output_buffer import OutputBuffer
+
+# Rough fixed cost of one stored host result beyond its output strings
+_RESULT_OVERHEAD_BYTES = 200
+
+
+def encoded_size(text: str) -> int:
+    """Bytes of text as UTF-8; what output counts against JOB_MAX_BYTES (not characters)."""
+    return len(text.encode("utf-8", "surrogatepass"))
+
+
+class HostResult:
+    """Compact per-host result record; `extra` holds endpoint-specific fields."""
+
+    __slots__ = ("ok", "stdout", "stderr", "exit_code", "error", "extra")
+
+    _CORE = ("ok", "stdout", "stderr", "exit_code", "error")
+
+    def __init__(self, ok: bool, stdout: str = "", stderr: str = "", exit_code: Optional[int] = None,
+                 error: Optional[str] = None, extra: Optional[Dict] = None):
+        self.ok = ok
+        self.stdout = stdout
+        self.stderr = stderr
+        self.exit_code = exit_code
+        self.error = error
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, result: Dict) -> "HostResult":
+        extra = {k: v for k, v in result.items() if k not in cls._CORE}
+        return cls(
+            ok=bool(result.get("ok")),
+            stdout=result.get("stdout") or "",
+            stderr=result.get("stderr") or "",
+            exit_code=result.get("exit_code"),
+            error=result.get("error"),
+            extra=extra or None,
+        )
+
+    def to_dict(self) -> Dict:
+        d = {"ok": self.ok, "stdout": self.stdout, "stderr": self.stderr, "exit_code": self.exit_code}
+        if self.error is not None:
+            d["error"] = self.error
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    def size_bytes(self) -> int:
+        """Bytes held by this record alone; its stdout/stderr are counted where they are interned."""
+        return encoded_size(self.error or "") + _RESULT_OVERHEAD_BYTES
+
+
+class OutputInterner:
+    """Reference-counted table of one job's distinct stdout/stderr strings.
+
+    Hosts that print the same thing (a version check, a service status on
+    a uniform fleet) end up holding one shared string instead of a copy
+    each; `acquire` and `release` return how many bytes that added to or
+    freed from the job.
+    """
+
+    __slots__ = ("_refs",)
 
-class JobManager:
     def __init__(self):
-        self.jobs: Dict[str, Dict] = {}
+        self._refs: Dict[str, List] = {}
+
+    def acquire(self, text: str) -> Tuple[str, int]:
+        """The interned copy of text, and its size in bytes if it was not held yet."""
+        if not text:
+            return "", 0
+        entry = self._refs.get(text)
+        if entry is not None:
+            entry[1] += 1
+            return entry[0], 0
+        size = encoded_size(text)
+        self._refs[text] = [text, 1, size]
+        return text, size
+
+    def release(self, text: str) -> int:
+        """Drop one reference; returns the bytes freed if it was the last."""
+        entry = self._refs.get(text) if text else None
+        if entry is None:
+            return 0
+        entry[1] -= 1
+        if entry[1] > 0:
+            return 0
+        del self._refs[text]
+        return entry[2]
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+
+class JobManager:
+    """In-memory job store with TTL expiry and a retained-bytes cap.
+
+    Finished jobs are dropped `ttl_seconds` after completion by a background
+    reaper, and when stored results exceed `max_bytes` the least recently
+    viewed finished jobs are evicted first. Running jobs are never evicted.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, max_bytes: int = 256 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # Ordered by last access, oldest first, for LRU eviction
+        self.jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._bytes = 0
+        self._evicted = 0
+        self._on_evict: Optional[Callable[[str], None]] = None
+        self._reaper: Optional[threading.Thread] = None
+        # Output buffers of hosts still running, keyed by job then IP
+        self._live: Dict[str, Dict[str, Tuple[OutputBuffer, OutputBuffer]]] = {}
+        # Sequence number at which each host last changed, keyed by job then IP
+        self._changed: Dict[str, Dict[str, int]] = {}
+        # Transfer progress of hosts still running, keyed by job then IP
+        self._progress: Dict[str, Dict[str, Dict]] = {}
+        # Distinct stdout/stderr strings of each job's stored results
+        self._outputs: Dict[str, OutputInterner] = {}
         self._lock = threading.Lock()
+        # Signalled on every job change so streaming clients can wake up
+        self._changes = threading.Condition(self._lock)
+
+    def configure(self, ttl_seconds: float, max_bytes: int, on_evict: Optional[Callable[[str], None]] = None):
+        """Apply retention settings and start the background reaper."""
+        with self._lock:
+            self.ttl_seconds = ttl_seconds
+            self.max_bytes = max_bytes
+            self._on_evict = on_evict
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name="job-reaper", daemon=True)
+                self._reaper.start()
 
     def create_job(self, job_id: str, ips: List[str], command: str):
         with self._lock:
@@ -18,19 +145,109 @@ class JobManager:
                 "statuses": {ip: "queued" for ip in ips},
                 "results": {},
                 "completed": False,
+                "seq": 0,
+                "retainedBytes": 0,
             }
+            self._live[job_id] = {}
+            self._changed[job_id] = {}
+            self._progress[job_id] = {}
 
     def update_status(self, job_id: str, ip: str, status: str):
         with self._lock:
             job = self.jobs.get(job_id)
             if job and ip in job["statuses"]:
                 job["statuses"][ip] = status
+                self._bump(job, ip)
+
+    def attach_output(self, job_id: str, ip: str, stdout: OutputBuffer, stderr: OutputBuffer):
+        """Expose a running host's output buffers so polls can show partial output."""
+        with self._lock:
+            live = self._live.get(job_id)
+            if live is not None:
+                live[ip] = (stdout, stderr)
+
+    def live_buffers(self, job_id: str) -> Dict[str, Tuple[OutputBuffer, OutputBuffer]]:
+        with self._lock:
+            return dict(self._live.get(job_id) or {})
+
+    def live_output(self, job_id: str, limit: int) -> Dict[str, Dict]:
+        """Latest `limit` bytes of stdout/stderr for each host still running."""
+        return {
+            ip: {
+                "stdout": out.latest(limit),
+                "stderr": err.latest(limit),
+                "stdout_bytes": out.total_bytes,
+                "stderr_bytes": err.total_bytes,
+                "partial": True,
+            }
+            for ip, (out, err) in self.live_buffers(job_id).items()
+        }
+
+    def update_progress(self, job_id: str, ip: str, done: int, total: Optional[int] = None):
+        """Record bytes transferred so far for a running host (total None when unknown).
+
+        Progress is polled rather than pushed, so this does not advance the
+        job's change sequence.
+        """
+        now = time.monotonic()
+        with self._lock:
+            progress = self._progress.get(job_id)
+            if progress is None:
+                return
+            entry = progress.get(ip)
+            if entry is None or done < entry["done"]:
+                # First report, or the transfer restarted
+                entry = progress[ip] = {"startedAt": now, "done": 0}
+            entry["done"] = done
+            entry["total"] = total
+            entry["at"] = now
+
+    def live_progress(self, job_id: str) -> Dict[str, Dict]:
+        """Bytes sent, average rate and ETA for each host still transferring."""
+        with self._lock:
+            entries = {ip: dict(p) for ip, p in (self._progress.get(job_id) or {}).items()}
+        now = time.monotonic()
+        view = {}
+        for ip, p in entries.items():
+            elapsed = max(now - p["startedAt"], 1e-6)
+            rate = p["done"] / elapsed
+            total = p["total"]
+            eta = None
+            if total is not None and rate > 0:
+                eta = round(max(total - p["done"], 0) / rate, 1)
+            view[ip] = {
+                "bytesSent": p["done"],
+                "totalBytes": total,
+                "mbPerSec": round(rate / (1024 * 1024), 2),
+                "etaSeconds": eta,
+            }
+        return view
 
     def store_result(self, job_id: str, ip: str, result: Dict):
+        record = HostResult.from_dict(result)
+        evicted = []
         with self._lock:
             job = self.jobs.get(job_id)
             if job:
-                job["results"][ip] = result
+                outputs = self._outputs.setdefault(job_id, OutputInterner())
+                record.stdout, out_added = outputs.acquire(record.stdout)
+                record.stderr, err_added = outputs.acquire(record.stderr)
+                delta = record.size_bytes() + out_added + err_added
+                previous = job["results"].get(ip)
+                if previous is not None:
+                    delta -= previous.size_bytes() + outputs.release(previous.stdout) + outputs.release(previous.stderr)
+                job["results"][ip] = record
+                job["retainedBytes"] += delta
+                self._bytes += delta
+                self._bump(job, ip)
+                evicted = self._evict_over_cap()
+            live = self._live.get(job_id)
+            if live is not None:
+                live.pop(ip, None)
+            progress = self._progress.get(job_id)
+            if progress is not None:
+                progress.pop(ip, None)
+        self._notify_evicted(evicted)
 
     def finalize_job(self, job_id: str):
         with self._lock:
@@ -38,9 +255,126 @@ class JobManager:
             if job:
                 job["completed"] = True
                 job["completedAt"] = time.time()
+                self._bump(job, None)
+            self._live.pop(job_id, None)
+            self._progress.pop(job_id, None)
 
     def get_job(self, job_id: str):
         with self._lock:
             job = self.jobs.get(job_id)
-            # Return a shallow copy to avoid race conditions in callers
-            return dict(job) if job else None
+            if not job:
+                return None
+            self.jobs.move_to_end(job_id)
+            # Copy the mutable maps (not the output strings) so callers can iterate safely
+            view = dict(job)
+            view["statuses"] = dict(job["statuses"])
+            view["results"] = {ip: r.to_dict() for ip, r in job["results"].items()}
+            return view
+
+    def stats(self) -> Dict:
+        with self._lock:
+            running = sum(1 for job in self.jobs.values() if not job["completed"])
+            return {
+                "jobs": len(self.jobs),
+                "running": running,
+                "retainedBytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "ttlSeconds": self.ttl_seconds,
+                "evicted": self._evicted,
+            }
+
+    def reap(self) -> int:
+        """Drop finished jobs older than the TTL, then enforce the byte cap."""
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self.jobs.items()
+                if job["completed"] and now - job.get("completedAt", now) > self.ttl_seconds
+            ]
+            for job_id in expired:
+                self._remove(job_id)
+            evicted = expired + self._evict_over_cap()
+        self._notify_evicted(evicted)
+        return len(evicted)
+
+    def changes_since(self, job_id: str, since: int) -> Optional[Dict]:
+        """Hosts whose status or result changed after sequence `since`.
+
+        Returns the job's current `seq`, `completed` flag and, for changed
+        hosts only, their status and (if finished) result.
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            self.jobs.move_to_end(job_id)
+            changed = [ip for ip, seq in self._changed.get(job_id, {}).items() if seq > since]
+            return {
+                "seq": job["seq"],
+                "completed": job["completed"],
+                "statuses": {ip: job["statuses"].get(ip) for ip in changed},
+                "results": {ip: job["results"][ip].to_dict() for ip in changed if ip in job["results"]},
+            }
+
+    def wait_for_change(self, job_id: str, since: int, timeout: float) -> Optional[int]:
+        """Block until the job's sequence passes `since` or timeout; returns the current seq."""
+        deadline = time.monotonic() + timeout
+        with self._changes:
+            while True:
+                job = self.jobs.get(job_id)
+                if not job:
+                    return None
+                if job["seq"] > since or job["completed"]:
+                    return job["seq"]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return job["seq"]
+                self._changes.wait(remaining)
+
+    def _evict_over_cap(self) -> List[str]:
+        """Evict least recently used finished jobs until under max_bytes. Lock held."""
+        evicted = []
+        if self._bytes <= self.max_bytes:
+            return evicted
+        for job_id in [jid for jid, job in self.jobs.items() if job["completed"]]:
+            if self._bytes <= self.max_bytes:
+                break
+            self._remove(job_id)
+            evicted.append(job_id)
+        return evicted
+
+    def _remove(self, job_id: str):
+        job = self.jobs.pop(job_id, None)
+        if job:
+            self._bytes -= job["retainedBytes"]
+            self._evicted += 1
+        self._live.pop(job_id, None)
+        self._changed.pop(job_id, None)
+        self._progress.pop(job_id, None)
+        self._outputs.pop(job_id, None)
+        # Wake streaming clients so they notice the job is gone
+        self._changes.notify_all()
+
+    def _notify_evicted(self, job_ids: List[str]):
+        if not self._on_evict:
+            return
+        for job_id in job_ids:
+            try:
+                self._on_evict(job_id)
+            except Exception:
+                pass
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(1.0, min(60.0, self.ttl_seconds / 4)))
+            try:
+                self.reap()
+            except Exception:
+                pass
+
+    def _bump(self, job: Dict, ip: Optional[str]):
+        """Advance the job's change sequence. Caller holds the lock."""
+        job["seq"] += 1
+        if ip is not None:
+            self._changed[job["jobId"]][ip] = job["seq"]
+        self._changes.notify_all()
@@ -0,0 +1,526 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .job_manager import HostResult, JobManager
+
+# How often a waiting poll re-reads a job that other processes may be changing
+_POLL_SECONDS = 0.2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    command TEXT NOT NULL,
+    ips TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    completed_at REAL,
+    seq INTEGER NOT NULL DEFAULT 0,
+    retained_bytes INTEGER NOT NULL DEFAULT 0,
+    accessed_at REAL NOT NULL,
+    dispatch INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    probe INTEGER,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_dispatch ON jobs (dispatch, created_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (completed, completed_at);
+CREATE INDEX IF NOT EXISTS jobs_accessed ON jobs (completed, accessed_at);
+CREATE TABLE IF NOT EXISTS hosts (
+    job_id TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    result_bytes INTEGER NOT NULL DEFAULT 0,
+    stdout_ref TEXT,
+    stderr_ref TEXT,
+    seq INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, ip)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS hosts_changed ON hosts (job_id, seq);
+CREATE TABLE IF NOT EXISTS outputs (
+    job_id TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    body TEXT NOT NULL,
+    refs INTEGER NOT NULL,
+    PRIMARY KEY (job_id, digest)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters VALUES ('bytes', 0), ('evicted', 0);
+"""
+
+# jobs.dispatch: run by the process that created the job, waiting for a worker, claimed by one
+_INLINE, _QUEUED, _CLAIMED = 0, 1, 2
+
+# Columns added after the first release, created on databases that predate them
+_ADDED_COLUMNS = (("probe", "INTEGER"), ("heartbeat_at", "REAL"))
+
+
+class SQLiteJobManager(JobManager):
+    """Job store in a SQLite database shared by every app and worker process.
+
+    Jobs, per-host statuses and results live in WAL-mode tables, so a poll
+    can land on any process and many readers never block the one writer.
+    Each change bumps the job's sequence inside the same transaction as the
+    host row it touched, which keeps `changes_since` an indexed range scan.
+    Stdout and stderr are stored once per job and content hash in
+    `outputs`, referenced by the host rows, so identical output from many
+    hosts takes the space of one. Output buffers and transfer progress of
+    running hosts stay in the memory of the process running them, as with
+    the in-memory store.
+
+    Jobs can also be queued (`enqueue_job`) for a separate worker process
+    to claim and run (`claim_job`), leaving the web processes to serve HTTP.
+
+    Every running job records the process running it (`owner`), which
+    renews a heartbeat on its jobs every third of `lease_seconds`. A job
+    whose heartbeat is older than the lease, or whose owner on this machine
+    has exited, is failed for the hosts that had not finished, so pollers
+    are not left waiting on a process that is gone. Abandoned jobs are not
+    re-run, because their commands may already have run on some hosts.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = 3600, max_bytes: int = 256 * 1024 * 1024,
+                 lease_seconds: float = 60):
+        super().__init__(ttl_seconds, max_bytes)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        self._heartbeat: Optional[threading.Thread] = None
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        db = self._db()
+        db.executescript(_SCHEMA)
+        columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+        for name, kind in _ADDED_COLUMNS:
+            if name not in columns:
+                db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+
+    @property
+    def owner(self) -> str:
+        """This process, as recorded on the jobs it runs (read per call, so forks get their own)."""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def configure(self, ttl_seconds: float, max_bytes: int, on_evict: Optional[Callable[[str], None]] = None):
+        """As for JobManager; also fails jobs left behind by processes that
+        have exited and starts renewing this process's heartbeat."""
+        super().configure(ttl_seconds, max_bytes, on_evict)
+        self.fail_abandoned()
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+                self._heartbeat.start()
+
+    def create_job(self, job_id: str, ips: List[str], command: str):
+        self._insert(job_id, ips, command, _INLINE)
+        self._track(job_id)
+
+    def enqueue_job(self, job_id: str, ips: List[str], command: str, probe: Optional[bool] = None):
+        """Create a job for a worker process to claim and run; `probe` is
+        the request's pre-probe choice (None leaves it to the worker's
+        PREFLIGHT_PROBE)."""
+        self._insert(job_id, ips, command, _QUEUED, probe)
+
+    def claim_job(self, worker: str) -> Optional[Dict]:
+        """Take the oldest queued job for this process; None when there is none."""
+        db = self._db()
+        with _Transaction(db):
+            row = db.execute(
+                "SELECT job_id, ips, command, probe FROM jobs WHERE dispatch = ? ORDER BY created_at LIMIT 1",
+                (_QUEUED,),
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET dispatch = ?, worker = ?, heartbeat_at = ? WHERE job_id = ?",
+                    (_CLAIMED, worker, time.time(), row[0]),
+                )
+        if row is None:
+            return None
+        self._track(row[0])
+        probe = None if row[3] is None else bool(row[3])
+        return {"jobId": row[0], "ips": json.loads(row[1]), "command": row[2], "probe": probe}
+
+    def update_status(self, job_id: str, ip: str, status: str):
+        db = self._db()
+        with _Transaction(db):
+            seq = self._next_seq(db, job_id)
+            if seq is None:
+                return
+            cur = db.execute(
+                "UPDATE hosts SET status = ?, seq = ? WHERE job_id = ? AND ip = ?", (status, seq, job_id, ip)
+            )
+            if cur.rowcount == 0:
+                db.execute("ROLLBACK")
+                return
+        self._notify()
+
+    def store_result(self, job_id: str, ip: str, result: Dict):
+        record = HostResult.from_dict(result)
+        size = record.size_bytes()
+        stored = record.to_dict()
+        del stored["stdout"], stored["stderr"]
+        db = self._db()
+        with _Transaction(db):
+            seq = self._next_seq(db, job_id)
+            previous = db.execute(
+                "SELECT result_bytes, stdout_ref, stderr_ref FROM hosts WHERE job_id = ? AND ip = ?", (job_id, ip)
+            ).fetchone() if seq is not None else None
+            if previous is None:
+                db.execute("ROLLBACK")
+            else:
+                out_ref, out_added = self._acquire_output(db, job_id, record.stdout)
+                err_ref, err_added = self._acquire_output(db, job_id, record.stderr)
+                delta = size + out_added + err_added - previous[0]
+                delta -= self._release_output(db, job_id, previous[1]) + self._release_output(db, job_id, previous[2])
+                db.execute(
+                    "UPDATE hosts SET result = ?, result_bytes = ?, stdout_ref = ?, stderr_ref = ?, seq = ? "
+                    "WHERE job_id = ? AND ip = ?",
+                    (json.dumps(stored), size, out_ref, err_ref, seq, job_id, ip),
+                )
+                db.execute("UPDATE jobs SET retained_bytes = retained_bytes + ? WHERE job_id = ?", (delta, job_id))
+                db.execute("UPDATE counters SET value = value + ? WHERE name = 'bytes'", (delta,))
+        with self._lock:
+            live = self._live.get(job_id)
+            if live is not None:
+                live.pop(ip, None)
+            progress = self._progress.get(job_id)
+            if progress is not None:
+                progress.pop(ip, None)
+        self._notify()
+        self._notify_evicted(self._evict_over_cap())
+
+    def finalize_job(self, job_id: str):
+        db = self._db()
+        with _Transaction(db):
+            db.execute(
+                "UPDATE jobs SET completed = 1, completed_at = ?, seq = seq + 1 WHERE job_id = ?",
+                (time.time(), job_id),
+            )
+        with self._lock:
+            self._live.pop(job_id, None)
+            self._progress.pop(job_id, None)
+        self._notify()
+
+    def get_job(self, job_id: str):
+        db = self._db()
+        job = self._job_row(db, job_id)
+        if job is None:
+            return None
+        hosts = db.execute(
+            "SELECT ip, status, result, stdout_ref, stderr_ref FROM hosts WHERE job_id = ?", (job_id,)
+        ).fetchall()
+        # One string per distinct output, shared by every host that printed it
+        outputs = dict(db.execute("SELECT digest, body FROM outputs WHERE job_id = ?", (job_id,)).fetchall())
+        statuses = {row[0]: row[1] for row in hosts}
+        job["statuses"] = {ip: statuses.get(ip) for ip in job["ips"]}
+        job["results"] = {
+            ip: _with_outputs(result, outputs.get(out_ref), outputs.get(err_ref))
+            for ip, _, result, out_ref, err_ref in hosts if result is not None
+        }
+        return job
+
+    def stats(self) -> Dict:
+        db = self._db()
+        jobs, running = db.execute("SELECT COUNT(*), COALESCE(SUM(completed = 0), 0) FROM jobs").fetchone()
+        counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+        return {
+            "jobs": jobs,
+            "running": running,
+            "retainedBytes": counters["bytes"],
+            "maxBytes": self.max_bytes,
+            "ttlSeconds": self.ttl_seconds,
+            "evicted": counters["evicted"],
+        }
+
+    def reap(self) -> int:
+        self.fail_abandoned()
+        db = self._db()
+        expired = [row[0] for row in db.execute(
+            "SELECT job_id FROM jobs WHERE completed = 1 AND completed_at < ?", (time.time() - self.ttl_seconds,)
+        ).fetchall()]
+        expired = [job_id for job_id in expired if self._delete(db, job_id)]
+        evicted = expired + self._evict_over_cap()
+        self._notify_evicted(evicted)
+        return len(evicted)
+
+    def changes_since(self, job_id: str, since: int) -> Optional[Dict]:
+        db = self._db()
+        job = self._job_row(db, job_id)
+        if job is None:
+            return None
+        changed = db.execute(
+            "SELECT h.ip, h.status, h.result, o.body, e.body FROM hosts h "
+            "LEFT JOIN outputs o ON o.job_id = h.job_id AND o.digest = h.stdout_ref "
+            "LEFT JOIN outputs e ON e.job_id = h.job_id AND e.digest = h.stderr_ref "
+            "WHERE h.job_id = ? AND h.seq > ?",
+            (job_id, since),
+        ).fetchall()
+        return {
+            "seq": job["seq"],
+            "completed": job["completed"],
+            "statuses": {row[0]: row[1] for row in changed},
+            "results": {
+                ip: _with_outputs(result, stdout, stderr)
+                for ip, _, result, stdout, stderr in changed if result is not None
+            },
+        }
+
+    def wait_for_change(self, job_id: str, since: int, timeout: float) -> Optional[int]:
+        """Changes made in this process wake the wait at once; those of
+        other processes are seen on the next re-read, every _POLL_SECONDS.
+        """
+        deadline = time.monotonic() + timeout
+        db = self._db()
+        while True:
+            row = db.execute("SELECT seq, completed FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            seq, completed = row
+            remaining = deadline - time.monotonic()
+            if seq > since or completed or remaining <= 0:
+                return seq
+            with self._changes:
+                self._changes.wait(min(remaining, _POLL_SECONDS))
+
+    def heartbeat(self) -> int:
+        """Renew the lease on every unfinished job this process runs; how many."""
+        db = self._db()
+        with _Transaction(db):
+            return db.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE worker = ? AND completed = 0 AND dispatch != ?",
+                (time.time(), self.owner, _QUEUED),
+            ).rowcount
+
+    def fail_abandoned(self) -> List[str]:
+        """Fail unfinished jobs whose lease ran out or whose owner on this
+        machine has exited; their unfinished hosts get an error result."""
+        db = self._db()
+        rows = db.execute(
+            "SELECT job_id, worker, COALESCE(heartbeat_at, 0) FROM jobs WHERE completed = 0 AND dispatch != ?",
+            (_QUEUED,),
+        ).fetchall()
+        stale_before = time.time() - self.lease_seconds
+        failed = []
+        for job_id, worker, heartbeat_at in rows:
+            if worker == self.owner:
+                continue
+            if heartbeat_at < stale_before or not _owner_alive(worker):
+                if self._abandon(db, job_id, worker):
+                    failed.append(job_id)
+        return failed
+
+    # -- internals --------------------------------------------------------
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(max(0.1, self.lease_seconds / 3))
+            try:
+                self.heartbeat()
+            except Exception:
+                pass
+
+    def _abandon(self, db: sqlite3.Connection, job_id: str, worker: Optional[str]) -> bool:
+        """Fail the unfinished hosts of a job whose owner is gone and complete it."""
+        error = {"ok": False, "error": f"Abandoned: {worker or 'its process'} stopped before this host finished",
+                 "stdout": "", "stderr": "", "exit_code": None}
+        size = HostResult.from_dict(error).size_bytes()
+        with _Transaction(db):
+            if db.execute("SELECT completed FROM jobs WHERE job_id = ?", (job_id,)).fetchone() != (0,):
+                db.execute("ROLLBACK")
+                return False
+            seq = self._next_seq(db, job_id)
+            hosts = db.execute(
+                "UPDATE hosts SET status = 'failed', result = ?, result_bytes = ?, seq = ? "
+                "WHERE job_id = ? AND result IS NULL",
+                (json.dumps(error), size, seq, job_id),
+            ).rowcount
+            db.execute(
+                "UPDATE jobs SET completed = 1, completed_at = ?, seq = seq + 1, retained_bytes = retained_bytes + ? "
+                "WHERE job_id = ?",
+                (time.time(), hosts * size, job_id),
+            )
+            db.execute("UPDATE counters SET value = value + ? WHERE name = 'bytes'", (hosts * size,))
+        self._notify()
+        return True
+
+    def _db(self) -> sqlite3.Connection:
+        """This thread's connection (sqlite3 connections are not shared between threads)."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode = WAL")
+            db.execute("PRAGMA synchronous = NORMAL")
+            self._local.db = db
+        return db
+
+    def _insert(self, job_id: str, ips: List[str], command: str, dispatch: int, probe: Optional[bool] = None):
+        now = time.time()
+        db = self._db()
+        # Inline jobs are run, and kept alive, by the process creating them
+        worker, heartbeat_at = (self.owner, now) if dispatch == _INLINE else (None, None)
+        with _Transaction(db):
+            db.execute(
+                "INSERT INTO jobs (job_id, created_at, command, ips, accessed_at, dispatch, probe, worker, "
+                "heartbeat_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, now, command, json.dumps(ips), now, dispatch, None if probe is None else int(probe),
+                 worker, heartbeat_at),
+            )
+            db.executemany(
+                "INSERT OR IGNORE INTO hosts (job_id, ip, status) VALUES (?, ?, 'queued')",
+                [(job_id, ip) for ip in ips],
+            )
+
+    def _track(self, job_id: str):
+        """Start holding live output and progress for a job run by this process."""
+        with self._lock:
+            self._live[job_id] = {}
+            self._progress[job_id] = {}
+
+    def _next_seq(self, db: sqlite3.Connection, job_id: str) -> Optional[int]:
+        """Bump and return the job's sequence; None if the job is gone. Inside a transaction."""
+        if not db.execute("UPDATE jobs SET seq = seq + 1 WHERE job_id = ?", (job_id,)).rowcount:
+            return None
+        return db.execute("SELECT seq FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+
+    def _acquire_output(self, db: sqlite3.Connection, job_id: str, text: str) -> Tuple[Optional[str], int]:
+        """Reference text in the job's outputs; its digest, and its size if it is new."""
+        if not text:
+            return None, 0
+        encoded = text.encode("utf-8", "surrogatepass")
+        digest = hashlib.blake2b(encoded, digest_size=16).hexdigest()
+        cur = db.execute("UPDATE outputs SET refs = refs + 1 WHERE job_id = ? AND digest = ?", (job_id, digest))
+        if cur.rowcount:
+            return digest, 0
+        db.execute("INSERT INTO outputs (job_id, digest, body, refs) VALUES (?, ?, ?, 1)", (job_id, digest, text))
+        return digest, len(encoded)
+
+    def _release_output(self, db: sqlite3.Connection, job_id: str, digest: Optional[str]) -> int:
+        """Drop one reference to an output; returns its size if that was the last."""
+        if digest is None:
+            return 0
+        row = db.execute(
+            "SELECT refs, length(CAST(body AS BLOB)) FROM outputs WHERE job_id = ? AND digest = ?", (job_id, digest)
+        ).fetchone()
+        if row is None:
+            return 0
+        if row[0] > 1:
+            db.execute("UPDATE outputs SET refs = refs - 1 WHERE job_id = ? AND digest = ?", (job_id, digest))
+            return 0
+        db.execute("DELETE FROM outputs WHERE job_id = ? AND digest = ?", (job_id, digest))
+        return row[1]
+
+    def _job_row(self, db: sqlite3.Connection, job_id: str) -> Optional[Dict]:
+        row = db.execute(
+            "SELECT created_at, command, ips, completed, completed_at, seq, retained_bytes, accessed_at "
+            "FROM jobs WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        created_at, command, ips, completed, completed_at, seq, retained, accessed_at = row
+        now = time.time()
+        if now - accessed_at > 1:
+            # LRU order for eviction; coarse so polls do not all become writes
+            db.execute("UPDATE jobs SET accessed_at = ? WHERE job_id = ?", (now, job_id))
+        job = {
+            "jobId": job_id,
+            "createdAt": created_at,
+            "command": command,
+            "ips": json.loads(ips),
+            "completed": bool(completed),
+            "seq": seq,
+            "retainedBytes": retained,
+        }
+        if completed_at is not None:
+            job["completedAt"] = completed_at
+        return job
+
+    def _evict_over_cap(self) -> List[str]:
+        """Evict least recently viewed finished jobs until under max_bytes."""
+        db = self._db()
+        evicted = []
+        while db.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0] > self.max_bytes:
+            row = db.execute(
+                "SELECT job_id FROM jobs WHERE completed = 1 ORDER BY accessed_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            if self._delete(db, row[0]):
+                evicted.append(row[0])
+        return evicted
+
+    def _delete(self, db: sqlite3.Connection, job_id: str) -> bool:
+        """Remove a job and its hosts; False if another process already did."""
+        with _Transaction(db):
+            row = db.execute("SELECT retained_bytes FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                db.execute("ROLLBACK")
+                return False
+            db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            db.execute("DELETE FROM hosts WHERE job_id = ?", (job_id,))
+            db.execute("DELETE FROM outputs WHERE job_id = ?", (job_id,))
+            db.execute("UPDATE counters SET value = value - ? WHERE name = 'bytes'", (row[0],))
+            db.execute("UPDATE counters SET value = value + 1 WHERE name = 'evicted'")
+        with self._lock:
+            self._live.pop(job_id, None)
+            self._progress.pop(job_id, None)
+        self._notify()
+        return True
+
+    def _notify(self):
+        with self._changes:
+            self._changes.notify_all()
+
+
+def _owner_alive(worker: Optional[str]) -> bool:
+    """False only for an owner on this machine whose process no longer exists."""
+    host, _, pid = (worker or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def _with_outputs(result: str, stdout: Optional[str], stderr: Optional[str]) -> Dict:
+    """A stored host result with its stdout/stderr put back in."""
+    res = json.loads(result)
+    res["stdout"] = stdout or ""
+    res["stderr"] = stderr or ""
+    return res
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error; the body may ROLLBACK itself.
+
+    IMMEDIATE takes the write lock up front, so a read-then-update inside
+    cannot interleave with another process's. That is also why the store
+    gets by without UPDATE/DELETE ... RETURNING, which older system SQLite
+    builds (before 3.35) do not have.
+    """
+
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.db.in_transaction:
+            return False
+        self.db.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
@@ -0,0 +1,255 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Seconds; spans a local channel open up to a long transfer
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {_format_value(round(total, 6))}"
+            yield f"{self.name}_count{_format_labels(key)} {count}"
+
+
+class Gauge:
+    """Value read at scrape time from a callback returning a number or {labels: number}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], object]):
+        self.name = name
+        self.help = help_text
+        self.read = read
+
+    def samples(self) -> Iterator[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return
+        if isinstance(value, dict):
+            for labels, v in sorted(value.items()):
+                yield f"{self.name}{_format_labels(_label_key(dict(labels)))} {_format_value(v)}"
+        elif value is not None:
+            yield f"{self.name} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    """Named metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], object]) -> Gauge:
+        """Register (or replace, e.g. for a re-created app) a scrape-time gauge."""
+        gauge = Gauge(name, help_text, read)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+
+REGISTRY = MetricsRegistry()
+
+PHASE_SECONDS = REGISTRY.histogram(
+    "fleet_phase_seconds", "Time spent per host operation phase (queue, connect, kex, auth, command, transfer, ...)"
+)
+SSH_CONNECTS = REGISTRY.counter("fleet_ssh_connects_total", "New SSH connections (TCP connect, key exchange and auth)")
+SSH_FAILURES = REGISTRY.counter("fleet_ssh_failures_total", "Failed SSH/SFTP operations by error class")
+TRANSFER_BYTES = REGISTRY.counter("fleet_transfer_bytes_total", "File bytes moved by direction (upload, download)")
+
+# Phase timings of the host operation running in this thread or asyncio task
+_current: ContextVar[Optional[Dict[str, float]]] = ContextVar("phase_timings", default=None)
+# Scheduler wait of the task about to run, claimed by the first collector it opens
+_queue_wait: ContextVar[Optional[float]] = ContextVar("queue_wait", default=None)
+
+
+@contextmanager
+def collect(timings: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, float]]:
+    """Record phases timed in this thread/task into timings (seconds per phase).
+
+    Without timings, an operation already being collected keeps collecting
+    into its own dict (so nested runs add to the outer host result);
+    otherwise a new dict is started.
+    """
+    if timings is None:
+        active = _current.get()
+        if active is not None:
+            yield active
+            return
+        timings = {}
+    waited = _queue_wait.get()
+    if waited is not None:
+        _queue_wait.set(None)
+        _add(timings, "queue", waited)
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def phase(name: str):
+    """Time the block as phase `name` of the current host operation."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - started)
+
+
+def add_phase(name: str, seconds: float):
+    PHASE_SECONDS.observe(seconds, phase=name)
+    timings = _current.get()
+    if timings is not None:
+        _add(timings, name, seconds)
+
+
+@contextmanager
+def queued(seconds: float):
+    """Mark the task about to run as having waited `seconds` in a queue."""
+    PHASE_SECONDS.observe(seconds, phase="queue")
+    token = _queue_wait.set(seconds)
+    try:
+        yield
+    finally:
+        _queue_wait.reset(token)
+
+
+def count_failure(error: BaseException):
+    SSH_FAILURES.inc(error=type(error).__name__)
+
+
+def summarize(results: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Per-phase count, mean, p50, p95 and max over host results' `timings`."""
+    values: Dict[str, List[float]] = {}
+    for res in results.values():
+        for name, seconds in ((res or {}).get("timings") or {}).items():
+            values.setdefault(name, []).append(seconds)
+    summary = {}
+    for name, vals in sorted(values.items()):
+        vals.sort()
+        summary[name] = {
+            "count": len(vals),
+            "mean": round(sum(vals) / len(vals), 4),
+            "p50": vals[(len(vals) - 1) // 2],
+            "p95": vals[min(len(vals) - 1, math.ceil(0.95 * len(vals)) - 1)],
+            "max": vals[-1],
+        }
+    return summary
+
+
+def _add(timings: Dict[str, float], name: str, seconds: float):
+    timings[name] = round(timings.get(name, 0.0) + seconds, 4)
@@ -0,0 +1,105 @@
+import os
+import threading
+from typing import Optional, Tuple
+
+
+class OutputBuffer:
+    """Bounded capture of one output stream: the first `head_bytes` and the
+    last `tail_bytes` are kept in memory, everything in between is dropped.
+
+    If `spill_path` is set, every byte is also appended to that file so the
+    full log survives truncation. Writes come from the SSH reader thread
+    while job polls read previews, so access is guarded by a lock.
+    """
+
+    __slots__ = ("head_bytes", "tail_bytes", "spill_path", "total_bytes", "_head", "_tail", "_spill", "_lock")
+
+    def __init__(self, head_bytes: int = 64 * 1024, tail_bytes: int = 64 * 1024, spill_path: Optional[str] = None):
+        self.head_bytes = max(0, head_bytes)
+        self.tail_bytes = max(0, tail_bytes)
+        self.spill_path = spill_path
+        self.total_bytes = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._spill = None
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        with self._lock:
+            self.total_bytes += len(data)
+            if self.spill_path:
+                if self._spill is None:
+                    os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+                    self._spill = open(self.spill_path, "ab")
+                self._spill.write(data)
+            room = self.head_bytes - len(self._head)
+            if room > 0:
+                self._head += data[:room]
+                data = data[room:]
+            if data and self.tail_bytes:
+                self._tail += data
+                # Trim lazily so the ring costs amortised O(1) per byte
+                if len(self._tail) > 2 * self.tail_bytes:
+                    del self._tail[:-self.tail_bytes]
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_bytes > self.head_bytes + self.tail_bytes
+
+    def text(self) -> str:
+        """Head and tail decoded, with a marker where bytes were dropped."""
+        with self._lock:
+            head = bytes(self._head)
+            tail = bytes(self._tail[-self.tail_bytes:]) if self.tail_bytes else b""
+            dropped = self.total_bytes - len(head) - len(tail)
+        if dropped > 0:
+            marker = f"\n... [{dropped} bytes truncated] ...\n".encode()
+            return (head + marker + tail).decode("utf-8", errors="replace")
+        return (head + tail).decode("utf-8", errors="replace")
+
+    def latest(self, limit: int) -> str:
+        """The most recent `limit` bytes, for showing progress of a running command."""
+        with self._lock:
+            if self._tail:
+                data = bytes(self._tail[-limit:])
+                contiguous = self.total_bytes == len(self._head) + len(self._tail)
+                if len(data) < limit and contiguous:
+                    data = bytes(self._head[-(limit - len(data)):]) + data
+            else:
+                data = bytes(self._head[-limit:])
+        return data.decode("utf-8", errors="replace")
+
+    def read_since(self, offset: int, limit: int) -> Tuple[str, int]:
+        """Output written after byte `offset`, and the offset to resume from.
+
+        Bytes that have already been dropped from memory are replaced by a
+        marker; at most the last `limit` bytes are returned.
+        """
+        with self._lock:
+            total = self.total_bytes
+            if offset >= total:
+                return "", total
+            parts = []
+            if offset < len(self._head):
+                parts.append(bytes(self._head[offset:]))
+                offset = len(self._head)
+            tail_start = total - len(self._tail)
+            if offset < tail_start:
+                parts.append(f"\n... [{tail_start - offset} bytes skipped] ...\n".encode())
+                offset = tail_start
+            parts.append(bytes(self._tail[offset - tail_start:]))
+        data = b"".join(parts)
+        if len(data) > limit:
+            data = data[-limit:]
+        return data.decode("utf-8", errors="replace"), total
+
+    def close(self):
+        with self._lock:
+            if self._spill is not None:
+                try:
+                    self._spill.close()
+                except Exception:
+                    pass
+                self._spill = None
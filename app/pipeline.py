@@ -0,0 +1,293 @@
+import select
+import shlex
+import socket
+import time
+import uuid
+from contextlib import ExitStack
+from typing import Dict, List, Optional
+
+import paramiko
+
+from . import metrics
+from .output_buffer import OutputBuffer
+from .ssh_executor import READ_CHUNK_BYTES, output_result, wrap_login_shell
+from .ssh_pool import SSHConnectionPool
+
+# Seconds to wait for the exit status of a shell that a step ended (exit, exec, ...)
+_EXIT_STATUS_WAIT = 5
+
+
+class Step:
+    """One command of a pipeline, with its own timeout and failure policy."""
+
+    __slots__ = ("command", "name", "timeout", "continue_on_failure")
+
+    def __init__(self, command: str, name: Optional[str] = None, timeout: float = 30,
+                 continue_on_failure: bool = False):
+        self.command = command
+        self.name = name
+        self.timeout = timeout
+        self.continue_on_failure = continue_on_failure
+
+
+def parse_steps(raw, default_timeout: float) -> List[Step]:
+    """Steps from an API request: command strings or objects with `command`,
+    optional `name`, `timeout` (seconds) and `continueOnFailure`.
+    Raises ValueError describing the first invalid step.
+    """
+    if not raw or not isinstance(raw, list):
+        raise ValueError("Provide a list of steps.")
+    steps = []
+    for i, spec in enumerate(raw, 1):
+        if isinstance(spec, str):
+            spec = {"command": spec}
+        if not isinstance(spec, dict):
+            raise ValueError(f"Step {i}: expected a command or an object.")
+        command = spec.get("command")
+        if not isinstance(command, str) or not command.strip():
+            raise ValueError(f"Step {i}: command is required.")
+        timeout = spec.get("timeout", default_timeout)
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise ValueError(f"Step {i}: timeout must be a positive number of seconds.")
+        name = spec.get("name")
+        steps.append(Step(
+            command=command.strip(),
+            name=str(name) if name else None,
+            timeout=float(timeout),
+            continue_on_failure=spec.get("continueOnFailure") in (True, 1, "1", "true", "yes", "on"),
+        ))
+    return steps
+
+
+def run_pipeline_on_host(
+    host: str,
+    port: int,
+    username: str,
+    password: Optional[str],
+    pkey: Optional[paramiko.PKey],
+    steps: List[Step],
+    timeout: int,
+    pool: SSHConnectionPool,
+    stdout_buffer: Optional[OutputBuffer] = None,
+    stderr_buffer: Optional[OutputBuffer] = None,
+    head_bytes: int = 64 * 1024,
+    tail_bytes: int = 64 * 1024,
+) -> Dict:
+    """Run steps in order on one pooled connection and one login shell.
+
+    Returns a host result whose `steps` list has each step's status
+    (completed, failed, timeout or skipped), exit code, output and seconds;
+    `stdout`/`stderr` hold every step's output under a `$ command` header
+    (also written to the given buffers as it arrives, for live views).
+    The host is ok unless a step without `continue_on_failure` failed;
+    that step is named in `failed_step` and the ones after it are skipped.
+    `timeout` bounds connecting; each step has its own.
+    """
+    out_buf = stdout_buffer if stdout_buffer is not None else OutputBuffer(head_bytes, tail_bytes)
+    err_buf = stderr_buffer if stderr_buffer is not None else OutputBuffer(head_bytes, tail_bytes)
+    with metrics.collect() as timings:
+        try:
+            result = _run(host, port, username, password, pkey, steps, timeout, pool, out_buf, err_buf,
+                          head_bytes, tail_bytes)
+        finally:
+            out_buf.close()
+            err_buf.close()
+    result["timings"] = dict(timings)
+    return result
+
+
+def _run(host, port, username, password, pkey, steps, timeout, pool, out_buf, err_buf, head_bytes, tail_bytes):
+    token = uuid.uuid4().hex
+    records = []
+    shell = None
+    failed_step = None
+    with ExitStack() as session:
+        for index, step in enumerate(steps):
+            record = {"command": step.command}
+            if step.name:
+                record["name"] = step.name
+            records.append(record)
+            if failed_step is not None:
+                record.update(status="skipped", ok=False, exit_code=None)
+                continue
+            header = f"$ {step.command}\n".encode()
+            out_buf.write(header)
+            step_out = OutputBuffer(head_bytes, tail_bytes)
+            step_err = OutputBuffer(head_bytes, tail_bytes)
+            started = time.perf_counter()
+            status = None
+            try:
+                if shell is None:
+                    session.close()
+                    chan = session.enter_context(pool.session(host, port, username, password, pkey, timeout))
+                    shell = _Shell(chan, token)
+                exit_code = shell.run(index, step, (step_out, out_buf), (step_err, _Headed(err_buf, header)))
+            except (paramiko.SSHException, socket.error) as e:
+                if not records[:-1]:
+                    # Nothing ran: report the host like a failed plain command
+                    raise RuntimeError(f"SSH error: {e}")
+                exit_code, status, shell = None, "failed", None
+                record["error"] = f"SSH error: {e}"
+            seconds = time.perf_counter() - started
+            metrics.add_phase("command", seconds)
+            record.update(output_result(exit_code, step_out, step_err))
+            if status is None:
+                status = "timeout" if shell.timed_out else ("completed" if exit_code == 0 else "failed")
+            if status == "timeout":
+                record["error"] = f"Step timed out after {step.timeout:g}s"
+            record.update(status=status, seconds=round(seconds, 3))
+            if shell is not None and not shell.alive:
+                # The step ended or outlived the shell; a later step gets a fresh one
+                shell = None
+            if status != "completed" and not step.continue_on_failure:
+                failed_step = step.name or index + 1
+            if not _ends_with_newline(step_out):
+                out_buf.write(b"\n")
+            if not _ends_with_newline(step_err):
+                err_buf.write(b"\n")
+    ran = [r for r in records if r["status"] != "skipped"]
+    result = output_result(ran[-1]["exit_code"] if ran else None, out_buf, err_buf)
+    result["ok"] = failed_step is None
+    result["steps"] = records
+    if failed_step is not None:
+        result["failed_step"] = failed_step
+    return result
+
+
+def _ends_with_newline(buf: OutputBuffer) -> bool:
+    return not buf.total_bytes or buf.latest(1) == "\n"
+
+
+class _Headed:
+    """Sink that writes a step's header line before its first output."""
+
+    __slots__ = ("buf", "header")
+
+    def __init__(self, buf: OutputBuffer, header: bytes):
+        self.buf = buf
+        self.header = header
+
+    def write(self, data: bytes):
+        if data and self.header:
+            self.buf.write(self.header)
+            self.header = None
+        self.buf.write(data)
+
+
+class _Shell:
+    """A login bash on one channel, reading steps from stdin one at a time.
+
+    Each step is sent as `eval <quoted command> </dev/null` followed by
+    printf of a sentinel line on stdout (carrying `$?`) and on stderr; the
+    step is over once both have arrived. Steps share the shell, so `cd` and
+    exported variables carry over, and the login profile is sourced once.
+    Commands never see the shell's stdin, so they cannot swallow later steps.
+    """
+
+    def __init__(self, chan: paramiko.Channel, token: str):
+        self.chan = chan
+        self.token = token
+        self.alive = True
+        self.timed_out = False
+        self._carry = (b"", b"")
+        with metrics.phase("exec"):
+            chan.exec_command(wrap_login_shell("exec /bin/bash -s"))
+        chan.setblocking(False)
+
+    def run(self, index: int, step: Step, out_sinks, err_sinks) -> Optional[int]:
+        """Run one step, writing its output to the sinks; its exit code, or
+        None when it timed out (the shell is then unusable)."""
+        marker = f"{self.token}:{index}"
+        self.timed_out = False
+        line = (
+            f"eval {shlex.quote(step.command)} </dev/null; "
+            f"printf '\\n%s %d\\n' {marker} $?; printf '\\n%s\\n' {marker} >&2\n"
+        )
+        chan = self.chan
+        chan.sendall(line.encode())
+        out = _Framer(f"\n{marker} ".encode(), out_sinks, with_status=True)
+        err = _Framer(f"\n{marker}\n".encode(), err_sinks)
+        out.feed(self._carry[0])
+        err.feed(self._carry[1])
+        deadline = time.monotonic() + step.timeout
+        while not (out.done and err.done):
+            got = False
+            while chan.recv_ready():
+                out.feed(chan.recv(READ_CHUNK_BYTES))
+                got = True
+            while chan.recv_stderr_ready():
+                err.feed(chan.recv_stderr(READ_CHUNK_BYTES))
+                got = True
+            if got:
+                continue
+            if chan.closed or chan.eof_received:
+                # The step ended the shell (exit, exec, a fatal error): its status is the step's
+                out.flush()
+                err.flush()
+                self.alive = False
+                chan.status_event.wait(_EXIT_STATUS_WAIT)
+                return chan.exit_status if chan.exit_status_ready() else None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                out.flush()
+                err.flush()
+                self.alive = False
+                self.timed_out = True
+                return None
+            select.select([chan], [], [], remaining)
+        self._carry = (out.leftover, err.leftover)
+        return out.status
+
+
+class _Framer:
+    """Cuts one step's output off a shell stream at its sentinel.
+
+    Bytes that could be the start of the sentinel are held back until the
+    next read settles it; the newline printf puts before the sentinel is
+    dropped, so the step's output comes through byte for byte.
+    """
+
+    __slots__ = ("marker", "sinks", "with_status", "pending", "done", "status", "leftover")
+
+    def __init__(self, marker: bytes, sinks, with_status: bool = False):
+        self.marker = marker
+        self.sinks = sinks
+        self.with_status = with_status
+        self.pending = b""
+        self.done = False
+        self.status: Optional[int] = None
+        self.leftover = b""
+
+    def feed(self, data: bytes):
+        if self.done:
+            # Written after the sentinel by something the step left running
+            self.leftover += data
+            return
+        self.pending += data
+        at = self.pending.find(self.marker)
+        if at < 0:
+            keep = len(self.pending) - (len(self.marker) - 1)
+            if keep > 0:
+                self._write(self.pending[:keep])
+                self.pending = self.pending[keep:]
+            return
+        self._write(self.pending[:at])
+        self.pending = self.pending[at:]
+        end = len(self.marker)
+        if self.with_status:
+            end = self.pending.find(b"\n", len(self.marker))
+            if end < 0:
+                return
+            self.status = int(self.pending[len(self.marker):end])
+            end += 1
+        self.leftover = self.pending[end:]
+        self.pending = b""
+        self.done = True
+
+    def flush(self):
+        self._write(self.pending)
+        self.pending = b""
+
+    def _write(self, data: bytes):
+        for sink in self.sinks:
+            sink.write(data)
@@ -0,0 +1,103 @@
+import errno
+import os
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple
+
+from . import metrics
+
+# connect_ex results meaning "in progress" on a non-blocking socket (EWOULDBLOCK on Windows)
+_IN_PROGRESS = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, errno.EALREADY}
+
+PROBE_UNREACHABLE = metrics.REGISTRY.counter(
+    "fleet_probe_unreachable_total", "Hosts the TCP pre-probe found unreachable (cached answers not counted)"
+)
+
+
+class TCPProber:
+    """Pre-flight check that targets accept a TCP connection on the SSH port.
+
+    Every host is probed at once with non-blocking connects multiplexed on
+    one selector, so a list with dead or firewalled IPs costs at most
+    `timeout` instead of the SSH timeout per host and ties up no workers.
+    Answers (reachable or not) are cached for `ttl` seconds, so repeated
+    runs skip known-dead hosts without waiting again. At most `max_sockets`
+    connects are in flight; the rest start as those finish.
+    """
+
+    def __init__(self, timeout: float = 1.5, ttl: float = 30, max_sockets: int = 1024):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_sockets = max(1, max_sockets)
+        self._cache: Dict[Tuple[str, int], Tuple[Optional[str], float]] = {}
+        self._lock = threading.Lock()
+
+    def unreachable(self, ips: Iterable[str], port: int) -> Dict[str, str]:
+        """{ip: reason} for the hosts that did not accept a connection on port."""
+        now = time.monotonic()
+        found: Dict[str, str] = {}
+        todo = []
+        with self._lock:
+            for ip in dict.fromkeys(ips):
+                cached = self._cache.get((ip, port))
+                if cached is None or cached[1] <= now:
+                    todo.append(ip)
+                elif cached[0] is not None:
+                    found[ip] = cached[0]
+        if not todo:
+            return found
+        answers = self._probe(todo, port)
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            # Drop stale answers now and then so the cache does not grow with every IP ever seen
+            if len(self._cache) > 4 * self.max_sockets:
+                self._cache = {k: v for k, v in self._cache.items() if v[1] > now}
+            for ip, reason in answers.items():
+                self._cache[(ip, port)] = (reason, expires)
+        for ip, reason in answers.items():
+            if reason is not None:
+                found[ip] = reason
+                PROBE_UNREACHABLE.inc()
+        return found
+
+    def _probe(self, ips, port: int) -> Dict[str, Optional[str]]:
+        """Connect to every ip at once; None for hosts that answered, else the reason."""
+        answers: Dict[str, Optional[str]] = {}
+        pending = deque(ips)
+        selector = selectors.DefaultSelector()
+        timed_out = f"No answer on port {port} within {self.timeout:g}s"
+        with metrics.phase("probe"):
+            try:
+                while pending or selector.get_map():
+                    while pending and len(selector.get_map()) < self.max_sockets:
+                        ip = pending.popleft()
+                        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                        sock.setblocking(False)
+                        err = sock.connect_ex((ip, port))
+                        if err in _IN_PROGRESS:
+                            selector.register(sock, selectors.EVENT_WRITE, (ip, time.monotonic() + self.timeout))
+                            continue
+                        answers[ip] = os.strerror(err) if err else None
+                        sock.close()
+                    if not selector.get_map():
+                        continue
+                    now = time.monotonic()
+                    first_deadline = min(key.data[1] for key in selector.get_map().values())
+                    for key, _ in selector.select(max(0.0, first_deadline - now)):
+                        err = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                        answers[key.data[0]] = os.strerror(err) if err else None
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+                    now = time.monotonic()
+                    for key in [k for k in selector.get_map().values() if k.data[1] <= now]:
+                        answers[key.data[0]] = timed_out
+                        selector.unregister(key.fileobj)
+                        key.fileobj.close()
+            finally:
+                for key in list(selector.get_map().values()):
+                    key.fileobj.close()
+                selector.close()
+        return answers
@@ -0,0 +1,168 @@
+import shlex
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics
+from .file_ops import FileDistribution
+from .sftp_transfer import transfer_stats
+
+# ssh options on the relaying host for each host key policy
+_HOST_KEY_OPTIONS = {
+    "off": "-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null",
+    "accept-new": "-o StrictHostKeyChecking=accept-new",
+    "strict": "-o StrictHostKeyChecking=yes",
+}
+
+
+def plan_relay(ips: List[str], seeds: int, fanout: int) -> Tuple[List[str], Dict[str, List[str]]]:
+    """Lay targets out as a relay tree: returns (seed hosts, children by host).
+
+    The first `seeds` hosts receive the file from the server; every host then
+    forwards to up to `fanout` children, assigned breadth-first so the tree
+    stays shallow. fanout=1 gives one chain per seed.
+    """
+    seeds = max(1, min(seeds, len(ips)))
+    fanout = max(1, fanout)
+    roots = ips[:seeds]
+    children: Dict[str, List[str]] = {ip: [] for ip in ips}
+    frontier = list(roots)
+    head = 0
+    for ip in ips[seeds:]:
+        while len(children[frontier[head]]) >= fanout:
+            head += 1
+        children[frontier[head]].append(ip)
+        frontier.append(ip)
+    return roots, children
+
+
+class RelayDistribution:
+    """Distribute a file host-to-host so server egress stays at `seeds` copies.
+
+    Seeds get the file over SFTP from the server. Each host that has the
+    staged file then pipes it to its children over SSH from the host itself
+    (`ssh child 'cat > stage' < stage`), using sshpass when the host has it
+    and key-based auth otherwise. The password reaches sshpass over stdin
+    and a pipe, never a command line or the environment, and the hop checks
+    host keys as SSH_HOST_KEY_POLICY says (against the relaying host's own
+    known_hosts). If a hop fails, the server uploads to that
+    child directly so its subtree still proceeds. A host moves the file into
+    place only after all its children have copied from its staging path.
+    Outcomes are recorded on the FileDistribution.
+    """
+
+    def __init__(self, dist: FileDistribution, local_path: str, file_size: int, relay_timeout: int):
+        self.dist = dist
+        self.local_path = local_path
+        self.file_size = file_size
+        self.relay_timeout = relay_timeout
+        # Hosts holding the staged file: how it got there and the transfer stats
+        self._received: Dict[str, Dict] = {}
+        self._children: Dict[str, List[str]] = {}
+        self._pending_children: Dict[str, int] = {}
+        self._remaining = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def run(self, ips: List[str], seeds: int, fanout: int):
+        roots, self._children = plan_relay(ips, seeds, fanout)
+        self._remaining = len(ips)
+        for ip in roots:
+            self._submit_receive(ip, None)
+        self._done.wait()
+
+    # -- orchestration ----------------------------------------------------
+
+    def _submit_receive(self, ip: str, parent: Optional[str]):
+        self.dist.scheduler.submit(self.dist.op_key, ip, self._receive, ip, parent)
+
+    def _receive(self, ip: str, parent: Optional[str]):
+        with self.dist.timed(ip):
+            self._receive_on(ip, parent)
+
+    def _receive_on(self, ip: str, parent: Optional[str]):
+        """Get the staged file onto ip (from parent, else the server), then fan out."""
+        via = "server"
+        self.dist.started(ip)
+        started = time.monotonic()
+        try:
+            if parent is not None:
+                try:
+                    with metrics.phase("relay"):
+                        self._forward(parent, ip)
+                    via = parent
+                    transfer = transfer_stats(self.file_size, time.monotonic() - started)
+                except Exception:
+                    # Relay hop failed (no trust between hosts, sshpass missing, ...)
+                    transfer = self.dist.upload(ip, self.local_path)
+            else:
+                transfer = self.dist.upload(ip, self.local_path)
+        except Exception as e:
+            self._resolve(ip, {"ok": False, "error": str(e)})
+            # Orphaned children fall back to receiving from the server
+            for child in self._children.get(ip, []):
+                self._submit_receive(child, None)
+            return
+        finally:
+            # ip no longer needs the parent's staged copy
+            self._child_received(parent)
+        children = self._children.get(ip, [])
+        with self._lock:
+            self._pending_children[ip] = len(children)
+            self._received[ip] = {"via": via, "transfer": transfer}
+        if not children:
+            self._submit_finish(ip)
+        for child in children:
+            self._submit_receive(child, ip)
+
+    def _child_received(self, parent: Optional[str]):
+        if parent is None:
+            return
+        with self._lock:
+            left = self._pending_children.get(parent, 0) - 1
+            self._pending_children[parent] = left
+        if left == 0:
+            self._submit_finish(parent)
+
+    def _submit_finish(self, ip: str):
+        self.dist.scheduler.submit(self.dist.op_key, ip, self._finish, ip)
+
+    def _finish(self, ip: str):
+        with self.dist.timed(ip):
+            try:
+                res = self.dist.finish(ip, self._received[ip]["transfer"])
+            except Exception as e:
+                res = {"ok": False, "error": str(e)}
+            self._resolve(ip, res)
+
+    def _resolve(self, ip: str, res: Dict):
+        with self._lock:
+            via = (self._received.get(ip) or {}).get("via")
+        self.dist.record(ip, dict(res, via=via) if via else res)
+        with self._lock:
+            self._remaining -= 1
+            done = self._remaining == 0
+        if done:
+            self._done.set()
+
+    # -- the host-to-host hop -----------------------------------------------
+
+    def _forward(self, parent: str, child: str):
+        """Run the copy on parent, piping its staged file to child over SSH."""
+        d = self.dist
+        stage = shlex.quote(d.stage_path)
+        remote = shlex.quote(f"cat > {stage} && stat -c %s {stage}")
+        policy = d.pool.host_keys.policy if d.pool.host_keys is not None else "off"
+        opts = f"{_HOST_KEY_OPTIONS[policy]} -o ConnectTimeout=10"
+        hop = f"{opts} -p {int(d.port)} {shlex.quote(f'{d.username}@{child}')} {remote} < {stage}"
+        # The password is the first stdin line; printf is a builtin, so it shows up in no argv
+        cmd = (
+            f"IFS= read -r PW || exit 203; "
+            f"if command -v sshpass >/dev/null 2>&1; then "
+            f"sshpass -d 3 ssh {hop} 3< <(printf '%s\\n' \"$PW\"); "
+            f"else ssh -o BatchMode=yes {hop}; fi"
+        )
+        res = d.run(parent, cmd, timeout=self.relay_timeout, stdin_blocks=d.password_stdin())
+        received = (res.get("stdout") or "").strip().splitlines()
+        if not res.get("ok") or not received or received[-1] != str(self.file_size):
+            raise RuntimeError(res.get("stderr") or "Relay copy incomplete")
@@ -1,17 +1,42 @@
 from flask import Blueprint, render_template, request, jsonify, current_app
-from flask import redirect, url_for
+from flask import redirect, url_for, send_file, Response, stream_with_context
+from werkzeug.exceptions import ClientDisconnected
+import json
 import re
+import shutil
+import threading
+import time
 import uuid
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import zlib
+from concurrent.futures import as_completed, wait
+from contextlib import nullcontext
+from functools import partial
 import os
-import paramiko
+from . import metrics
+from .bundle import COMPRESSIONS, BundleDistribution, bundle_suffix, member_path, write_bundle
 from .job_manager import JobManager
-from .ssh_executor import execute_command_on_host
+from .checksum import file_digest
+from .credentials import load_private_key
+from .file_ops import FileDistribution, SAFE_NAME_RE, remote_digest, sftp_source
+from .gather import FORMATS, MIMETYPES, FleetGather
+from .grouping import group_results
+from .output_buffer import OutputBuffer
+from .pipeline import parse_steps, run_pipeline_on_host
+from .relay import RelayDistribution
+from .scheduler import when_all_done
+from .ssh_executor import error_result, execute_command_on_host
+from .upload_stream import MultipartIngest
 
 bp = Blueprint("routes", __name__)
 
 job_manager = JobManager()
 
+# Characters of stdout/stderr per host included in /api/job responses
+UI_OUTPUT_CHARS = 2000
+
+# Hosts listed in the summary line of a streamed /api/execute
+STREAM_SLOWEST_HOSTS = 10
+
 @bp.route("/")
 def index():
     return render_template("index.html")
@@ -39,7 +64,8 @@ def _valid_ipv4(ip: str) -> bool:
 @bp.route("/api/execute", methods=["POST"])
 def api_execute():
     """Execute a shell command across target hosts.
-    Supports sync mode (immediate results) and async mode (pollable job).
+    Supports sync mode (immediate results), stream mode (NDJSON, one line
+    per host as it finishes) and async mode (pollable job).
     """
     data = request.get_json(silent=True) or {}
     ips = data.get("ips") or []
@@ -47,54 +73,20 @@ def api_execute():
     mode = data.get("mode") or data.get("sync")
 
     # Validation
-    errors = []
-    if not ips or not isinstance(ips, list):
-        errors.append("Provide a list of IP addresses.")
-    else:
-        invalid = [ip for ip in ips if not _valid_ipv4(ip)]
-        if invalid:
-            errors.append(f"Invalid IPv4: {', '.join(invalid)}")
+    errors = _ip_errors(ips)
     if not command:
         errors.append("Command is required.")
     if errors:
         return jsonify({"ok": False, "errors": errors}), 400
 
-    max_workers = int(current_app.config.get("MAX_PARALLEL", 30))
-    timeout = int(current_app.config.get("SSH_TIMEOUT_SECONDS", 30))
-    username = current_app.config.get("SSH_USERNAME", "user")
-    password = current_app.config.get("SSH_PASSWORD", "palmedia1")
-    port = int(current_app.config.get("SSH_DEFAULT_PORT", 22))
+    probe = _flag(data.get("probe"), current_app.config.get("PREFLIGHT_PROBE", False))
+
+    if mode == "stream":
+        return _stream_execute(ips, command, probe)
 
     # Synchronous mode: execute and return results immediately (no polling)
-    if mode in (True, "sync", "SYNC", "immediate"):
-        results = {}
-        statuses = {}
-        with ThreadPoolExecutor(max_workers=max_workers) as ex:
-            future_map = {ex.submit(
-                execute_command_on_host,
-                host=ip,
-                port=port,
-                username=username,
-                password=password,
-                private_key=None,
-                command=command,
-                timeout=timeout,
-            ): ip for ip in ips}
-            for fut in as_completed(future_map):
-                ip = future_map[fut]
-                try:
-                    res = fut.result()
-                    results[ip] = res
-                    statuses[ip] = "completed" if res.get("ok") else "failed"
-                except Exception as e:
-                    results[ip] = {
-                        "ok": False,
-                        "error": str(e),
-                        "stdout": "",
-                        "stderr": "",
-                        "exit_code": None,
-                    }
-                    statuses[ip] = "failed"
+    if _is_sync(mode):
+        results, statuses = _run_sync(ips, _command_runner(command), probe)
         return jsonify({
             "ok": True,
             "completed": True,
@@ -104,49 +96,330 @@ def api_execute():
 
     # Async/background mode: create a job and poll
     job_id = str(uuid.uuid4())
-    job_manager.create_job(job_id, ips, command)
+    if current_app.config.get("JOB_DISPATCH") == "worker":
+        # Run by a worker process (python -m app.worker) sharing the job store
+        job_manager.enqueue_job(job_id, ips, command, probe)
+    else:
+        job_manager.create_job(job_id, ips, command)
+        run_execute_job(job_id, ips, command, probe)
+
+    return jsonify({"ok": True, "jobId": job_id})
 
-    def run_for_ip(ip):
-        job_manager.update_status(job_id, ip, "running")
+
+def _ip_errors(ips):
+    """Validation errors for a request's target IP list."""
+    if not ips or not isinstance(ips, list):
+        return ["Provide a list of IP addresses."]
+    invalid = [ip for ip in ips if not _valid_ipv4(ip)]
+    if invalid:
+        return [f"Invalid IPv4: {', '.join(invalid)}"]
+    return []
+
+
+def _run_sync(ips, submit, probe):
+    """Run submit(ip, key) on every host passing the pre-probe and wait for
+    all of them; returns (results, statuses) keyed by IP.
+    """
+    results = {}
+    statuses = {}
+    for ip, reason in _unreachable(ips, probe).items():
+        results[ip] = _unreachable_result(reason)
+        statuses[ip] = "unreachable"
+    sync_key = f"sync-{uuid.uuid4()}"
+    future_map = {submit(ip, sync_key): ip for ip in ips if ip not in results}
+    for fut in as_completed(future_map):
+        ip = future_map[fut]
         try:
-            result = execute_command_on_host(
-                host=ip,
-                port=port,
-                username=username,
-                password=password,
-                private_key=None,
-                command=command,
-                timeout=timeout,
-            )
+            res = fut.result()
+            results[ip] = res
+            statuses[ip] = "completed" if res.get("ok") else "failed"
+        except Exception as e:
+            results[ip] = error_result(e)
+            statuses[ip] = "failed"
+    return results, statuses
+
+
+def _stream_execute(ips, command, probe):
+    """NDJSON response for mode=stream: a line per host as soon as it finishes,
+    then a `summary` line with counts by status, the slowest hosts and the
+    wall time. Gzipped (flushed per line) when the client accepts it.
+    Hosts not yet started when the client goes away are cancelled.
+    """
+    started = time.monotonic()
+    unreachable = _unreachable(ips, probe)
+    submit = _command_runner(command)
+    sync_key = f"sync-{uuid.uuid4()}"
+    future_map = {submit(ip, sync_key): ip for ip in ips if ip not in unreachable}
+
+    def lines():
+        counts = {}
+        seconds = {}
+
+        def line(ip, status, result):
+            counts[status] = counts.get(status, 0) + 1
+            seconds[ip] = round(time.monotonic() - started, 3)
+            return json.dumps({"ip": ip, "status": status, "seconds": seconds[ip], "result": result}) + "\n"
+
+        try:
+            for ip, reason in unreachable.items():
+                yield line(ip, "unreachable", _unreachable_result(reason))
+            for fut in as_completed(future_map):
+                ip = future_map[fut]
+                try:
+                    res = fut.result()
+                    yield line(ip, "completed" if res.get("ok") else "failed", res)
+                except Exception as e:
+                    yield line(ip, "failed", error_result(e))
+            slowest = sorted(seconds.items(), key=lambda item: item[1], reverse=True)[:STREAM_SLOWEST_HOSTS]
+            summary = {
+                "hosts": len(seconds),
+                "counts": counts,
+                "slowest": [{"ip": ip, "seconds": s} for ip, s in slowest],
+                "wallSeconds": round(time.monotonic() - started, 3),
+            }
+            yield json.dumps({"summary": summary}) + "\n"
+        finally:
+            for fut in future_map:
+                fut.cancel()
+
+    body = lines()
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if request.accept_encodings["gzip"]:
+        body = _gzip_chunks(body)
+        headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+    return Response(stream_with_context(body), mimetype="application/x-ndjson", headers=headers)
+
+
+def _gzip_chunks(chunks):
+    """gzip-encode text chunks, flushing after each so it reaches the client at once."""
+    z = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            yield z.compress(chunk.encode()) + z.flush(zlib.Z_SYNC_FLUSH)
+        yield z.flush()
+    finally:
+        chunks.close()
+
+
+def run_execute_job(job_id, ips, command, probe=None):
+    """Fan command out for an existing job, recording each host and finalizing
+    the job when the last one finishes. Returns the per-host futures.
+
+    With probe (default PREFLIGHT_PROBE), hosts failing the TCP pre-probe
+    are recorded as unreachable first and never get an SSH attempt.
+    Needs an app context; used by /api/execute and by worker processes.
+    """
+    return _run_job(job_id, ips, _command_runner(command, job_id), probe)
+
+
+def _run_job(job_id, ips, submit, probe=None):
+    """Run submit(ip, job_id) for every host of an existing job; see run_execute_job."""
+    if probe is None:
+        probe = current_app.config.get("PREFLIGHT_PROBE", False)
+    unreachable = _unreachable(ips, probe)
+    for ip, reason in unreachable.items():
+        job_manager.store_result(job_id, ip, _unreachable_result(reason))
+        job_manager.update_status(job_id, ip, "unreachable")
+
+    def record(ip, fut):
+        try:
+            result = fut.result()
             job_manager.store_result(job_id, ip, result)
             job_manager.update_status(job_id, ip, "completed" if result.get("ok") else "failed")
         except Exception as e:
-            job_manager.store_result(job_id, ip, {
-                "ok": False,
-                "error": str(e),
-                "stdout": "",
-                "stderr": "",
-                "exit_code": None,
-            })
+            job_manager.store_result(job_id, ip, error_result(e))
             job_manager.update_status(job_id, ip, "failed")
 
-    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Finalize from the last completion callback; no worker slot is spent supervising
+    futures = []
+    for ip in ips:
+        if ip in unreachable:
+            continue
+        fut = submit(ip, job_id)
+        fut.add_done_callback(partial(record, ip))
+        futures.append(fut)
+    when_all_done(futures, lambda: job_manager.finalize_job(job_id))
+    return futures
 
-    def supervisor():
-        futures = [executor.submit(run_for_ip, ip) for ip in ips]
-        for _ in as_completed(futures):
-            pass
-        job_manager.finalize_job(job_id)
-        executor.shutdown(wait=False)
 
-    executor.submit(supervisor)
+def _command_runner(command, job_id=None):
+    """submit(ip, key) -> future of command's result on ip, on the configured engine.
+
+    Runs under `key` are scheduled as one job; those of job_id also publish
+    status and live output to the job store.
+    """
+    timeout = int(current_app.config.get("SSH_TIMEOUT_SECONDS", 30))
+    username = current_app.config.get("SSH_USERNAME", "user")
+    password = current_app.config.get("SSH_PASSWORD", "palmedia1")
+    port = int(current_app.config.get("SSH_DEFAULT_PORT", 22))
+    pool = current_app.extensions["ssh_pool"]
+    scheduler = current_app.extensions["scheduler"]
+    head_bytes = int(current_app.config.get("OUTPUT_HEAD_BYTES", 65536))
+    tail_bytes = int(current_app.config.get("OUTPUT_TAIL_BYTES", 65536))
+    log_dir = _job_log_dir() if current_app.config.get("OUTPUT_SPILL_TO_DISK") else None
+
+    # EXECUTION_ENGINE=asyncio runs the fan-out on one event loop instead of worker threads
+    engine = current_app.extensions.get("async_engine")
+
+    def submit(ip, key):
+        # Per-host bounded buffers; async jobs spill the full log to disk when enabled
+        spill = os.path.join(log_dir, key, ip) if log_dir and key == job_id else None
+        out_buf = OutputBuffer(head_bytes, tail_bytes, f"{spill}.stdout.log" if spill else None)
+        err_buf = OutputBuffer(head_bytes, tail_bytes, f"{spill}.stderr.log" if spill else None)
+
+        def started():
+            if key == job_id:
+                job_manager.attach_output(job_id, ip, out_buf, err_buf)
+                job_manager.update_status(job_id, ip, "running")
+
+        if engine is not None:
+            return engine.submit(
+                ip, port, username, password, command, timeout,
+                on_start=started, stdout_buffer=out_buf, stderr_buffer=err_buf,
+            )
+
+        submitted = time.perf_counter()
+
+        def run():
+            result = attempt()
+            # Wall clock from submission, scheduler wait included
+            result["timings"]["total"] = round(time.perf_counter() - submitted, 4)
+            return result
+
+        def attempt():
+            started()
+            # Failed hosts keep the phases they got through (e.g. connect before an auth failure)
+            with metrics.collect() as timings:
+                try:
+                    return execute_command_on_host(
+                        host=ip,
+                        port=port,
+                        username=username,
+                        password=password,
+                        private_key=None,
+                        command=command,
+                        timeout=timeout,
+                        pool=pool,
+                        stdout_buffer=out_buf,
+                        stderr_buffer=err_buf,
+                    )
+                except Exception as e:
+                    return dict(error_result(e), timings=dict(timings))
+
+        return scheduler.submit(key, ip, run)
+
+    return submit
+
+
+def _pipeline_runner(steps, job_id=None):
+    """submit(ip, key) -> future of the pipeline's result on ip; like _command_runner."""
+    timeout = int(current_app.config.get("SSH_TIMEOUT_SECONDS", 30))
+    username = current_app.config.get("SSH_USERNAME", "user")
+    password = current_app.config.get("SSH_PASSWORD", "palmedia1")
+    port = int(current_app.config.get("SSH_DEFAULT_PORT", 22))
+    pool = current_app.extensions["ssh_pool"]
+    scheduler = current_app.extensions["scheduler"]
+    head_bytes = int(current_app.config.get("OUTPUT_HEAD_BYTES", 65536))
+    tail_bytes = int(current_app.config.get("OUTPUT_TAIL_BYTES", 65536))
+
+    def submit(ip, key):
+        out_buf = OutputBuffer(head_bytes, tail_bytes)
+        err_buf = OutputBuffer(head_bytes, tail_bytes)
+
+        def run():
+            if key == job_id:
+                job_manager.attach_output(job_id, ip, out_buf, err_buf)
+                job_manager.update_status(job_id, ip, "running")
+            with metrics.collect() as timings:
+                try:
+                    return run_pipeline_on_host(
+                        ip, port, username, password, None, steps, timeout, pool,
+                        stdout_buffer=out_buf, stderr_buffer=err_buf, head_bytes=head_bytes, tail_bytes=tail_bytes,
+                    )
+                except Exception as e:
+                    return dict(error_result(e), timings=dict(timings))
+
+        return scheduler.submit(key, ip, run)
+
+    return submit
+
+
+@bp.route("/api/pipeline", methods=["POST"])
+def api_pipeline():
+    """Run an ordered list of steps on target hosts, all steps of a host on
+    one SSH connection and one login shell.
+    Each step is a command or {command, name, timeout, continueOnFailure};
+    a failed step stops the host's pipeline unless it may continue. Results
+    carry per-step status, exit code, output and seconds under `steps`.
+    Supports sync mode (immediate results) and async mode (pollable job).
+    """
+    data = request.get_json(silent=True) or {}
+    ips = data.get("ips") or []
+    mode = data.get("mode") or data.get("sync")
+
+    errors = _ip_errors(ips)
+    steps = []
+    try:
+        steps = parse_steps(data.get("steps"), float(current_app.config.get("SSH_TIMEOUT_SECONDS", 30)))
+    except ValueError as e:
+        errors.append(str(e))
+    if errors:
+        return jsonify({"ok": False, "errors": errors}), 400
 
+    probe = _flag(data.get("probe"), current_app.config.get("PREFLIGHT_PROBE", False))
+
+    if _is_sync(mode):
+        results, statuses = _run_sync(ips, _pipeline_runner(steps), probe)
+        return jsonify({
+            "ok": True,
+            "completed": True,
+            "results": results,
+            "statuses": statuses,
+        })
+
+    # Pipelines always run in this process, also with JOB_DISPATCH=worker
+    job_id = str(uuid.uuid4())
+    job_manager.create_job(job_id, ips, "; ".join(step.command for step in steps))
+    _run_job(job_id, ips, _pipeline_runner(steps, job_id), probe)
     return jsonify({"ok": True, "jobId": job_id})
 
 
+def _unreachable(ips, probe):
+    """{ip: reason} for hosts failing the TCP pre-probe of the SSH port; empty unless probe."""
+    if not probe:
+        return {}
+    port = int(current_app.config.get("SSH_DEFAULT_PORT", 22))
+    return current_app.extensions["prober"].unreachable(ips, port)
+
+
+def _unreachable_result(reason):
+    """Host result for a target skipped because the pre-probe could not reach it."""
+    return {"ok": False, "error": f"Unreachable: {reason}", "stdout": "", "stderr": "", "exit_code": None,
+            "unreachable": True}
+
+
+def _is_sync(mode) -> bool:
+    """Whether a request's `mode` asks for results in the response rather than a job."""
+    return mode in (True, "sync", "SYNC", "immediate")
+
+
+def _ui_result(res):
+    """Copy of a host result with stdout/stderr cut down for table display."""
+    t = dict(res)
+    for k in ("stdout", "stderr"):
+        if isinstance(t.get(k), str):
+            s = t[k]
+            t[k] = s[:UI_OUTPUT_CHARS]  # 2KB for UI
+    return t
+
+
 @bp.route("/api/job/<job_id>")
 def api_job(job_id):
-    """Return job status/results for a given job id, with truncated outputs for UI."""
+    """Return job status/results for a given job id, with truncated outputs for UI.
+    Hosts still running report the latest output captured so far.
+    With ?timings=1, `timingSummary` aggregates the per-phase timings of
+    finished hosts (count, mean, p50, p95, max seconds).
+    """
     job = job_manager.get_job(job_id)
     if not job:
         return jsonify({"ok": False, "error": "Job not found"}), 404
@@ -155,34 +428,277 @@ def api_job(job_id):
     for ip, res in job.get("results", {}).items():
         if not res:
             continue
-        t = dict(res)
-        for k in ("stdout", "stderr"):
-            if isinstance(t.get(k), str):
-                s = t[k]
-                t[k] = s[:2000]  # 2KB for UI
-        truncated[ip] = t
+        truncated[ip] = _ui_result(res)
+    for ip, partial_res in job_manager.live_output(job_id, UI_OUTPUT_CHARS).items():
+        truncated.setdefault(ip, partial_res)
     job_view = dict(job)
     job_view["results"] = truncated
+    job_view["progress"] = job_manager.live_progress(job_id)
+    if _flag(request.args.get("timings"), False):
+        job_view["timingSummary"] = metrics.summarize(job.get("results", {}))
     return jsonify({"ok": True, "job": job_view})
 
 
-@bp.route("/api/upload-copy", methods=["POST"])
-def api_upload_copy():
-    """Upload a local file and place it on multiple target hosts.
-    Always uploads to /tmp then uses sudo to move, chown, and chmod at destination.
-    Optional owner/group are validated and applied per host.
+@bp.route("/api/job/<job_id>/groups")
+def api_job_groups(job_id):
+    """Return job results grouped by identical output: each distinct
+    stdout/stderr once (truncated for UI), with the IPs, exit codes and
+    statuses of the hosts that produced it, largest group first.
+    With ?normalize=1, timestamps, syslog hostnames and each host's own IP
+    are masked first, so outputs differing only in those share a group.
     """
-    # Expect multipart/form-data with 'file' and 'ips' (JSON array or delimited string)
-    if "file" not in request.files:
-        return jsonify({"ok": False, "error": "No file uploaded"}), 400
-    file = request.files["file"]
-    ips_raw = (request.form.get("ips") or "").strip()
+    job = job_manager.get_job(job_id)
+    if not job:
+        return jsonify({"ok": False, "error": "Job not found"}), 404
+    groups, pending = group_results(
+        job["ips"], job["statuses"], job.get("results", {}), _flag(request.args.get("normalize"), False)
+    )
+    return jsonify({
+        "ok": True,
+        "jobId": job_id,
+        "completed": job["completed"],
+        "hosts": len(job["ips"]),
+        "groups": [_ui_result(group) for group in groups],
+        "pending": pending,
+    })
+
+
+@bp.route("/api/jobs/stats")
+def api_jobs_stats():
+    """Report retained job count and bytes, plus retention settings."""
+    return jsonify({"ok": True, "stats": job_manager.stats()})
+
+
+@bp.route("/api/job/<job_id>/changes")
+def api_job_changes(job_id):
+    """Long-poll for job deltas: waits up to `wait` seconds for changes after
+    sequence `since`, then returns only the hosts that changed.
+    """
+    since = request.args.get("since", 0, type=int)
+    wait_s = min(max(request.args.get("wait", 25, type=float), 0), 60)
+    if job_manager.wait_for_change(job_id, since, wait_s) is None:
+        return jsonify({"ok": False, "error": "Job not found"}), 404
+    changes = job_manager.changes_since(job_id, since)
+    changes["results"] = {ip: _ui_result(res) for ip, res in changes["results"].items()}
+    changes["live"] = job_manager.live_output(job_id, UI_OUTPUT_CHARS)
+    changes["progress"] = job_manager.live_progress(job_id)
+    return jsonify({"ok": True, "changes": changes})
+
+
+@bp.route("/api/job/<job_id>/events")
+def api_job_events(job_id):
+    """Server-Sent Events stream of job progress.
+
+    Emits `host` events (status and, once finished, the result) only for
+    hosts that changed, `output` events with new stdout/stderr bytes from
+    running hosts, `progress` events with bytes sent, rate and ETA from
+    running file transfers, and a final `done` event. Event ids are the job sequence,
+    so a reconnecting EventSource resumes from Last-Event-ID.
+    """
+    if job_manager.get_job(job_id) is None:
+        return jsonify({"ok": False, "error": "Job not found"}), 404
+    since = request.headers.get("Last-Event-ID", type=int)
+    if since is None:
+        since = request.args.get("since", 0, type=int)
+    interval = float(current_app.config.get("JOB_EVENTS_INTERVAL_SECONDS", 0.5))
+
+    def sse(event, data, event_id=None):
+        head = f"id: {event_id}\n" if event_id is not None else ""
+        return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+    def generate():
+        seq = since
+        offsets = {}
+        sent = {}
+        idle = 0.0
+        while True:
+            changes = job_manager.changes_since(job_id, seq)
+            if changes is None:
+                return
+            for ip, status in changes["statuses"].items():
+                payload = {"ip": ip, "status": status}
+                res = changes["results"].get(ip)
+                if res is not None:
+                    payload["result"] = _ui_result(res)
+                    offsets.pop(ip, None)
+                yield sse("host", payload, changes["seq"])
+            seq = changes["seq"]
+            for ip, (out, err) in job_manager.live_buffers(job_id).items():
+                out_off, err_off = offsets.get(ip, (0, 0))
+                out_text, out_off = out.read_since(out_off, UI_OUTPUT_CHARS)
+                err_text, err_off = err.read_since(err_off, UI_OUTPUT_CHARS)
+                offsets[ip] = (out_off, err_off)
+                if out_text or err_text:
+                    idle = 0.0
+                    yield sse("output", {"ip": ip, "stdout": out_text, "stderr": err_text})
+            for ip, progress in job_manager.live_progress(job_id).items():
+                if sent.get(ip) != progress["bytesSent"]:
+                    sent[ip] = progress["bytesSent"]
+                    idle = 0.0
+                    yield sse("progress", dict(progress, ip=ip))
+            if changes["completed"]:
+                yield sse("done", {"seq": seq}, seq)
+                return
+            before = seq
+            seq_now = job_manager.wait_for_change(job_id, seq, interval)
+            idle = 0.0 if seq_now != before else idle + interval
+            if idle >= 15:
+                # Comment line keeps proxies from closing an idle stream
+                idle = 0.0
+                yield ": keepalive\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
 
-    # Parse IPs from JSON or split by newline/comma/space
+
+@bp.route("/api/job/<job_id>/log/<ip>")
+def api_job_log(job_id, ip):
+    """Download the full spilled stdout (default) or stderr log of one host."""
+    stream = request.args.get("stream", "stdout")
+    if stream not in ("stdout", "stderr") or not _valid_ipv4(ip):
+        return jsonify({"ok": False, "error": "Invalid log request"}), 400
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return jsonify({"ok": False, "error": "Job not found"}), 404
+    path = os.path.join(_job_log_dir(), job_id, f"{ip}.{stream}.log")
+    if not os.path.isfile(path):
+        return jsonify({"ok": False, "error": "Log not found"}), 404
+    return send_file(path, mimetype="text/plain", as_attachment=True, download_name=f"{ip}.{stream}.log")
+
+
+def _job_log_dir() -> str:
+    return current_app.config.get("OUTPUT_SPILL_DIR") or os.path.join(current_app.instance_path, "job-logs")
+
+
+@bp.route("/metrics")
+def prometheus_metrics():
+    """Prometheus text exposition: phase histograms, SSH counters, job and scheduler gauges."""
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@bp.route("/api/scheduler")
+def api_scheduler():
+    """Report shared scheduler load: queue depth, active workers, per-job counts."""
+    scheduler = current_app.extensions["scheduler"]
+    return jsonify({"ok": True, "scheduler": scheduler.metrics()})
+
+
+def _flag(value, default: bool) -> bool:
+    """Interpret a JSON/form boolean ("1", "true", true, ...), falling back to default."""
+    if value is None or value == "":
+        return bool(default)
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _distribution_options(params):
+    """Parse distribution mode (direct, tree, chain) and relay shape from request params."""
+    mode = str(params.get("distribution") or "direct").strip().lower()
+    if mode not in ("direct", "tree", "chain"):
+        return None, "Invalid distribution mode"
+    try:
+        seeds = int(params.get("seeds") or current_app.config.get("RELAY_SEEDS", 2))
+        fanout = int(params.get("fanout") or current_app.config.get("RELAY_FANOUT", 2))
+    except (TypeError, ValueError):
+        return None, "Invalid seeds/fanout"
+    if mode == "chain":
+        fanout = 1
+    return {
+        "mode": mode,
+        "seeds": max(1, seeds),
+        "fanout": max(1, fanout),
+        "timeout": int(current_app.config.get("RELAY_TIMEOUT_SECONDS", 3600)),
+    }, None
+
+
+def _sync_options(params):
+    """(checksum pre-pass enabled, delta block size or 0) from request params."""
+    delta = _flag(params.get("delta"), current_app.config.get("DELTA_SYNC", False))
+    # Delta sync needs the pre-pass to know which hosts hold an older version
+    skip = delta or _flag(params.get("skipUnchanged"), current_app.config.get("SKIP_UNCHANGED", True))
+    block_bytes = int(current_app.config.get("DELTA_BLOCK_BYTES", 1024 * 1024)) if delta else 0
+    return skip, block_bytes
+
+
+def _distribute(dist, ips, local_path, distribution):
+    """Run a direct or relayed distribution of local_path, recording results on dist.
+
+    Hosts already holding the same bytes (when dist.digest is set) are skipped.
+    """
+    if dist.digest:
+        ips = dist.skip_unchanged(ips)
+    if not ips:
+        return
+    if distribution["mode"] == "direct" or len(ips) <= distribution["seeds"]:
+        dist.distribute(ips, local_path)
+    else:
+        relay = RelayDistribution(dist, local_path, os.path.getsize(local_path), distribution["timeout"])
+        relay.run(ips, distribution["seeds"], distribution["fanout"])
+
+
+def _file_job(dist, ips, description):
+    """Create a job fed by dist's per-host status, result and progress hooks; returns its id."""
+    job_id = str(uuid.uuid4())
+    job_manager.create_job(job_id, ips, description)
+
+    def record(ip, result):
+        job_manager.store_result(job_id, ip, result)
+        job_manager.update_status(job_id, ip, "completed" if result.get("ok") else "failed")
+
+    dist.on_status = partial(job_manager.update_status, job_id)
+    dist.on_result = record
+    dist.on_progress = partial(job_manager.update_progress, job_id)
+    return job_id
+
+
+def _run_file_op(job_id, dist, ips, work, cleanup=None):
+    """Run work(), which records per-host outcomes on dist, then cleanup().
+
+    With a job id this happens on a background thread and the job is
+    finalized at the end; without one it runs inline. Hosts work() never
+    got to (e.g. the source download failed) are recorded as failed.
+    """
+
+    def run():
+        error = "Transfer did not complete"
+        try:
+            work()
+        except Exception as e:
+            error = str(e)
+        finally:
+            if cleanup is not None:
+                cleanup()
+        results, _ = dist.snapshot()
+        for ip in ips:
+            if ip not in results:
+                dist.record(ip, {"ok": False, "error": error})
+        if job_id is not None:
+            job_manager.finalize_job(job_id)
+
+    if job_id is None:
+        run()
+    else:
+        threading.Thread(target=run, name=f"file-op-{job_id[:8]}", daemon=True).start()
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _parse_ips(value):
+    """Target IPs from a list, a JSON array string or a delimited string; returns (ips, error)."""
     ips = []
-    if ips_raw:
+    if isinstance(value, list):
+        ips = [str(x).strip() for x in value if str(x).strip()]
+    elif value:
+        ips_raw = str(value).strip()
+        # Parse IPs from JSON or split by newline/comma/space
         try:
-            import json
             parsed = json.loads(ips_raw)
             if isinstance(parsed, list):
                 ips = [str(x).strip() for x in parsed if str(x).strip()]
@@ -190,113 +706,239 @@ def api_upload_copy():
             ips = [s.strip() for s in re.split(r"\n|\r|,|\s+", ips_raw) if s.strip()]
 
     if not ips:
-        return jsonify({"ok": False, "error": "Provide IP addresses"}), 400
+        return None, "Provide IP addresses"
     invalid = [ip for ip in ips if not _valid_ipv4(ip)]
     if invalid:
-        return jsonify({"ok": False, "error": f"Invalid IPv4: {', '.join(invalid)}"}), 400
+        return None, f"Invalid IPv4: {', '.join(invalid)}"
+    return ips, None
+
 
-    # Save uploaded file to a temp folder under instance/uploads
+def _upload_options(form):
+    """Validate the upload-copy form fields; returns (options, error)."""
+    # 'ips' is a JSON array or delimited string
+    ips, error = _parse_ips(form.get("ips"))
+    if error:
+        return None, error
+
+    # Optional destination directory
+    dest_dir = (form.get("destDir") or "").strip()
+    if not dest_dir:
+        dest_dir = f"/home/{current_app.config.get('SSH_USERNAME', 'user')}"
+    # Optional owner/group for chown
+    owner = (form.get("owner") or "").strip()
+    group = (form.get("group") or "").strip()
+    # Basic format validation to avoid command injection
+    if owner and not SAFE_NAME_RE.match(owner):
+        return None, "Invalid owner format"
+    if group and not SAFE_NAME_RE.match(group):
+        return None, "Invalid group format"
+    distribution, dist_error = _distribution_options(form)
+    if dist_error:
+        return None, dist_error
+    return {"ips": ips, "dest_dir": dest_dir, "owner": owner, "group": group, "distribution": distribution}, None
+
+
+@bp.route("/api/upload-copy", methods=["POST"])
+def api_upload_copy():
+    """Upload a local file and place it on multiple target hosts.
+    The request body is read incrementally. When the form fields come before
+    the file (as the UI sends them), the file is streamed to /tmp on all
+    targets while the upload is still arriving; otherwise it is saved to a
+    local temp file first. Then sudo is used to move, chown, and chmod at
+    destination. Optional owner/group are validated and applied per host.
+    Returns a job id once the upload is received (results inline with
+    mode=sync).
+    """
+    # Expect multipart/form-data with 'file' and 'ips'; parsed here rather than via request.files
+    boundary = request.mimetype_params.get("boundary") if request.mimetype == "multipart/form-data" else None
+    if not boundary:
+        return jsonify({"ok": False, "error": "No file uploaded"}), 400
+    block_bytes = int(current_app.config.get("PIPELINE_BLOCK_BYTES", 1024 * 1024))
+    ingest = MultipartIngest(request.stream, boundary.encode("latin-1"), block_bytes)
+    try:
+        filename = ingest.read_fields()
+    except (ValueError, ClientDisconnected):
+        return jsonify({"ok": False, "error": "Malformed upload"}), 400
+    if filename is None:
+        return jsonify({"ok": False, "error": "No file uploaded"}), 400
+    filename = os.path.basename(filename.replace("\\", "/"))
+    if filename in ("", ".", ".."):
+        filename = "uploaded_file"
+
+    # Local temp file under instance/uploads, unique per request so concurrent
+    # uploads of the same name never share it
     uploads_root = os.path.join(current_app.instance_path, "uploads")
     os.makedirs(uploads_root, exist_ok=True)
-    filename = file.filename or "uploaded_file"
-    tmp_path = os.path.join(uploads_root, filename)
-    file.save(tmp_path)
+    tmp_path = os.path.join(uploads_root, f"upload-{uuid.uuid4()}-{filename}")
+    spooled = "ips" not in ingest.fields
+    try:
+        if spooled:
+            # Fields sent after the file: nothing is known about the targets yet
+            ingest.save_file(tmp_path)
+            ingest.read_rest()
+    except (ValueError, ClientDisconnected):
+        _remove_quietly(tmp_path)
+        return jsonify({"ok": False, "error": "Malformed upload"}), 400
+    fields = ingest.fields
+    options, error = _upload_options(fields)
+    if error:
+        _remove_quietly(tmp_path)
+        return jsonify({"ok": False, "error": error}), 400
 
     username = current_app.config.get("SSH_USERNAME", "user")
     password = current_app.config.get("SSH_PASSWORD", "palmedia1")
     port = int(current_app.config.get("SSH_DEFAULT_PORT", 22))
-    max_workers = int(current_app.config.get("MAX_PARALLEL", 30))
     timeout = int(current_app.config.get("SSH_TIMEOUT_SECONDS", 30))
-    # Optional destination directory
-    dest_dir = (request.form.get("destDir") or "").strip()
-    if not dest_dir:
-        dest_dir = f"/home/{username}"
-    # Optional owner/group for chown
-    owner = (request.form.get("owner") or "").strip()
-    group = (request.form.get("group") or "").strip()
-    # Basic format validation to avoid command injection
-    safe_re = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
-    if owner and not safe_re.match(owner):
-        return jsonify({"ok": False, "error": "Invalid owner format"}), 400
-    if group and not safe_re.match(group):
-        return jsonify({"ok": False, "error": "Invalid group format"}), 400
+    pool = current_app.extensions["ssh_pool"]
+    scheduler = current_app.extensions["scheduler"]
+    buffer_bytes = int(current_app.config.get("PIPELINE_BUFFER_BYTES", 64 * 1024 * 1024))
+    ips, distribution = options["ips"], options["distribution"]
+    skip, delta_block_bytes = _sync_options(fields)
+    # A streamed upload only knows the digest up front if the client sends it
+    digest = (fields.get("sha256") or "").strip().lower()
+    digest = digest if re.fullmatch(r"[0-9a-f]{64}", digest) else None
+    # Relay and delta need the whole file locally, and so does skipping
+    # unchanged hosts without a digest (it is hashed once saved)
+    pipelined = (
+        not spooled
+        and distribution["mode"] == "direct"
+        and not delta_block_bytes
+        and (digest or not skip)
+        and _flag(fields.get("pipelined"), current_app.config.get("UPLOAD_PIPELINED", True))
+    )
+    dist = FileDistribution(
+        pool, scheduler, port, username, password, timeout, filename, options["dest_dir"],
+        options["owner"], options["group"],
+        delta_block_bytes=delta_block_bytes,
+        uploader=current_app.extensions["sftp_uploader"],
+    )
+    if not pipelined and not spooled:
+        try:
+            ingest.save_file(tmp_path)
+            ingest.read_rest()
+        except (ValueError, ClientDisconnected):
+            _remove_quietly(tmp_path)
+            return jsonify({"ok": False, "error": "Malformed upload"}), 400
+    job_id = None if _is_sync(fields.get("mode")) else _file_job(dist, ips, f"upload {filename} -> {dist.dest}")
 
-    results = {}
-    statuses = {}
+    if pipelined:
+        dist.digest = digest if skip else None
+        size = fields.get("size")
+        size = int(size) if size and size.isdigit() else None
+        targets = dist.skip_unchanged(ips) if dist.digest else ips
+        fanout, futures = dist.start_stream(targets, buffer_bytes, spill_path=tmp_path, verify=bool(dist.digest),
+                                            size=size)
+        # Targets are fed while the body arrives; slow ones catch up from the spill file afterwards
+        dist.feed_stream(fanout, lambda: nullcontext(ingest.file_blocks()))
 
-    def sftp_copy(ip):
-        try:
-            transport = paramiko.Transport((ip, port))
-            transport.connect(username=username, password=password)
-            sftp = paramiko.SFTPClient.from_transport(transport)
-            try:
-                dest = f"{dest_dir.rstrip('/')}/{filename}"
-                # Always upload to /tmp first, then move with sudo to destination
-                tmp_remote = f"/tmp/{uuid.uuid4()}-{filename}"
-                sftp.put(tmp_path, tmp_remote)
-                # Determine owner/group to use (default to SSH username)
-                use_owner = owner or username
-                use_group = group or username
-                # Validate existence of owner/group on target before applying
-                move_cmd = (
-                    f'OWNER="{use_owner}"; GROUP="{use_group}"; '
-                    f'id -u "$OWNER" >/dev/null 2>&1 || {{ echo "Owner not found: $OWNER"; exit 200; }}; '
-                    f'getent group "$GROUP" >/dev/null 2>&1 || {{ echo "Group not found: $GROUP"; exit 201; }}; '
-                    f'echo {password} | sudo -S mkdir -p "{dest_dir}" && '
-                    f'echo {password} | sudo -S mv -f "{tmp_remote}" "{dest}" && '
-                    f'echo {password} | sudo -S chown "$OWNER":"$GROUP" "{dest}" && '
-                    f'echo {password} | sudo -S chmod 0664 "{dest}"'
-                )
-                res = execute_command_on_host(
-                    host=ip,
-                    port=port,
-                    username=username,
-                    password=password,
-                    private_key=None,
-                    command=move_cmd,
-                    timeout=timeout,
-                )
-                if not res.get("ok"):
-                    raise Exception(res.get("stderr") or res.get("error") or "Move with sudo failed")
-                statuses[ip] = "completed"
-                results[ip] = {"ok": True, "dest": dest}
-            finally:
-                try:
-                    sftp.close()
-                except Exception:
-                    pass
-                try:
-                    transport.close()
-                except Exception:
-                    pass
-        except Exception as e:
-            statuses[ip] = "failed"
-            results[ip] = {"ok": False, "error": str(e)}
+        def work():
+            wait(futures.values())
+            fanout.discard()
 
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        futmap = {ex.submit(sftp_copy, ip): ip for ip in ips}
-        for _ in as_completed(futmap):
+        _run_file_op(job_id, dist, ips, work, cleanup=partial(_remove_quietly, tmp_path))
+        try:
+            ingest.read_rest()
+        except (ValueError, ClientDisconnected):
+            # A broken or cut-off body already failed the stream writers
             pass
+    else:
+
+        def work():
+            if skip:
+                dist.digest = file_digest(tmp_path)
+            _distribute(dist, ips, tmp_path, distribution)
 
-    # Cleanup temp file
+        _run_file_op(job_id, dist, ips, work, cleanup=partial(_remove_quietly, tmp_path))
+
+    response = {"ok": True, "filename": filename, "distribution": distribution["mode"], "pipelined": pipelined}
+    if job_id is not None:
+        return jsonify(dict(response, jobId=job_id))
+    results, statuses = dist.snapshot()
+    return jsonify(dict(response, completed=True, results=results, statuses=statuses))
+
+
+@bp.route("/api/upload-bundle", methods=["POST"])
+def api_upload_bundle():
+    """Upload several files (or a directory) and unpack them on multiple target hosts.
+    The files are packed into one tar (gzip by default; zstd or none via
+    `compression`) that each host receives over a single SSH channel and
+    extracts with one sudo tar, which applies owner, group and mode. File
+    names may carry relative paths, which are recreated under destDir.
+    Returns a job id (results inline with mode=sync).
+    """
+    boundary = request.mimetype_params.get("boundary") if request.mimetype == "multipart/form-data" else None
+    if not boundary:
+        return jsonify({"ok": False, "error": "No file uploaded"}), 400
+    block_bytes = int(current_app.config.get("PIPELINE_BLOCK_BYTES", 1024 * 1024))
+    ingest = MultipartIngest(request.stream, boundary.encode("latin-1"), block_bytes)
+
+    uploads_root = os.path.join(current_app.instance_path, "uploads")
+    bundle_id = uuid.uuid4()
+    # Uploaded files are spooled here under numbered names until the bundle is written
+    spool_dir = os.path.join(uploads_root, f"bundle-{bundle_id}")
+    os.makedirs(spool_dir, exist_ok=True)
     try:
-        os.remove(tmp_path)
-    except Exception:
-        pass
+        members = {}
+        try:
+            while True:
+                name = ingest.read_fields()
+                if name is None:
+                    break
+                path = member_path(name)
+                if path is None:
+                    return jsonify({"ok": False, "error": f"Invalid file path: {name}"}), 400
+                local = os.path.join(spool_dir, str(len(members)))
+                ingest.save_file(local)
+                # A repeated path keeps the last upload
+                members[path] = local
+        except (ValueError, ClientDisconnected):
+            return jsonify({"ok": False, "error": "Malformed upload"}), 400
+        if not members:
+            return jsonify({"ok": False, "error": "No file uploaded"}), 400
+        fields = ingest.fields
+        options, error = _upload_options(fields)
+        if error:
+            return jsonify({"ok": False, "error": error}), 400
+        compression = (fields.get("compression") or current_app.config.get("BUNDLE_COMPRESSION", "gzip")).strip().lower()
+        if compression not in COMPRESSIONS:
+            return jsonify({"ok": False, "error": "Invalid compression"}), 400
 
-    return jsonify({
-        "ok": True,
-        "completed": True,
-        "results": results,
-        "statuses": statuses,
-        "filename": filename,
-    })
+        username = current_app.config.get("SSH_USERNAME", "user")
+        password = current_app.config.get("SSH_PASSWORD", "palmedia1")
+        port = int(current_app.config.get("SSH_DEFAULT_PORT", 22))
+        timeout = int(current_app.config.get("SSH_TIMEOUT_SECONDS", 30))
+        bundle_path = os.path.join(uploads_root, f"bundle-{bundle_id}{bundle_suffix(compression)}")
+        dist = BundleDistribution(
+            current_app.extensions["ssh_pool"], current_app.extensions["scheduler"], port, username, password,
+            timeout, bundle_path, options["dest_dir"], compression, len(members), options["owner"], options["group"],
+        )
+        try:
+            bundle_bytes = write_bundle(bundle_path, sorted(members.items()), compression, dist.owner, dist.group)
+        except RuntimeError as e:
+            _remove_quietly(bundle_path)
+            return jsonify({"ok": False, "error": str(e)}), 400
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    ips = options["ips"]
+    job_id = None
+    if not _is_sync(fields.get("mode")):
+        job_id = _file_job(dist, ips, f"bundle of {len(members)} files -> {dist.dest_dir}")
+    _run_file_op(job_id, dist, ips, partial(dist.distribute, ips), cleanup=partial(_remove_quietly, bundle_path))
+
+    response = {"ok": True, "files": len(members), "bundleBytes": bundle_bytes, "compression": compression}
+    if job_id is not None:
+        return jsonify(dict(response, jobId=job_id))
+    results, statuses = dist.snapshot()
+    return jsonify(dict(response, completed=True, results=results, statuses=statuses))
 
 
 @bp.route("/api/copy-from-vm", methods=["POST"])
 def api_copy_from_vm():
     """Copy a file from a source VM to multiple target hosts.
-    Downloads to local temp, uploads to /tmp on targets, then sudo move/chown/chmod.
+    By default the source file is streamed to /tmp on all targets as it is read
+    (pipelined); otherwise it is downloaded to local temp first. Then sudo
+    move/chown/chmod on each target.
     Optional owner/group are validated and applied per host.
     """
     data = request.get_json(silent=True) or {}
@@ -317,126 +959,161 @@ def api_copy_from_vm():
     src_ip = (source.get("ip") or "").strip()
     src_user = (source.get("username") or "").strip()
     src_pass = (source.get("password") or "").strip()
+    src_key = (source.get("privateKey") or "").strip() or None
     src_port = int(source.get("port") or current_app.config.get("SSH_DEFAULT_PORT", 22))
     src_path = (source.get("path") or "").strip()
 
     if not _valid_ipv4(src_ip):
         return jsonify({"ok": False, "error": "Invalid source IP"}), 400
-    if not src_user or not src_pass or not src_path:
-        return jsonify({"ok": False, "error": "Source username, password, and path are required"}), 400
-
-    # Prepare temp download location (local server-side)
-    uploads_root = os.path.join(current_app.instance_path, "uploads")
-    os.makedirs(uploads_root, exist_ok=True)
-    basename = os.path.basename(src_path) or "source_file"
-    tmp_path = os.path.join(uploads_root, f"tmp-{uuid.uuid4()}-{basename}")
-
-    # Download from source VM
+    pool = current_app.extensions["ssh_pool"]
+    server_keys = bool(pool.client_keys or pool.use_agent)
+    if not src_user or not src_path or not (src_pass or src_key or server_keys):
+        return jsonify({"ok": False, "error": "Source username, password or private key, and path are required"}), 400
     try:
-        transport = paramiko.Transport((src_ip, src_port))
-        transport.connect(username=src_user, password=src_pass)
-        sftp = paramiko.SFTPClient.from_transport(transport)
-        try:
-            sftp.get(src_path, tmp_path)
-        finally:
-            try:
-                sftp.close()
-            except Exception:
-                pass
-            try:
-                transport.close()
-            except Exception:
-                pass
-    except Exception as e:
-        # Clean up temp if any
-        try:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-        except Exception:
-            pass
-        return jsonify({"ok": False, "error": f"Download from source failed: {e}"}), 500
+        src_pkey = load_private_key(src_key) if src_key else None
+    except ValueError as e:
+        return jsonify({"ok": False, "error": f"Invalid source private key: {e}"}), 400
 
-    # Upload to target hosts
-    username = current_app.config.get("SSH_USERNAME", "user")
-    password = current_app.config.get("SSH_PASSWORD", "palmedia1")
-    port = int(current_app.config.get("SSH_DEFAULT_PORT", 22))
-    max_workers = int(current_app.config.get("MAX_PARALLEL", 30))
-    timeout = int(current_app.config.get("SSH_TIMEOUT_SECONDS", 30))
     # Basic validation to avoid command injection
-    safe_re = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
-    if owner and not safe_re.match(owner):
+    if owner and not SAFE_NAME_RE.match(owner):
         return jsonify({"ok": False, "error": "Invalid owner format"}), 400
-    if group and not safe_re.match(group):
+    if group and not SAFE_NAME_RE.match(group):
         return jsonify({"ok": False, "error": "Invalid group format"}), 400
+    distribution, dist_error = _distribution_options(data)
+    if dist_error:
+        return jsonify({"ok": False, "error": dist_error}), 400
 
+    basename = os.path.basename(src_path) or "source_file"
+    scheduler = current_app.extensions["scheduler"]
+    timeout = int(current_app.config.get("SSH_TIMEOUT_SECONDS", 30))
+    username = current_app.config.get("SSH_USERNAME", "user")
+    password = current_app.config.get("SSH_PASSWORD", "palmedia1")
+    port = int(current_app.config.get("SSH_DEFAULT_PORT", 22))
     if not dest_dir:
         dest_dir = f"/home/{username}"
+    skip, delta_block_bytes = _sync_options(data)
+    dist = FileDistribution(
+        pool, scheduler, port, username, password, timeout, basename, dest_dir, owner, group,
+        delta_block_bytes=delta_block_bytes,
+        uploader=current_app.extensions["sftp_uploader"],
+    )
 
-    results = {}
-    statuses = {}
+    # Fail fast on a bad source before touching any target
+    try:
+        with pool.sftp(src_ip, src_port, src_user, src_pass, src_pkey, timeout) as sftp:
+            src_size = sftp.stat(src_path).st_size
+    except Exception as e:
+        return jsonify({"ok": False, "error": f"Download from source failed: {e}"}), 500
 
-    def sftp_put(ip):
-        try:
-            transport = paramiko.Transport((ip, port))
-            transport.connect(username=username, password=password)
-            sftp = paramiko.SFTPClient.from_transport(transport)
+    # Relay modes re-upload from the server on a failed hop, so they need a local copy
+    pipelined = distribution["mode"] == "direct" and _flag(
+        data.get("pipelined"), current_app.config.get("COPY_PIPELINED", True)
+    )
+    cleanup = None
+    if pipelined:
+        # Stream source blocks straight to the targets as they are read
+        open_source = partial(
+            sftp_source, pool, src_ip, src_port, src_user, src_pass, src_path, timeout,
+            int(current_app.config.get("PIPELINE_BLOCK_BYTES", 1024 * 1024)), private_key=src_key,
+        )
+        buffer_bytes = int(current_app.config.get("PIPELINE_BUFFER_BYTES", 64 * 1024 * 1024))
+        # Targets beyond what the scheduler runs at once would start after the window
+        # moved on and cost another read of the source; let them catch up from disk instead
+        window = min(scheduler.max_workers, scheduler.per_job_limit)
+        uploads_root = os.path.join(current_app.instance_path, "uploads")
+        spill_path = os.path.join(uploads_root, f"spill-{uuid.uuid4()}-{basename}")
+        cleanup = partial(_remove_quietly, spill_path)
+
+        def work():
+            if skip:
+                # No local copy to hash: checksum the file on the source VM instead
+                dist.digest = remote_digest(pool, src_ip, src_port, src_user, src_pass, src_path, timeout,
+                                            private_key=src_key)
+            targets = dist.skip_unchanged(ips) if dist.digest else ips
+            spill = None
+            if len(targets) > window:
+                os.makedirs(uploads_root, exist_ok=True)
+                spill = spill_path
+            if targets:
+                dist.distribute_stream(targets, open_source, buffer_bytes, spill_path=spill, size=src_size)
+    else:
+        # Prepare temp download location (local server-side)
+        uploads_root = os.path.join(current_app.instance_path, "uploads")
+        os.makedirs(uploads_root, exist_ok=True)
+        tmp_path = os.path.join(uploads_root, f"tmp-{uuid.uuid4()}-{basename}")
+        cleanup = partial(_remove_quietly, tmp_path)
+
+        def work():
+            # Download from source VM, then upload to target hosts
             try:
-                dest = f"{dest_dir.rstrip('/')}/{basename}"
-                # Always upload to /tmp first, then move with sudo to destination
-                tmp_remote = f"/tmp/{uuid.uuid4()}-{basename}"
-                sftp.put(tmp_path, tmp_remote)
-                use_owner = owner or username
-                use_group = group or username
-                move_cmd = (
-                    f'OWNER="{use_owner}"; GROUP="{use_group}"; '
-                    f'id -u "$OWNER" >/dev/null 2>&1 || {{ echo "Owner not found: $OWNER"; exit 200; }}; '
-                    f'getent group "$GROUP" >/dev/null 2>&1 || {{ echo "Group not found: $GROUP"; exit 201; }}; '
-                    f'echo {password} | sudo -S mkdir -p "{dest_dir}" && '
-                    f'echo {password} | sudo -S mv -f "{tmp_remote}" "{dest}" && '
-                    f'echo {password} | sudo -S chown "$OWNER":"$GROUP" "{dest}" && '
-                    f'echo {password} | sudo -S chmod 0664 "{dest}"'
-                )
-                res = execute_command_on_host(
-                    host=ip,
-                    port=port,
-                    username=username,
-                    password=password,
-                    private_key=None,
-                    command=move_cmd,
-                    timeout=timeout,
-                )
-                if not res.get("ok"):
-                    raise Exception(res.get("stderr") or res.get("error") or "Move with sudo failed")
-                statuses[ip] = "completed"
-                results[ip] = {"ok": True, "dest": dest}
-            finally:
-                try:
-                    sftp.close()
-                except Exception:
-                    pass
-                try:
-                    transport.close()
-                except Exception:
-                    pass
-        except Exception as e:
-            statuses[ip] = "failed"
-            results[ip] = {"ok": False, "error": str(e)}
+                with pool.sftp(src_ip, src_port, src_user, src_pass, src_pkey, timeout) as sftp:
+                    sftp.get(src_path, tmp_path)
+            except Exception as e:
+                raise RuntimeError(f"Download from source failed: {e}")
+            metrics.TRANSFER_BYTES.inc(os.path.getsize(tmp_path), direction="download")
+            if skip:
+                dist.digest = file_digest(tmp_path)
+            _distribute(dist, ips, tmp_path, distribution)
+
+    job_id = None
+    if not _is_sync(data.get("mode")):
+        job_id = _file_job(dist, ips, f"copy {src_ip}:{src_path} -> {dist.dest}")
+    _run_file_op(job_id, dist, ips, work, cleanup)
+
+    response = {"ok": True, "filename": basename, "distribution": distribution["mode"], "pipelined": pipelined}
+    if job_id is not None:
+        return jsonify(dict(response, jobId=job_id))
+    results, statuses = dist.snapshot()
+    return jsonify(dict(response, completed=True, results=results, statuses=statuses))
 
-    with ThreadPoolExecutor(max_workers=max_workers) as ex:
-        futmap = {ex.submit(sftp_put, ip): ip for ip in ips}
-        for _ in as_completed(futmap):
-            pass
 
-    # Cleanup temp file
+@bp.route("/api/gather", methods=["POST"])
+def api_gather():
+    """Pull a path or glob from many hosts into one streamed archive.
+
+    Accepts JSON or a plain form (so a browser form post downloads the
+    archive directly): ips, path, optional format (tar.gz|zip) and
+    concurrency. Files land under <ip>/<remote path>; directories are
+    included recursively. Hosts are read over SFTP while the archive is
+    being sent, and gather-report.json at the end lists per-host outcomes.
+    """
+    data = request.get_json(silent=True) or request.form
+    ips, error = _parse_ips(data.get("ips"))
+    if error:
+        return jsonify({"ok": False, "error": error}), 400
+    pattern = (data.get("path") or "").strip()
+    if not pattern or "\0" in pattern:
+        return jsonify({"ok": False, "error": "Provide a path or glob to gather"}), 400
+    fmt = (data.get("format") or current_app.config.get("GATHER_FORMAT", "tar.gz")).strip().lower()
+    if fmt not in FORMATS:
+        return jsonify({"ok": False, "error": "Invalid format"}), 400
     try:
-        os.remove(tmp_path)
-    except Exception:
-        pass
+        concurrency = int(data.get("concurrency") or current_app.config.get("GATHER_CONCURRENCY", 16))
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Invalid concurrency"}), 400
+    if concurrency < 1:
+        return jsonify({"ok": False, "error": "Invalid concurrency"}), 400
 
-    return jsonify({
-        "ok": True,
-        "completed": True,
-        "results": results,
-        "statuses": statuses,
-        "filename": basename,
-    })
+    uploads_root = os.path.join(current_app.instance_path, "uploads")
+    os.makedirs(uploads_root, exist_ok=True)
+    gather = FleetGather(
+        current_app.extensions["ssh_pool"],
+        current_app.extensions["scheduler"],
+        int(current_app.config.get("SSH_DEFAULT_PORT", 22)),
+        current_app.config.get("SSH_USERNAME", "user"),
+        current_app.config.get("SSH_PASSWORD", "palmedia1"),
+        int(current_app.config.get("SSH_TIMEOUT_SECONDS", 30)),
+        pattern,
+        fmt=fmt,
+        concurrency=concurrency,
+        spool_bytes=int(current_app.config.get("GATHER_SPOOL_BYTES", 8 * 1024 * 1024)),
+        block_bytes=int(current_app.config.get("PIPELINE_BLOCK_BYTES", 1024 * 1024)),
+        spool_dir=uploads_root,
+    )
+    filename = f"gather-{time.strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    }
+    return Response(stream_with_context(gather.stream(ips)), mimetype=MIMETYPES[fmt], headers=headers)
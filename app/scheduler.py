@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Optional
+
+from . import adaptive, metrics
+from .adaptive import AdaptiveLimiter
+
+
+class _Task:
+    __slots__ = ("job_key", "host", "fn", "args", "kwargs", "future", "enqueued_at")
+
+    def __init__(self, job_key: str, host: str, fn: Callable, args, kwargs):
+        self.job_key = job_key
+        self.host = host
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class FleetScheduler:
+    """Process-wide bounded executor shared by every fan-out in the app.
+
+    `max_workers` caps concurrent operations across all requests, so
+    MAX_PARALLEL really bounds the server. On top of that, tasks are limited
+    per target host and per job, and workers pick the next task round-robin
+    across jobs so one 500-host run cannot starve a 5-host run that arrived
+    after it.
+
+    With `limiters` (operation kind -> AdaptiveLimiter, see
+    adaptive.operation_kind), each kind of operation is additionally held
+    to its own adaptive limit, which moves below max_workers as the targets
+    and the link allow.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 30,
+        per_host_limit: int = 4,
+        per_job_limit: int = 0,
+        limiters: Optional[Dict[str, AdaptiveLimiter]] = None,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.per_host_limit = max(1, per_host_limit)
+        # 0 means "no per-job cap beyond the global one"
+        self.per_job_limit = per_job_limit if per_job_limit > 0 else self.max_workers
+        self.limiters = limiters or {}
+        self._queues: Dict[str, Deque[_Task]] = {}
+        self._order: List[str] = []
+        self._cursor = 0
+        self._running_by_job: Dict[str, int] = {}
+        self._running_by_host: Dict[str, int] = {}
+        self._threads: List[threading.Thread] = []
+        self._idle = 0
+        self._active = 0
+        self._queued = 0
+        self._completed = 0
+        self._shutdown = False
+        self._cond = threading.Condition()
+
+    def submit(self, job_key: str, host: str, fn: Callable, /, *args, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs) for host under job_key; returns a Future."""
+        task = _Task(job_key, host, fn, args, kwargs)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Scheduler is shut down")
+            q = self._queues.get(job_key)
+            if q is None:
+                q = deque()
+                self._queues[job_key] = q
+                self._order.append(job_key)
+            q.append(task)
+            self._queued += 1
+            # Grow lazily: only spawn when queued work outnumbers idle workers
+            if self._idle < self._queued and len(self._threads) < self.max_workers:
+                t = threading.Thread(target=self._worker, name=f"fleet-worker-{len(self._threads)}", daemon=True)
+                self._threads.append(t)
+                t.start()
+            self._cond.notify()
+        return task.future
+
+    def metrics(self) -> Dict:
+        with self._cond:
+            jobs = {}
+            for key in self._order:
+                jobs[key] = {
+                    "queued": len(self._queues.get(key, ())),
+                    "running": self._running_by_job.get(key, 0),
+                }
+            for key, running in self._running_by_job.items():
+                jobs.setdefault(key, {"queued": 0, "running": running})
+            return {
+                "maxWorkers": self.max_workers,
+                "workerThreads": len(self._threads),
+                "activeWorkers": self._active,
+                "queueDepth": self._queued,
+                "completed": self._completed,
+                "perHostLimit": self.per_host_limit,
+                "perJobLimit": self.per_job_limit,
+                "jobs": jobs,
+                "limiters": {kind: limiter.stats() for kind, limiter in self.limiters.items()},
+            }
+
+    def shutdown(self):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+
+    # -- internals --------------------------------------------------------
+
+    def _next_task(self) -> Optional[_Task]:
+        """Pop the next eligible task, rotating fairly across jobs. Lock held."""
+        n = len(self._order)
+        for i in range(n):
+            idx = (self._cursor + i) % n
+            key = self._order[idx]
+            if self._running_by_job.get(key, 0) >= self.per_job_limit:
+                continue
+            limiter = self.limiters.get(adaptive.operation_kind(key))
+            if limiter is not None and not limiter.available():
+                continue
+            q = self._queues[key]
+            for pos, task in enumerate(q):
+                if self._running_by_host.get(task.host, 0) < self.per_host_limit:
+                    del q[pos]
+                    if not q:
+                        del self._queues[key]
+                        self._order.pop(idx)
+                        self._cursor = idx % len(self._order) if self._order else 0
+                    else:
+                        self._cursor = (idx + 1) % n
+                    return task
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                task = None
+                while not self._shutdown:
+                    task = self._next_task()
+                    if task is not None:
+                        break
+                    self._idle += 1
+                    self._cond.wait()
+                    self._idle -= 1
+                if task is None:
+                    return
+                self._queued -= 1
+                self._active += 1
+                self._running_by_job[task.job_key] = self._running_by_job.get(task.job_key, 0) + 1
+                self._running_by_host[task.host] = self._running_by_host.get(task.host, 0) + 1
+                limiter = self.limiters.get(adaptive.operation_kind(task.job_key))
+                feedback = limiter.acquire() if limiter is not None else adaptive.Feedback(0)
+            try:
+                if task.future.set_running_or_notify_cancel():
+                    try:
+                        with metrics.queued(time.monotonic() - task.enqueued_at), adaptive.observe(feedback):
+                            task.future.set_result(task.fn(*task.args, **task.kwargs))
+                    except BaseException as e:
+                        task.future.set_exception(e)
+            finally:
+                with self._cond:
+                    if limiter is not None:
+                        limiter.release(feedback)
+                    self._active -= 1
+                    self._completed += 1
+                    self._decrement(self._running_by_job, task.job_key)
+                    self._decrement(self._running_by_host, task.host)
+                    # A finished task may unblock a host- or job-limited one
+                    self._cond.notify_all()
+
+    @staticmethod
+    def _decrement(counter: Dict[str, int], key: str):
+        left = counter.get(key, 0) - 1
+        if left > 0:
+            counter[key] = left
+        else:
+            counter.pop(key, None)
+
+
+def when_all_done(futures: List[Future], callback: Callable[[], None]):
+    """Invoke callback once every future has finished, without a waiting thread."""
+    if not futures:
+        callback()
+        return
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def _done(_fut):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            callback()
+
+    for fut in futures:
+        fut.add_done_callback(_done)
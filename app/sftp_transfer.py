@@ -0,0 +1,148 @@
+import collections
+import os
+import time
+from functools import partial
+from typing import Callable, Dict, Optional
+
+import paramiko
+
+from . import metrics
+from .ssh_pool import SSHConnectionPool
+
+# paramiko's default (and the SFTP v3 minimum every server accepts)
+DEFAULT_REQUEST_BYTES = 32 * 1024
+
+# Write-window flow control reaps acknowledgements through these paramiko
+# internals (checked against the version pinned in requirements.txt)
+_REQUIRED_INTERNALS = "SFTPFile._reqs and SFTPClient._read_response"
+
+
+def transfer_stats(sent: int, seconds: float) -> Dict:
+    """Result fields describing one host's transfer."""
+    seconds = max(seconds, 1e-6)
+    return {
+        "transferredBytes": sent,
+        "transferSeconds": round(seconds, 3),
+        "mbPerSec": round(sent / seconds / (1024 * 1024), 2),
+    }
+
+
+class SFTPUploader:
+    """Pipelined, resumable SFTP uploads with tunable request sizing.
+
+    The local file is read in `block_bytes` blocks and sent as
+    `request_bytes` SFTP write requests, keeping up to `max_outstanding`
+    of them unacknowledged so the link stays busy instead of waiting one
+    round trip per request. If the connection drops mid-transfer, the
+    upload is retried up to `retries` times from the partial remote file
+    (less the requests that may not have landed) rather than from zero.
+    """
+
+    def __init__(
+        self,
+        block_bytes: int = 1024 * 1024,
+        request_bytes: int = DEFAULT_REQUEST_BYTES,
+        max_outstanding: int = 64,
+        retries: int = 2,
+    ):
+        self.block_bytes = max(1, block_bytes)
+        self.request_bytes = max(1024, request_bytes)
+        self.max_outstanding = max(1, max_outstanding)
+        self.retries = max(0, retries)
+
+    def upload(
+        self,
+        pool: SSHConnectionPool,
+        ip: str,
+        port: int,
+        username: str,
+        password: str,
+        timeout: int,
+        local_path: str,
+        remote_path: str,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Dict:
+        """Upload local_path to remote_path on ip; returns transfer stats.
+
+        `progress(bytes_done, total)` is called after every block, like
+        paramiko's put() callback.
+        """
+        size = os.path.getsize(local_path)
+        started = time.monotonic()
+        # Bytes written across attempts, including any resent after a drop
+        sent = [0]
+        offset = 0
+        resumed_from = 0
+        attempt = 0
+        while True:
+            sftp = None
+            try:
+                with pool.sftp(ip, port, username, password, None, timeout) as sftp:
+                    if attempt:
+                        offset = resumed_from = self._resume_offset(sftp, remote_path, size)
+                    self._send(sftp, local_path, remote_path, offset, size, progress, sent)
+                break
+            except Exception:
+                # Only a dropped connection is worth resuming; SFTP errors (permissions, disk full) are final
+                dropped = sftp is not None and not sftp.get_channel().get_transport().is_active()
+                if attempt >= self.retries or not dropped:
+                    raise
+                attempt += 1
+        stats = transfer_stats(sent[0], time.monotonic() - started)
+        if attempt:
+            stats["resumedFrom"] = resumed_from
+        return stats
+
+    def open_remote(self, sftp: paramiko.SFTPClient, path: str, mode: str = "wb") -> paramiko.SFTPFile:
+        """Open a remote file for pipelined writes of `request_bytes` requests."""
+        f = sftp.open(path, mode)
+        if not isinstance(getattr(f, "_reqs", None), collections.deque) or not callable(
+            getattr(f.sftp, "_read_response", None)
+        ):
+            f.close()
+            raise RuntimeError(
+                f"paramiko {paramiko.__version__} lacks {_REQUIRED_INTERNALS}, which pipelined "
+                "uploads rely on; install the version pinned in requirements.txt"
+            )
+        f.MAX_REQUEST_SIZE = self.request_bytes
+        f.set_pipelined(True)
+        return f
+
+    def write(self, f: paramiko.SFTPFile, data: bytes):
+        """Write data through f, keeping at most `max_outstanding` requests unacknowledged."""
+        step = self.request_bytes
+        for i in range(0, len(data), step):
+            f.write(data[i:i + step])
+            self._drain(f, self.max_outstanding)
+        metrics.TRANSFER_BYTES.inc(len(data), direction="upload")
+
+    # -- internals --------------------------------------------------------
+
+    def _send(self, sftp, local_path, remote_path, offset, size, progress, sent):
+        done = offset
+        with self.open_remote(sftp, remote_path, "r+b" if offset else "wb") as f, open(local_path, "rb") as src:
+            f.seek(offset)
+            src.seek(offset)
+            for block in iter(partial(src.read, self.block_bytes), b""):
+                self.write(f, block)
+                sent[0] += len(block)
+                done += len(block)
+                if progress is not None:
+                    progress(done, size)
+
+    @staticmethod
+    def _drain(f: paramiko.SFTPFile, keep: int):
+        # paramiko queues pipelined write requests in f._reqs and only reaps
+        # them opportunistically; reap the oldest in order to bound the window
+        while len(f._reqs) > keep:
+            f.sftp._read_response(f._reqs.popleft())
+
+    def _resume_offset(self, sftp: paramiko.SFTPClient, path: str, limit: int) -> int:
+        # Writes still unacknowledged at the drop may have landed out of order,
+        # leaving holes below the partial file's size; everything before the
+        # last window of requests was acknowledged, so resend from there
+        try:
+            remote = min(sftp.stat(path).st_size, limit)
+        except IOError:
+            return 0
+        return max(0, remote - (self.max_outstanding + 1) * self.request_bytes)
@@ -1,8 +1,16 @@
 import paramiko
 import socket
-import io
+import select
 import shlex
-from typing import Optional
+import time
+from typing import Iterable, Optional
+
+from . import adaptive, metrics
+from .credentials import HostKeyStore, load_private_key
+from .output_buffer import OutputBuffer
+from .ssh_pool import SSHConnectionPool
+
+READ_CHUNK_BYTES = 32 * 1024
 
 
 def execute_command_on_host(
@@ -13,52 +21,161 @@ def execute_command_on_host(
     private_key: Optional[str],
     command: str,
     timeout: int,
+    pool: Optional[SSHConnectionPool] = None,
+    stdout_buffer: Optional[OutputBuffer] = None,
+    stderr_buffer: Optional[OutputBuffer] = None,
+    stdin_blocks: Optional[Iterable[bytes]] = None,
+    host_keys: Optional[HostKeyStore] = None,
 ):
-    client = paramiko.SSHClient()
-    # WARNING: In production, manage known hosts securely
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    # Phase timings (connect, auth, command, ...) are returned under "timings";
+    # inside a file operation they add to that host's timings instead.
+    # host_keys checks host keys of unpooled connections; the pool has its own
+    with metrics.collect() as timings:
+        result = _execute(host, port, username, password, private_key, command, timeout, pool,
+                          stdout_buffer, stderr_buffer, stdin_blocks, host_keys)
+    result["timings"] = dict(timings)
+    return result
 
-    pkey = None
-    if private_key:
-        # Attempt RSA, then fallback to Ed25519 or ECDSA if needed
-        key_io = io.StringIO(private_key)
+
+def _execute(host, port, username, password, private_key, command, timeout, pool, stdout_buffer, stderr_buffer,
+             stdin_blocks, host_keys):
+    # Callers pass their own buffers to watch output while the command runs
+    out_buf = stdout_buffer if stdout_buffer is not None else OutputBuffer()
+    err_buf = stderr_buffer if stderr_buffer is not None else OutputBuffer()
+    # Parsed once per distinct key, not once per host
+    pkey = load_private_key(private_key) if private_key else None
+
+    # Pooled path: reuse an authenticated transport and just open a channel
+    if pool is not None:
         try:
-            pkey = paramiko.RSAKey.from_private_key(key_io)
-        except Exception:
-            key_io.seek(0)
-            try:
-                pkey = paramiko.Ed25519Key.from_private_key(key_io)
-            except Exception:
-                key_io.seek(0)
-                pkey = paramiko.ECDSAKey.from_private_key(key_io)
+            with pool.session(host, port, username, password, pkey, timeout) as chan:
+                return _run_on_channel(chan, command, timeout, out_buf, err_buf, stdin_blocks)
+        except (paramiko.SSHException, socket.error) as e:
+            raise RuntimeError(f"SSH error: {e}")
+        finally:
+            out_buf.close()
+            err_buf.close()
 
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(
+        host_keys.missing_host_key_policy() if host_keys is not None else paramiko.AutoAddPolicy()
+    )
     try:
-        client.connect(
-            hostname=host,
-            port=port,
-            username=username,
-            password=password,
-            pkey=pkey,
-            timeout=timeout,
-        )
-
-        # Prefer bash login semantics so env (PATH, JAVA_HOME) matches interactive sessions
-        inner = f"cd \"$HOME\" && {command}"
-        wrapped_cmd = f"/bin/bash -lc {shlex.quote(inner)}"
-        stdin, stdout, stderr = client.exec_command(wrapped_cmd, timeout=timeout)
-        out = stdout.read().decode("utf-8", errors="replace")
-        err = stderr.read().decode("utf-8", errors="replace")
-        exit_status = stdout.channel.recv_exit_status()
-        return {
-            "ok": (exit_status == 0),
-            "stdout": out,
-            "stderr": err,
-            "exit_code": exit_status,
-        }
+        metrics.SSH_CONNECTS.inc()
+        with metrics.phase("connect"):
+            client.connect(
+                hostname=host,
+                port=port,
+                username=username,
+                password=password,
+                pkey=pkey,
+                timeout=timeout,
+            )
+        with metrics.phase("channel"):
+            chan = client.get_transport().open_session(timeout=timeout)
+        return _run_on_channel(chan, command, timeout, out_buf, err_buf, stdin_blocks)
     except (paramiko.SSHException, socket.error) as e:
+        metrics.count_failure(e)
+        adaptive.report_failure(e)
         raise RuntimeError(f"SSH error: {e}")
     finally:
+        out_buf.close()
+        err_buf.close()
         try:
             client.close()
         except Exception:
             pass
+
+
+def wrap_login_shell(command: str) -> str:
+    # Prefer bash login semantics so env (PATH, JAVA_HOME) matches interactive sessions
+    inner = f"cd \"$HOME\" && {command}"
+    return f"/bin/bash -lc {shlex.quote(inner)}"
+
+
+def _run_on_channel(chan: paramiko.Channel, command: str, timeout: int, out_buf: OutputBuffer, err_buf: OutputBuffer,
+                    stdin_blocks: Optional[Iterable[bytes]] = None):
+    with metrics.phase("exec"):
+        chan.exec_command(wrap_login_shell(command))
+    if stdin_blocks is not None:
+        with metrics.phase("stdin"):
+            send_stdin(chan, stdin_blocks)
+    drain_channel(chan, out_buf, err_buf, timeout)
+    exit_status = chan.recv_exit_status()
+    return output_result(exit_status, out_buf, err_buf)
+
+
+def send_stdin(chan: paramiko.Channel, blocks: Iterable[bytes]):
+    """Write blocks to the command's stdin, then signal EOF.
+
+    If the command exits without reading everything, sending stops quietly;
+    its exit status and stderr say why.
+    """
+    try:
+        for block in blocks:
+            chan.sendall(block)
+        chan.shutdown_write()
+    except socket.error:
+        pass
+
+
+def drain_channel(chan: paramiko.Channel, out_buf: OutputBuffer, err_buf: OutputBuffer, timeout: int):
+    """Read stdout and stderr together in chunks until the remote side closes.
+
+    Draining both streams as data arrives keeps a chatty stderr from filling
+    the channel window and stalling stdout. `timeout` bounds inactivity,
+    like the channel timeout of a blocking read.
+
+    Records the `command` phase (until the remote side closes its output)
+    and the `drain` phase (the rest of the output and the exit status).
+    """
+    started = time.perf_counter()
+    eof_at = None
+    chan.setblocking(False)
+    while True:
+        if eof_at is None and (chan.eof_received or chan.closed):
+            eof_at = time.perf_counter()
+        got = False
+        while chan.recv_ready():
+            out_buf.write(chan.recv(READ_CHUNK_BYTES))
+            got = True
+        while chan.recv_stderr_ready():
+            err_buf.write(chan.recv_stderr(READ_CHUNK_BYTES))
+            got = True
+        if got:
+            continue
+        if chan.closed or (chan.eof_received and chan.exit_status_ready()):
+            break
+        if chan.eof_received:
+            # Both streams are done; only the exit status is still to come
+            if not chan.status_event.wait(timeout):
+                raise socket.timeout(f"No exit status after {timeout}s")
+            continue
+        # The channel's fileno is a pipe that becomes readable on new data or EOF
+        ready, _, _ = select.select([chan], [], [], timeout)
+        if not ready and not (chan.recv_ready() or chan.recv_stderr_ready()):
+            raise socket.timeout(f"No output for {timeout}s")
+    chan.setblocking(True)
+    ended = time.perf_counter()
+    eof_at = eof_at or ended
+    metrics.add_phase("command", eof_at - started)
+    metrics.add_phase("drain", ended - eof_at)
+
+
+def output_result(exit_status: int, out_buf: OutputBuffer, err_buf: OutputBuffer):
+    result = {
+        "ok": (exit_status == 0),
+        "stdout": out_buf.text(),
+        "stderr": err_buf.text(),
+        "exit_code": exit_status,
+        "stdout_bytes": out_buf.total_bytes,
+        "stderr_bytes": err_buf.total_bytes,
+    }
+    if out_buf.truncated or err_buf.truncated:
+        result["truncated"] = True
+    return result
+
+
+def error_result(e: Exception):
+    """Host result for a run that raised instead of returning."""
+    return {"ok": False, "error": str(e), "stdout": "", "stderr": "", "exit_code": None}
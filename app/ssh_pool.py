@@ -0,0 +1,390 @@
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+
+import paramiko
+
+from . import adaptive, metrics
+from .credentials import HostKeyStore, agent_keys, credential_fingerprint
+
+# (host, port, user, fingerprint of the password/key the transport was authenticated with)
+PoolKey = Tuple[str, int, str, str]
+
+
+def _report_failure(e: BaseException):
+    metrics.count_failure(e)
+    adaptive.report_failure(e)
+
+
+class _PooledTransport:
+    __slots__ = ("transport", "last_used", "last_checked", "in_use")
+
+    def __init__(self, transport: paramiko.Transport):
+        now = time.monotonic()
+        self.transport = transport
+        self.last_used = now
+        self.last_checked = now
+        self.in_use = 0
+
+
+class SSHConnectionPool:
+    """Keyed pool of authenticated SSH transports, one per (host, port, user)
+    and set of credentials.
+
+    Command runs and SFTP sessions open channels on the pooled transport, so
+    repeat runs against the same host skip the TCP connect, key exchange and
+    auth. A per-host semaphore caps concurrent channels (sshd MaxSessions is
+    10 by default), idle transports are evicted by a background reaper, and a
+    transport that has gone away is reconnected transparently. A transport
+    is only handed to callers presenting the credentials it was opened with,
+    so a wrong password never rides on someone else's connection.
+
+    New transports check the host key against `host_keys` (if given) and
+    authenticate with public keys first: the caller's key, then
+    `client_keys`, then ssh-agent keys with `use_agent`; the password is
+    the fallback.
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = 300,
+        max_channels_per_host: int = 8,
+        health_check_interval: float = 30,
+        keepalive_timeout: float = 10,
+        window_size: Optional[int] = None,
+        max_packet_size: Optional[int] = None,
+        client_keys: Sequence[paramiko.PKey] = (),
+        use_agent: bool = False,
+        host_keys: Optional[HostKeyStore] = None,
+    ):
+        self.idle_timeout = idle_timeout
+        self.max_channels_per_host = max(1, max_channels_per_host)
+        self.health_check_interval = health_check_interval
+        # A reused transport whose keepalive is not answered within this is dropped
+        self.keepalive_timeout = keepalive_timeout
+        # SSH channel flow-control tuning; None keeps paramiko's defaults (2 MiB window, 32 KiB packets)
+        self.window_size = window_size or None
+        self.max_packet_size = max_packet_size or None
+        self.client_keys = tuple(client_keys)
+        self.use_agent = use_agent
+        self.host_keys = host_keys
+        self._agent: Optional[paramiko.Agent] = None
+        self._agent_keys: Optional[Tuple[paramiko.AgentKey, ...]] = None
+        # Agent keys sign over one agent socket; handshakes take turns using it
+        self._agent_lock = threading.Lock()
+        self._entries: Dict[PoolKey, _PooledTransport] = {}
+        self._slots: Dict[PoolKey, threading.BoundedSemaphore] = {}
+        self._connect_locks: Dict[PoolKey, threading.Lock] = {}
+        # Callers inside _slot per key; its semaphore and connect lock go once none are left
+        self._users: Dict[PoolKey, int] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._closed = False
+
+    # -- public API -------------------------------------------------------
+
+    @contextmanager
+    def session(self, host, port, username, password=None, pkey=None, timeout=30):
+        """Yield a fresh session channel on the pooled transport for host.
+
+        Failures to get the channel are counted and reported to the adaptive
+        limiter; errors raised by the caller while using it are not.
+        """
+        key = (host, int(port), username, credential_fingerprint(password, pkey))
+        with self._slot(key, timeout):
+            chan = self._open(key, password, pkey, timeout, lambda t: t.open_session(timeout=timeout), "channel")
+            try:
+                yield chan
+            finally:
+                try:
+                    chan.close()
+                except Exception:
+                    pass
+                self._release(key)
+
+    @contextmanager
+    def sftp(self, host, port, username, password=None, pkey=None, timeout=30):
+        """Yield an SFTP client running on the pooled transport for host (failures reported as for `session`)."""
+        key = (host, int(port), username, credential_fingerprint(password, pkey))
+        with self._slot(key, timeout):
+            client = self._open(key, password, pkey, timeout, self._open_sftp, "sftp")
+            try:
+                client.get_channel().settimeout(timeout)
+                yield client
+            finally:
+                try:
+                    client.close()
+                except Exception:
+                    pass
+                self._release(key)
+
+    def evict_idle(self):
+        """Close transports that are dead or have been idle too long."""
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                idle = now - entry.last_used
+                if not entry.transport.is_active() or (entry.in_use == 0 and idle > self.idle_timeout):
+                    stale.append(self._entries.pop(key))
+                    self._prune(key)
+        for entry in stale:
+            self._close_transport(entry.transport)
+        return len(stale)
+
+    def invalidate(self, host, port, username):
+        """Close every pooled transport to host as username, whatever its credentials."""
+        with self._lock:
+            keys = [k for k in self._entries if k[:3] == (host, int(port), username)]
+            entries = [self._entries.pop(k) for k in keys]
+            for k in keys:
+                self._prune(k)
+        for entry in entries:
+            self._close_transport(entry.transport)
+
+    def close_all(self):
+        with self._lock:
+            self._closed = True
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._close_transport(entry.transport)
+        with self._agent_lock:
+            if self._agent is not None:
+                self._agent.close()
+            self._agent, self._agent_keys = None, None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "connections": len(self._entries),
+                "channelsInUse": sum(e.in_use for e in self._entries.values()),
+            }
+
+    # -- internals --------------------------------------------------------
+
+    @contextmanager
+    def _slot(self, key: PoolKey, timeout):
+        with self._lock:
+            sem = self._slots.get(key)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.max_channels_per_host)
+                self._slots[key] = sem
+            self._users[key] = self._users.get(key, 0) + 1
+        try:
+            # Waiting here means the host already has max_channels_per_host channels open
+            with metrics.phase("slot"):
+                acquired = sem.acquire(timeout=timeout)
+            if not acquired:
+                e = paramiko.SSHException(f"Timed out waiting for a free channel to {key[0]}")
+                _report_failure(e)
+                raise e
+            try:
+                yield
+            finally:
+                sem.release()
+        finally:
+            with self._lock:
+                left = self._users[key] - 1
+                if left:
+                    self._users[key] = left
+                else:
+                    del self._users[key]
+                self._prune(key)
+
+    def _open(self, key: PoolKey, password, pkey, timeout, opener, phase: str):
+        try:
+            return self._open_on_transport(key, password, pkey, timeout, opener, phase)
+        except Exception as e:
+            _report_failure(e)
+            raise
+
+    def _open_on_transport(self, key: PoolKey, password, pkey, timeout, opener, phase: str):
+        """Run opener(transport) on a healthy pooled transport, timed as `phase`.
+
+        A reused transport can have been dropped by the peer since its last
+        use; in that case the entry is discarded and one reconnect is tried.
+        A transport that is still up when opening fails (sshd MaxSessions
+        refusing the channel, an open timing out under load) is kept, so the
+        other channels in flight on it carry on.
+        """
+        self._ensure_reaper()
+        entry, reused = self._acquire(key, password, pkey, timeout)
+        try:
+            with metrics.phase(phase):
+                return opener(entry.transport)
+        except (paramiko.SSHException, EOFError, socket.error):
+            if entry.transport.is_active():
+                self._release(key)
+                raise
+            self._discard(key, entry)
+            if not reused:
+                raise
+        entry, _ = self._acquire(key, password, pkey, timeout)
+        try:
+            with metrics.phase(phase):
+                return opener(entry.transport)
+        except Exception:
+            if entry.transport.is_active():
+                self._release(key)
+            else:
+                self._discard(key, entry)
+            raise
+
+    def _acquire(self, key: PoolKey, password, pkey, timeout):
+        with self._lock:
+            conn_lock = self._connect_locks.setdefault(key, threading.Lock())
+        # Serialise connects per key so N parallel channels share one handshake
+        with conn_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and self._healthy(entry):
+                reused = True
+            else:
+                if entry is not None:
+                    self._discard(key, entry)
+                entry = _PooledTransport(self._connect(key, password, pkey, timeout))
+                reused = False
+                with self._lock:
+                    self._entries[key] = entry
+            with self._lock:
+                entry.in_use += 1
+                entry.last_used = time.monotonic()
+        return entry, reused
+
+    def _release(self, key: PoolKey):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.in_use = max(0, entry.in_use - 1)
+                entry.last_used = time.monotonic()
+
+    def _discard(self, key: PoolKey, entry: _PooledTransport):
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+                self._prune(key)
+        self._close_transport(entry.transport)
+
+    def _prune(self, key: PoolKey):
+        """Forget key's semaphore and connect lock once it has no transport and no caller. Lock held."""
+        if key not in self._entries and key not in self._users:
+            self._slots.pop(key, None)
+            self._connect_locks.pop(key, None)
+
+    def _healthy(self, entry: _PooledTransport) -> bool:
+        t = entry.transport
+        if not t.is_active() or not t.is_authenticated():
+            return False
+        now = time.monotonic()
+        if now - entry.last_checked < self.health_check_interval:
+            return True
+        # Idle for a while: round-trip a keepalive before trusting the socket. paramiko
+        # waits for the reply until the transport dies, which a half-open peer never
+        # reports, so wait in a helper thread; closing the transport on timeout ends it.
+        answered = threading.Event()
+
+        def ping():
+            try:
+                t.global_request("keepalive@openssh.com", wait=True)
+            except Exception:
+                return
+            answered.set()
+
+        threading.Thread(target=ping, name="ssh-pool-keepalive", daemon=True).start()
+        if not answered.wait(self.keepalive_timeout) or not t.is_active():
+            return False
+        entry.last_checked = now
+        return True
+
+    def _open_sftp(self, transport: paramiko.Transport) -> paramiko.SFTPClient:
+        return paramiko.SFTPClient.from_transport(
+            transport, window_size=self.window_size, max_packet_size=self.max_packet_size
+        )
+
+    def _connect(self, key: PoolKey, password, pkey, timeout) -> paramiko.Transport:
+        host, port, username, _ = key
+        metrics.SSH_CONNECTS.inc()
+        started = time.perf_counter()
+        with metrics.phase("connect"):
+            sock = socket.create_connection((host, port), timeout=timeout)
+        # SFTP and exec traffic is many small request/response messages; don't let Nagle batch them
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        tuning = {}
+        if self.window_size:
+            tuning["default_window_size"] = self.window_size
+        if self.max_packet_size:
+            tuning["default_max_packet_size"] = self.max_packet_size
+        transport = paramiko.Transport(sock, **tuning)
+        try:
+            transport.banner_timeout = timeout
+            transport.auth_timeout = timeout
+            with metrics.phase("kex"):
+                transport.start_client(timeout=timeout)
+            if self.host_keys is not None:
+                self.host_keys.check(host, port, transport.get_remote_server_key())
+            with metrics.phase("auth"):
+                self._authenticate(transport, username, password, pkey)
+            if not transport.is_authenticated():
+                raise paramiko.AuthenticationException("Authentication failed.")
+        except Exception as e:
+            transport.close()
+            # The host took the TCP connection but not the handshake: the adaptive limiter backs off
+            adaptive.report_failure(e, handshake=True)
+            raise
+        adaptive.report_connect(time.perf_counter() - started)
+        return transport
+
+    def _authenticate(self, transport: paramiko.Transport, username: str, password, pkey):
+        """Try each public key in turn, then the password (always, when there are no keys)."""
+        keys = ([pkey] if pkey is not None else []) + list(self.client_keys)
+        agent = self._agent_key_list() if self.use_agent else ()
+        for i, key in enumerate(keys + list(agent)):
+            try:
+                if i < len(keys):
+                    transport.auth_publickey(username, key)
+                else:
+                    with self._agent_lock:
+                        transport.auth_publickey(username, key)
+                return
+            except paramiko.BadAuthenticationType as e:
+                if "publickey" not in e.allowed_types:
+                    break
+            except paramiko.AuthenticationException:
+                continue
+        if password or not (keys or agent):
+            transport.auth_password(username, password or "")
+
+    def _agent_key_list(self) -> Tuple[paramiko.AgentKey, ...]:
+        """Keys held by the ssh-agent, asked for once and kept for the pool's lifetime."""
+        with self._agent_lock:
+            if self._agent_keys is None:
+                self._agent, self._agent_keys = agent_keys()
+            return self._agent_keys
+
+    @staticmethod
+    def _close_transport(transport: paramiko.Transport):
+        try:
+            transport.close()
+        except Exception:
+            pass
+
+    def _ensure_reaper(self):
+        if self._reaper is not None:
+            return
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="ssh-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        interval = max(1.0, min(self.idle_timeout, self.health_check_interval) / 2)
+        while not self._closed:
+            time.sleep(interval)
+            try:
+                self.evict_idle()
+            except Exception:
+                pass
@@ -3,7 +3,7 @@ const formError = document.getElementById('form-error');
 const formSuccess = document.getElementById('form-success');
 const resultsBody = document.getElementById('results-body');
 // App UI logic: renders the Shortcut Hub, handles command execution,
-// file operation modals, and polls job status from the backend.
+// file operation modals, and follows job progress from the backend.
 const hubEl = document.getElementById('shortcut-hub');
 const actionsEl = document.getElementById('shortcut-actions');
 const busyEl = document.getElementById('busy-indicator');
@@ -14,6 +14,8 @@ const ipsFileName = document.getElementById('ips-file-name');
 const ipsClearBtn = document.getElementById('ips-clear-btn');
 const commandInput = document.getElementById('command');
 const runBtn = document.getElementById('run-btn');
+const groupOutputInput = document.getElementById('group-output');
+const groupNormalizeInput = document.getElementById('group-normalize');
 
 // Common string constants (used 3+ times)
 const STRINGS = {
@@ -25,13 +27,19 @@ const STRINGS = {
   GENERATE_CERT: 'Generate SSL Certificate',
 };
 
-// Shortcut command definitions: grouped actions the user can run remotely
+// Shortcut command definitions: grouped actions the user can run remotely.
+// An array of steps runs as a pipeline: one SSH session and shell per host,
+// stopping at the first failed step unless it has continueOnFailure
 const SHORTCUTS = {
   Concentrator: {
     Start: 'echo palmedia1 | sudo -S systemctl start onelink-concentrator',
     Stop: 'echo palmedia1 | sudo -S systemctl stop onelink-concentrator',
     Restart: 'echo palmedia1 | sudo -S systemctl restart onelink-concentrator',
-    Clean: 'echo palmedia1 | sudo -S systemctl stop onelink-concentrator && sudo rm -rf /opt/onelink-concentrator/data/kahadb/*.* && sudo -S systemctl start onelink-concentrator',
+    Clean: [
+      'echo palmedia1 | sudo -S systemctl stop onelink-concentrator',
+      'sudo rm -rf /opt/onelink-concentrator/data/kahadb/*.*',
+      'sudo -S systemctl start onelink-concentrator',
+    ],
   },
   Appserver: {
     Start: 'echo palmedia1 | sudo -S systemctl start onelink-appserver',
@@ -46,23 +54,27 @@ const SHORTCUTS = {
   Unload: {
     Start: 'sh start-unload.sh',
     Stop: 'sh stop-unload.sh',
+    Restart: [{ command: 'sh stop-unload.sh', continueOnFailure: true }, 'sh start-unload.sh'],
   },
   'nConnect Mock': {
     Start: 'sh start-nconnectmock.sh',
     Stop: 'sh stop-nconnectmock.sh',
+    Restart: [{ command: 'sh stop-nconnectmock.sh', continueOnFailure: true }, 'sh start-nconnectmock.sh'],
   },
   'MySQL': {
     Start: 'echo palmedia1 | sudo -S systemctl start mysqld',
     Stop: 'echo palmedia1 | sudo -S systemctl stop mysqld',
     Restart: 'echo palmedia1 | sudo -S systemctl restart mysqld',
   },
-  [STRINGS.FILE_OPERATIONS]: ['Copy From VM', 'Upload and Copy Files'],
+  [STRINGS.FILE_OPERATIONS]: ['Copy From VM', 'Upload and Copy Files', 'Gather Files'],
 };
 
 const CATEGORY_ORDER = ['Concentrator', 'Appserver', 'nConnect-Adapter', 'Unload', 'nConnect Mock', 'MySQL', STRINGS.FILE_OPERATIONS, STRINGS.GENERATE_CERT];
 let selectedCategory = null;
 
 let currentIPs = [];
+// Last finished command job, re-rendered when the grouping options change
+let lastCommandJob = null;
 
 // Timers for fading banners
 let successTimer = null;
@@ -135,6 +147,7 @@ function renderTable(ips, job) {
   ips.forEach(ip => {
     const status = job?.statuses?.[ip] || 'pending';
     const res = job?.results?.[ip] || null;
+    const progress = job?.progress?.[ip] || null;
     const row = document.createElement('tr');
 
     const tdIP = document.createElement('td');
@@ -147,14 +160,16 @@ function renderTable(ips, job) {
     tdExit.textContent = res?.exit_code ?? '';
 
     const tdOut = document.createElement('td');
-    const stdoutNode = renderStdout(res?.stdout ?? '');
+    // File operations report the destination when done and transfer progress while running
+    const stdoutText = res?.stdout || (res?.dest ? `Copied to ${res.dest}` : '') || (progress ? progressText(progress) : '');
+    const stdoutNode = renderStdout(stdoutText);
     const outWrap = document.createElement('div');
     outWrap.className = 'stdout-wrap';
     outWrap.appendChild(stdoutNode);
     tdOut.appendChild(outWrap);
 
     const tdErr = document.createElement('td');
-    const stderrNode = renderStdout(res?.stderr ?? '');
+    const stderrNode = renderStdout(res?.stderr || res?.error || '');
     const errWrap = document.createElement('div');
     errWrap.className = 'stdout-wrap';
     errWrap.appendChild(stderrNode);
@@ -170,6 +185,90 @@ function renderTable(ips, job) {
   });
 }
 
+// Show a finished command job: one row per distinct output (from the
+// server's grouped view) when grouping is on, else one row per host
+async function renderJobResults() {
+  if (!lastCommandJob) return;
+  const { jobId, job } = lastCommandJob;
+  if (!groupOutputInput?.checked || currentIPs.length < 2) {
+    renderTable(currentIPs, job);
+    return;
+  }
+  const normalize = groupNormalizeInput?.checked ? 1 : 0;
+  try {
+    const res = await fetch(`/api/job/${jobId}/groups?normalize=${normalize}`);
+    const data = await res.json();
+    if (!data.ok) throw new Error(data.error);
+    renderGroups(data.groups, data.pending);
+  } catch (err) {
+    // Job evicted or unreachable: fall back to what the stream delivered
+    renderTable(currentIPs, job);
+  }
+}
+
+// Render grouped results: the IP cell lists the group's hosts, status and
+// exit code cells count how many hosts had each value
+function renderGroups(groups, pending) {
+  resultsBody.innerHTML = '';
+  const tally = (values) => {
+    const counts = new Map();
+    values.forEach(v => { if (v != null) counts.set(v, (counts.get(v) || 0) + 1); });
+    if (counts.size === 1 && values.every(v => v != null)) return String(counts.keys().next().value);
+    return [...counts].map(([v, n]) => `${v} ×${n}`).join(', ');
+  };
+  const rows = groups.slice();
+  if (pending.length) {
+    rows.push({ ips: pending, statuses: pending.map(() => 'pending'), exitCodes: [], stdout: '', stderr: '' });
+  }
+  rows.forEach(group => {
+    const row = document.createElement('tr');
+
+    const tdIP = document.createElement('td');
+    if (group.ips.length === 1) {
+      tdIP.textContent = group.ips[0];
+    } else {
+      const details = document.createElement('details');
+      details.className = 'group-ips';
+      const summary = document.createElement('summary');
+      summary.textContent = `${group.ips.length} hosts`;
+      const list = document.createElement('div');
+      list.textContent = group.ips.join(', ');
+      details.appendChild(summary);
+      details.appendChild(list);
+      tdIP.appendChild(details);
+    }
+
+    const tdStatus = document.createElement('td');
+    tdStatus.textContent = tally(group.statuses);
+
+    const tdExit = document.createElement('td');
+    tdExit.textContent = tally(group.exitCodes);
+
+    const tdOut = document.createElement('td');
+    const outWrap = document.createElement('div');
+    outWrap.className = 'stdout-wrap';
+    outWrap.appendChild(renderStdout(group.stdout || ''));
+    tdOut.appendChild(outWrap);
+
+    const tdErr = document.createElement('td');
+    const errWrap = document.createElement('div');
+    errWrap.className = 'stdout-wrap';
+    errWrap.appendChild(renderStdout(group.stderr || group.error || ''));
+    tdErr.appendChild(errWrap);
+
+    row.appendChild(tdIP);
+    row.appendChild(tdStatus);
+    row.appendChild(tdExit);
+    row.appendChild(tdOut);
+    row.appendChild(tdErr);
+
+    resultsBody.appendChild(row);
+  });
+}
+
+groupOutputInput && groupOutputInput.addEventListener('change', renderJobResults);
+groupNormalizeInput && groupNormalizeInput.addEventListener('change', renderJobResults);
+
 // Render stdout/stderr: detect tabular output and show it in a grid; otherwise use preformatted text
 function renderStdout(text) {
   const rows = parseColumns(text);
@@ -385,6 +484,11 @@ function renderActions(cat) {
           const uploadError = document.getElementById('upload-error');
           if (uploadError) uploadError.classList.add('hidden');
           if (uploadModal) uploadModal.classList.remove('hidden');
+        } else if (label === 'Gather Files') {
+          const gatherModal = document.getElementById('gather-modal');
+          const gatherError = document.getElementById('gather-error');
+          if (gatherError) gatherError.classList.add('hidden');
+          if (gatherModal) gatherModal.classList.remove('hidden');
         }
         return;
       }
@@ -411,6 +515,8 @@ const uploadDestInput = document.getElementById('upload-dest-dir');
 const uploadFileInput = document.getElementById('upload-file');
 const uploadFileBtn = document.getElementById('upload-file-btn');
 const uploadFileName = document.getElementById('upload-file-name');
+const uploadFolderInput = document.getElementById('upload-folder');
+const uploadFolderBtn = document.getElementById('upload-folder-btn');
 const uploadOwnerInput = document.getElementById('upload-owner');
 const uploadGroupInput = document.getElementById('upload-group');
 
@@ -419,24 +525,35 @@ uploadCancelBtn && uploadCancelBtn.addEventListener('click', () => {
   uploadForm && uploadForm.reset();
   if (uploadError) uploadError.classList.add('hidden');
   if (uploadFileName) uploadFileName.textContent = STRINGS.NO_FILE_SELECTED;
+  uploadSelection = { files: [], folder: false };
 });
+// Files picked by whichever picker was used last; a folder keeps its relative paths
+let uploadSelection = { files: [], folder: false };
+
 // Enhanced file input: trigger native picker and show selected filename
 uploadFileBtn && uploadFileBtn.addEventListener('click', () => {
   uploadFileInput && uploadFileInput.click();
 });
+uploadFolderBtn && uploadFolderBtn.addEventListener('click', () => {
+  uploadFolderInput && uploadFolderInput.click();
+});
 
-uploadFileInput && uploadFileInput.addEventListener('change', () => {
-  const f = uploadFileInput.files && uploadFileInput.files[0];
+function selectUploadFiles(input, folder) {
+  uploadSelection = { files: Array.from(input.files || []), folder };
   if (!uploadFileName) return;
-  if (f) {
-    const sizeMB = (f.size / (1024 * 1024)).toFixed(1);
-    uploadFileName.textContent = `${f.name} (${sizeMB} MB)`;
+  const files = uploadSelection.files;
+  if (files.length) {
+    const sizeMB = (files.reduce((n, f) => n + f.size, 0) / (1024 * 1024)).toFixed(1);
+    const label = files.length === 1 && !folder ? files[0].name : `${files.length} files`;
+    uploadFileName.textContent = `${label} (${sizeMB} MB)`;
     uploadFileName.classList.remove('muted');
   } else {
     uploadFileName.textContent = STRINGS.NO_FILE_SELECTED;
     uploadFileName.classList.add('muted');
   }
-});
+}
+uploadFileInput && uploadFileInput.addEventListener('change', () => selectUploadFiles(uploadFileInput, false));
+uploadFolderInput && uploadFolderInput.addEventListener('change', () => selectUploadFiles(uploadFolderInput, true));
 
 
 uploadForm && uploadForm.addEventListener('submit', async (e) => {
@@ -453,59 +570,106 @@ uploadForm && uploadForm.addEventListener('submit', async (e) => {
     // Keep processing status in results; dialog remains closed
     return;
   }
-  const file = uploadFileInput && uploadFileInput.files && uploadFileInput.files[0];
-  if (!file) {
+  const { files, folder } = uploadSelection;
+  if (!files.length) {
     // No file selected; dialog remains closed
     return;
   }
+  // Several files or a folder go out as one bundle, unpacked on each host
+  const bundle = folder || files.length > 1;
+  const file = files[0];
   const destDir = (uploadDestInput?.value || '').trim();
-  const sizeMB = (file.size / (1024 * 1024)).toFixed(1);
-  const large = file.size > (1024 * 1024 * 1024); // >1 GB
-  const msg = `Upload '${file.name}' (${sizeMB} MB) to ${ips.length} host(s)` + (destDir ? ` at ${destDir}/${file.name}.` : ` at default destination.`) + (large ? `\n\nWarning: Large file; uploads may take time.` : '');
+  const totalBytes = files.reduce((n, f) => n + f.size, 0);
+  const sizeMB = (totalBytes / (1024 * 1024)).toFixed(1);
+  const large = totalBytes > (1024 * 1024 * 1024); // >1 GB
+  const what = bundle ? `${files.length} files` : `'${file.name}'`;
+  const where = bundle ? `${destDir}/` : `${destDir}/${file.name}`;
+  const msg = `Upload ${what} (${sizeMB} MB) to ${ips.length} host(s)` + (destDir ? ` at ${where}.` : ` at default destination.`) + (large ? `\n\nWarning: Large file; uploads may take time.` : '');
   const proceed = window.confirm(msg);
   if (!proceed) return;
   setDisabledState(true);
   try {
     const formData = new FormData();
-    formData.append('file', file);
     formData.append('ips', JSON.stringify(ips));
     if (destDir) formData.append('destDir', destDir);
     const owner = (uploadOwnerInput?.value || '').trim();
     const group = (uploadGroupInput?.value || '').trim();
     if (owner) formData.append('owner', owner);
     if (group) formData.append('group', group);
-    const res = await fetch('/api/upload-copy', { method: 'POST', body: formData });
-    const data = await res.json();
-    if (!data.ok) {
-      // Surface backend error on the main screen
-      showErrorBanner(data.error || 'Upload failed');
-    }
-    currentIPs = ips;
-    const job = { statuses: data.statuses || {}, results: {} };
-    for (const ip of ips) {
-      job.results[ip] = job.results[ip] || {};
-      const r = data.results && data.results[ip];
-      if (r && r.dest) job.results[ip].stdout = `Copied to ${r.dest}`;
-      if (r && r.error) job.results[ip].stderr = r.error;
-    }
-    renderTable(currentIPs, job);
-    // Show a global message if any host failed
-    const statuses = data.statuses || {};
-    const anyFailed = ips.some(ip => statuses[ip] !== 'completed');
-    if (anyFailed) {
-      showErrorBanner(STRINGS.FAILURE_SOME);
+    let url = '/api/upload-copy';
+    if (bundle) {
+      url = '/api/upload-bundle';
+      // The file name carries the path inside the folder, recreated under the destination
+      files.forEach(f => formData.append('files', f, f.webkitRelativePath || f.name));
     } else {
-      showSuccessBanner(STRINGS.SUCCESS_ALL);
+      // Lets the server report progress and ETA while the file streams to the hosts
+      formData.append('size', String(file.size));
+      // Lets the server skip hosts that already hold this file while still streaming it
+      const digest = await fileSha256(file);
+      if (digest) formData.append('sha256', digest);
+      // File goes last so the server knows the targets and can stream it to them as it arrives
+      formData.append('file', file);
     }
+    const res = await fetch(url, { method: 'POST', body: formData });
+    const data = await res.json();
+    await followFileOperation(ips, data, 'Upload failed');
   } catch (err) {
     // Network error; modal remains closed and error shown on main screen
     showErrorBanner(STRINGS.NETWORK_ERROR_PREFIX + err.message);
   } finally {
     setDisabledState(false);
     uploadForm && uploadForm.reset();
+    uploadSelection = { files: [], folder: false };
   }
 });
 
+// Largest file hashed in the browser (Web Crypto needs the whole file in memory)
+const HASH_MAX_BYTES = 512 * 1024 * 1024;
+
+// Hex sha256 of a file, or null when it is too large or Web Crypto is
+// unavailable (plain-HTTP pages); the server then saves and hashes it itself
+async function fileSha256(file) {
+  if (!window.crypto?.subtle || file.size > HASH_MAX_BYTES) return null;
+  const hash = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(hash), b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// Show a file operation's outcome: follow its job (results arrive per host,
+// with transfer progress) or render the inline results of a sync request
+async function followFileOperation(ips, data, failureText) {
+  if (!data.ok) {
+    // Surface backend error on the main screen
+    showErrorBanner(data.error || failureText);
+    return;
+  }
+  currentIPs = ips;
+  lastCommandJob = null;
+  let job = { statuses: data.statuses || {}, results: data.results || {} };
+  if (data.jobId) {
+    renderTable(currentIPs, { statuses: Object.fromEntries(ips.map(ip => [ip, 'queued'])) });
+    job = await watchJob(data.jobId);
+  } else {
+    renderTable(currentIPs, job);
+  }
+  if (!job) return;
+  // Show a global message if any host failed
+  const anyFailed = ips.some(ip => job.statuses[ip] !== 'completed');
+  if (anyFailed) {
+    showErrorBanner(STRINGS.FAILURE_SOME);
+  } else {
+    showSuccessBanner(STRINGS.SUCCESS_ALL);
+  }
+}
+
+// One-line summary of a running transfer: "12.0 / 40.0 MB · 8.5 MB/s · ETA 3s"
+function progressText(p) {
+  const mb = (n) => (n / (1024 * 1024)).toFixed(1);
+  let text = p.totalBytes != null ? `${mb(p.bytesSent)} / ${mb(p.totalBytes)} MB` : `${mb(p.bytesSent)} MB`;
+  text += ` · ${p.mbPerSec} MB/s`;
+  if (p.etaSeconds != null) text += ` · ETA ${Math.round(p.etaSeconds)}s`;
+  return text;
+}
+
 // Copy From VM modal: fetch a file from a source VM and distribute to hosts
 const copyModal = document.getElementById('copy-modal');
 const copyForm = document.getElementById('copy-form');
@@ -514,6 +678,7 @@ const copyCancelBtn = document.getElementById('copy-cancel');
 const srcIpInput = document.getElementById('src-ip');
 const srcUserInput = document.getElementById('src-user');
 const srcPassInput = document.getElementById('src-pass');
+const srcKeyInput = document.getElementById('src-key');
 const srcPortInput = document.getElementById('src-port');
 const srcPathInput = document.getElementById('src-path');
 const destDirInput = document.getElementById('dest-dir');
@@ -542,12 +707,14 @@ copyForm && copyForm.addEventListener('submit', async (e) => {
   const srcIp = (srcIpInput?.value || '').trim();
   const srcUser = (srcUserInput?.value || '').trim();
   const srcPass = (srcPassInput?.value || '').trim();
+  const srcKey = (srcKeyInput?.value || '').trim();
   const srcPort = Number(srcPortInput?.value || 22);
   const srcPath = (srcPathInput?.value || '').trim();
   if (!isValidIPv4(srcIp)) {
     return;
   }
-  if (!srcUser || !srcPass || !srcPath) {
+  // Password or key; the server may also authenticate with its own keys
+  if (!srcUser || !srcPath) {
     return;
   }
   const confirmed = window.confirm(`Copy '${srcPath}' from ${srcIp} to ${ips.length} host(s)?`);
@@ -556,7 +723,7 @@ copyForm && copyForm.addEventListener('submit', async (e) => {
   try {
     const payload = {
       ips,
-      source: { ip: srcIp, username: srcUser, password: srcPass, port: srcPort, path: srcPath },
+      source: { ip: srcIp, username: srcUser, password: srcPass, privateKey: srcKey, port: srcPort, path: srcPath },
       destDir: (destDirInput?.value || '').trim(),
       owner: (copyOwnerInput?.value || '').trim(),
       group: (copyGroupInput?.value || '').trim(),
@@ -567,27 +734,7 @@ copyForm && copyForm.addEventListener('submit', async (e) => {
       body: JSON.stringify(payload),
     });
     const data = await res.json();
-    if (!data.ok) {
-      // Surface backend error on the main screen
-      showErrorBanner(data.error || 'Copy failed');
-    }
-    currentIPs = ips;
-    const job = { statuses: data.statuses || {}, results: {} };
-    for (const ip of ips) {
-      job.results[ip] = job.results[ip] || {};
-      const r = data.results && data.results[ip];
-      if (r && r.dest) job.results[ip].stdout = `Copied to ${r.dest}`;
-      if (r && r.error) job.results[ip].stderr = r.error;
-    }
-    renderTable(currentIPs, job);
-    // Show a global message if any host failed
-    const statuses = data.statuses || {};
-    const anyFailed = ips.some(ip => statuses[ip] !== 'completed');
-    if (anyFailed) {
-      showErrorBanner(STRINGS.FAILURE_SOME);
-    } else {
-      showSuccessBanner(STRINGS.SUCCESS_ALL);
-    }
+    await followFileOperation(ips, data, 'Copy failed');
   } catch (err) {
     // Network error; modal remains closed and error shown on main screen
     showErrorBanner(STRINGS.NETWORK_ERROR_PREFIX + err.message);
@@ -597,6 +744,34 @@ copyForm && copyForm.addEventListener('submit', async (e) => {
     if (copyForm) copyForm.reset();
   }
 });
+
+// Gather Files modal: the form posts natively so the browser streams the archive
+// straight to disk; per-host outcomes are in gather-report.json inside it
+const gatherModal = document.getElementById('gather-modal');
+const gatherForm = document.getElementById('gather-form');
+const gatherError = document.getElementById('gather-error');
+const gatherCancelBtn = document.getElementById('gather-cancel');
+const gatherIpsInput = document.getElementById('gather-ips');
+const gatherPathInput = document.getElementById('gather-path');
+
+gatherCancelBtn && gatherCancelBtn.addEventListener('click', () => {
+  gatherModal.classList.add('hidden');
+});
+
+gatherForm && gatherForm.addEventListener('submit', (e) => {
+  const ips = sanitizeIPs(ipsTextarea.value);
+  const path = (gatherPathInput?.value || '').trim();
+  if (!validateAllIPs(ips) || !path) {
+    e.preventDefault();
+    gatherError.textContent = path ? 'Provide valid target IP addresses.' : 'Provide a path or glob to gather.';
+    gatherError.classList.remove('hidden');
+    return;
+  }
+  gatherIpsInput.value = ips.join(',');
+  gatherError.classList.add('hidden');
+  gatherModal.classList.add('hidden');
+});
+
 // Execute arbitrary command via the main form
 form.addEventListener('submit', async (e) => {
   e.preventDefault();
@@ -620,17 +795,18 @@ form.addEventListener('submit', async (e) => {
   await startJob(ips, command);
 });
 
-// Start a backend job and poll status if needed
+// Start a backend job and poll status if needed; an array of steps runs as a pipeline
 async function startJob(ips, command) {
   // Disable controls until job completes (or polling finishes)
   setDisabledState(true);
   formSuccess && formSuccess.classList.add('hidden');
   try {
-    const res = await fetch('/api/execute', {
+    const pipeline = Array.isArray(command);
+    const res = await fetch(pipeline ? '/api/pipeline' : '/api/execute', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       // Default to async execution; backend returns a jobId and UI polls
-      body: JSON.stringify({ ips, command }),
+      body: JSON.stringify(pipeline ? { ips, steps: command } : { ips, command }),
     });
     const data = await res.json();
     if (!data.ok) {
@@ -640,6 +816,7 @@ async function startJob(ips, command) {
       return;
     }
     currentIPs = ips;
+    lastCommandJob = null;
     if (data.results) {
       renderTable(currentIPs, { statuses: data.statuses || {}, results: data.results, completed: data.completed });
       // Sync execution: results returned immediately; re-enable controls
@@ -647,7 +824,11 @@ async function startJob(ips, command) {
     } else if (data.jobId) {
       // Async execution: show queued state and begin polling
       renderTable(currentIPs, { statuses: Object.fromEntries(ips.map(ip => [ip, 'queued'])) });
-      await pollJob(data.jobId);
+      const job = await watchJob(data.jobId);
+      if (job) {
+        lastCommandJob = { jobId: data.jobId, job };
+        await renderJobResults();
+      }
     }
   } catch (err) {
     formError.textContent = STRINGS.NETWORK_ERROR_PREFIX + err.message;
@@ -669,8 +850,71 @@ function setDisabledState(disabled) {
   }
 }
 
+// Maximum characters of live output kept per host while a job streams
+const LIVE_OUTPUT_CHARS = 2000;
+
+// Follow a job over Server-Sent Events: the server pushes only hosts that
+// changed plus new output chunks and transfer progress. Falls back to polling
+// if the stream fails before delivering anything. Resolves with the final job.
+function watchJob(jobId) {
+  if (!window.EventSource) return pollJob(jobId);
+  return new Promise(resolve => {
+    const job = { statuses: Object.fromEntries(currentIPs.map(ip => [ip, 'queued'])), results: {}, progress: {} };
+    const source = new EventSource(`/api/job/${jobId}/events`);
+    let received = false;
+    let renderPending = false;
+    // Coalesce bursts of events into one table render per frame
+    const scheduleRender = () => {
+      if (renderPending) return;
+      renderPending = true;
+      requestAnimationFrame(() => { renderPending = false; renderTable(currentIPs, job); });
+    };
+    const finish = () => {
+      source.close();
+      renderTable(currentIPs, job);
+      setDisabledState(false);
+      resolve(job);
+    };
+    source.addEventListener('host', (e) => {
+      received = true;
+      const msg = JSON.parse(e.data);
+      job.statuses[msg.ip] = msg.status;
+      if (msg.result) {
+        job.results[msg.ip] = msg.result;
+        delete job.progress[msg.ip];
+      }
+      scheduleRender();
+    });
+    source.addEventListener('output', (e) => {
+      received = true;
+      const msg = JSON.parse(e.data);
+      const res = job.results[msg.ip] || (job.results[msg.ip] = { stdout: '', stderr: '' });
+      res.stdout = ((res.stdout || '') + msg.stdout).slice(-LIVE_OUTPUT_CHARS);
+      res.stderr = ((res.stderr || '') + msg.stderr).slice(-LIVE_OUTPUT_CHARS);
+      scheduleRender();
+    });
+    source.addEventListener('progress', (e) => {
+      received = true;
+      const msg = JSON.parse(e.data);
+      job.progress[msg.ip] = msg;
+      scheduleRender();
+    });
+    source.addEventListener('done', () => {
+      job.completed = true;
+      finish();
+    });
+    source.onerror = () => {
+      // EventSource reconnects on its own (resuming via Last-Event-ID) once it has connected
+      if (received) return;
+      source.close();
+      pollJob(jobId).then(resolve);
+    };
+  });
+}
+
 async function pollJob(jobId) {
   let completed = false;
+  let job = null;
   while (!completed) {
     const res = await fetch(`/api/job/${jobId}`);
     const data = await res.json();
@@ -679,11 +923,12 @@ async function pollJob(jobId) {
       formError.classList.remove('hidden');
       break;
     }
-    const job = data.job;
+    job = data.job;
     renderTable(currentIPs, job);
     completed = !!job.completed;
     if (!completed) await new Promise(r => setTimeout(r, 1000));
   }
   // Job completed; re-enable controls
   setDisabledState(false);
+  return job;
 }
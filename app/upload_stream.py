@@ -0,0 +1,116 @@
+from typing import BinaryIO, Dict, Iterator, Optional
+
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+# Form fields are small (IP lists, paths); anything bigger is not a field we expect
+MAX_FIELD_BYTES = 1024 * 1024
+
+
+class MultipartIngest:
+    """Read a multipart/form-data request body incrementally.
+
+    Form fields are collected as they arrive. Each file part is handed out
+    block by block (`file_blocks`) instead of being written to disk, so the
+    caller can send it on while the rest of the body is still in flight.
+    Fields that precede a file are therefore known before any of its data
+    is read; fields after it only once the file has been consumed.
+    """
+
+    def __init__(self, stream: BinaryIO, boundary: bytes, read_bytes: int = 1024 * 1024):
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary)
+        self.read_bytes = max(4096, read_bytes)
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.file_bytes = 0
+        self._in_file = False
+        self._file_taken = False
+        self._done = False
+
+    def read_fields(self) -> Optional[str]:
+        """Collect fields up to the start of the next file part; returns its
+        filename, None at the end of the body.
+
+        Unread data of the current file part is skipped.
+        """
+        self._skip_file()
+        while not self._done:
+            event = self._next()
+            if isinstance(event, File):
+                self.filename = event.filename
+                self.file_bytes = 0
+                self._in_file = True
+                self._file_taken = False
+                return self.filename
+            self._consume(event)
+        return None
+
+    def file_blocks(self) -> Iterator[bytes]:
+        """Yield the current file part's data as it arrives. Can only be iterated once."""
+        if self._file_taken or not self._in_file:
+            raise RuntimeError("Upload stream already consumed")
+        self._file_taken = True
+        while self._in_file:
+            event = self._next()
+            if not isinstance(event, Data):
+                raise ValueError("Malformed multipart body")
+            self._in_file = event.more_data
+            if event.data:
+                self.file_bytes += len(event.data)
+                yield event.data
+
+    def save_file(self, path: str) -> int:
+        """Write the current file part to path; returns its size."""
+        with open(path, "wb") as f:
+            for block in self.file_blocks():
+                f.write(block)
+        return self.file_bytes
+
+    def read_rest(self):
+        """Consume the remainder of the body, collecting any later fields.
+
+        File data nobody read (e.g. every target failed early) is discarded.
+        """
+        self._skip_file()
+        while not self._done:
+            self._consume(self._next())
+
+    # -- internals --------------------------------------------------------
+
+    def _skip_file(self):
+        while self._in_file:
+            event = self._next()
+            self._in_file = isinstance(event, Data) and event.more_data
+
+    def _next(self):
+        while True:
+            event = self._decoder.next_event()
+            if not isinstance(event, NeedData):
+                if isinstance(event, Epilogue):
+                    self._done = True
+                return event
+            if self._decoder.complete:
+                raise ValueError("Unexpected end of multipart body")
+            chunk = self._stream.read(self.read_bytes)
+            self._decoder.receive_data(chunk or None)
+
+    def _consume(self, event):
+        """Handle an event outside the streamed file part."""
+        if isinstance(event, Field):
+            value = bytearray()
+            while True:
+                data = self._next()
+                if not isinstance(data, Data):
+                    raise ValueError("Malformed multipart body")
+                value += data.data
+                if len(value) > MAX_FIELD_BYTES:
+                    raise ValueError(f"Form field too large: {event.name}")
+                if not data.more_data:
+                    break
+            self.fields[event.name] = value.decode("utf-8", "replace")
+        elif isinstance(event, File):
+            # Files after read_fields() stopped looking for them are skipped
+            while True:
+                data = self._next()
+                if not isinstance(data, Data) or not data.more_data:
+                    break
@@ -0,0 +1,63 @@
+"""Worker process running /api/execute jobs queued by the web processes.
+
+With JOB_STORE=sqlite and JOB_DISPATCH=worker, the web processes only
+queue jobs in the shared store; start one or more workers (same
+environment, same machine) to run them:
+
+    JOB_STORE=sqlite JOB_DISPATCH=worker python -m app.worker
+
+Each worker runs up to WORKER_MAX_JOBS jobs at once on its own scheduler
+and SSH pool, writing statuses and results back to the store where any web
+process can serve them.
+"""
+import logging
+import threading
+import time
+
+from . import create_app, routes
+from .scheduler import when_all_done
+from .ssh_executor import error_result
+
+# Idle wait between checks for queued jobs
+_IDLE_SECONDS = 0.2
+
+log = logging.getLogger(__name__)
+
+
+def main():
+    app = create_app()
+    manager = routes.job_manager
+    if not hasattr(manager, "claim_job"):
+        raise SystemExit("app.worker requires JOB_STORE=sqlite")
+    worker = manager.owner
+    slots = threading.Semaphore(max(1, app.config["WORKER_MAX_JOBS"]))
+    log.info("worker %s running up to %d jobs", worker, app.config["WORKER_MAX_JOBS"])
+    while True:
+        slots.acquire()
+        try:
+            job = manager.claim_job(worker)
+        except Exception:
+            log.exception("claiming a job failed")
+            job = None
+        if job is None:
+            slots.release()
+            time.sleep(_IDLE_SECONDS)
+            continue
+        try:
+            with app.app_context():
+                futures = routes.run_execute_job(job["jobId"], job["ips"], job["command"], job["probe"])
+        except Exception as e:
+            log.exception("job %s failed to start", job["jobId"])
+            for ip in job["ips"]:
+                manager.store_result(job["jobId"], ip, error_result(e))
+                manager.update_status(job["jobId"], ip, "failed")
+            manager.finalize_job(job["jobId"])
+            slots.release()
+            continue
+        when_all_done(futures, slots.release)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("paramiko").setLevel(logging.WARNING)
+    main()
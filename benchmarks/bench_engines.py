@@ -0,0 +1,96 @@
+"""Compare the thread and asyncio execution engines on a mock SSH fleet.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_engines --hosts 500 --latency 0.5
+
+Each engine runs in its own process against the same mock fleet (itself in
+a separate process), so wall time, peak thread count and peak RSS reflect
+only the app side of the fan-out.
+"""
+import argparse
+import json
+import os
+import resource
+import threading
+import time
+
+from .mock_ssh import FleetProcess, MockBehavior
+
+
+def _run_engine(engine, port, ips, args, conn):
+    import logging
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    logging.getLogger("asyncssh").setLevel(logging.CRITICAL)
+    os.environ.update(
+        EXECUTION_ENGINE=engine,
+        SSH_USERNAME="user",
+        SSH_PASSWORD="secret",
+        # The mock fleet makes up a new host key every run
+        SSH_HOST_KEY_POLICY="off",
+        SSH_DEFAULT_PORT=str(port),
+        SSH_TIMEOUT_SECONDS=str(args.timeout),
+        MAX_PARALLEL=str(args.threads),
+        ASYNC_MAX_CONCURRENCY=str(args.hosts),
+    )
+    from app import create_app
+
+    app = create_app()
+    client = app.test_client()
+    peak_threads = [threading.active_count()]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+            time.sleep(0.05)
+
+    threading.Thread(target=sample, daemon=True).start()
+    runs = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        resp = client.post("/api/execute", json={"ips": ips, "command": "true", "mode": "sync"})
+        elapsed = time.perf_counter() - start
+        statuses = resp.get_json()["statuses"]
+        runs.append({
+            "seconds": round(elapsed, 3),
+            "hostsPerSec": round(len(ips) / elapsed, 1),
+            "failed": sum(1 for s in statuses.values() if s != "completed"),
+        })
+    stop.set()
+    conn.send({
+        "engine": engine,
+        "runs": runs,
+        "peakThreads": peak_threads[0],
+        "peakRssMB": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5, help="mock command latency (s)")
+    parser.add_argument("--output-bytes", type=int, default=1024)
+    parser.add_argument("--threads", type=int, default=30, help="MAX_PARALLEL for the thread engine")
+    parser.add_argument("--repeat", type=int, default=2, help="runs per engine (first includes handshakes)")
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument("--engines", default="thread,asyncio")
+    args = parser.parse_args()
+
+    import multiprocessing as mp
+
+    behavior = MockBehavior(command_latency=args.latency, output_bytes=args.output_bytes, run_commands=False)
+    ctx = mp.get_context("spawn")
+    report = []
+    with FleetProcess(args.hosts, behavior) as fleet:
+        for engine in args.engines.split(","):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_run_engine, args=(engine, fleet.port, fleet.ips, args, child))
+            proc.start()
+            report.append(parent.recv())
+            proc.join()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Benchmark the fan-out endpoints end to end on a mock SSH fleet.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_fleet --hosts 200 --latency 0.2 --size-mb 4
+    python -m benchmarks.bench_fleet --hosts 200 --baseline last.json
+
+The app is driven through the Flask test client, so the numbers include
+routing, job bookkeeping and JSON on top of SSH. Scenarios:
+
+- execute-sync:  POST /api/execute with mode=sync
+- execute-async: POST /api/execute, then follow /api/job/<id>/changes long-polls
+- upload-copy:   multipart upload of a --size-mb file to every host, as a job
+- copy-from-vm:  the same file pulled from the first host and sent to all, as a job
+
+Each scenario runs in its own process against the same mock fleet (itself
+in a separate process), so peak RSS is that of one scenario. Per-host
+latency is the host's wall-clock `total` timing (from submission to result)
+for sync runs, and the time from the POST until the host's result shows up
+in a changes poll for jobs.
+Every mock host has its own SFTP filesystem and commands are simulated, so
+file operations measure transfer and bookkeeping, not the target's mv/chown.
+
+With --baseline, hostsPerSec and MBps are compared against an earlier
+report and the exit status is 1 if any drops by more than --tolerance.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from .mock_ssh import FleetProcess, MockBehavior
+
+SCENARIOS = ("execute-sync", "execute-async", "upload-copy", "copy-from-vm")
+
+# Where copy-from-vm reads from on the source host (inside its own SFTP root)
+_SOURCE_PATH = "/srv/bench-source.bin"
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, max(0, math.ceil(pct / 100 * len(values)) - 1))], 4)
+
+
+def _follow(client, job_id, started, timeout):
+    """Per-host seconds from `started` until each result appeared, plus the final job."""
+    done = {}
+    since = 0
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        resp = client.get(f"/api/job/{job_id}/changes?since={since}&wait=5")
+        changes = resp.get_json()["changes"]
+        now = time.perf_counter()
+        for ip, res in changes["results"].items():
+            done.setdefault(ip, (now - started, bool(res.get("ok"))))
+        since = changes["seq"]
+        if changes["completed"]:
+            break
+    job = client.get(f"/api/job/{job_id}").get_json()["job"]
+    return done, job
+
+
+def _execute_sync(client, ips, args):
+    started = time.perf_counter()
+    resp = client.post("/api/execute", json={"ips": ips, "command": "true", "mode": "sync"})
+    elapsed = time.perf_counter() - started
+    results = resp.get_json()["results"]
+    latencies = [r["timings"]["total"] for r in results.values() if "total" in (r.get("timings") or {})]
+    failed = sum(1 for r in results.values() if not r.get("ok"))
+    return elapsed, latencies, failed, 0
+
+
+def _execute_async(client, ips, args):
+    started = time.perf_counter()
+    job_id = client.post("/api/execute", json={"ips": ips, "command": "true"}).get_json()["jobId"]
+    done, _ = _follow(client, job_id, started, args.timeout * 4)
+    elapsed = time.perf_counter() - started
+    return elapsed, [s for s, _ in done.values()], len(ips) - sum(1 for _, ok in done.values() if ok), 0
+
+
+def _upload_copy(client, ips, args):
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    started = time.perf_counter()
+    # Fields before the file, as the UI sends them, so the upload streams to targets
+    resp = client.post("/api/upload-copy", content_type="multipart/form-data", data={
+        "ips": ",".join(ips),
+        "destDir": "/srv/bench",
+        "file": (io.BytesIO(payload), "bench.bin"),
+    })
+    job_id = resp.get_json()["jobId"]
+    done, _ = _follow(client, job_id, started, args.timeout * 4)
+    elapsed = time.perf_counter() - started
+    return elapsed, [s for s, _ in done.values()], len(ips) - sum(1 for _, ok in done.values() if ok), len(payload)
+
+
+def _copy_from_vm(client, ips, args):
+    started = time.perf_counter()
+    resp = client.post("/api/copy-from-vm", json={
+        "ips": ips,
+        "destDir": "/srv/bench",
+        "source": {"ip": ips[0], "username": "user", "password": "secret", "path": _SOURCE_PATH},
+    })
+    job_id = resp.get_json()["jobId"]
+    done, _ = _follow(client, job_id, started, args.timeout * 4)
+    elapsed = time.perf_counter() - started
+    return elapsed, [s for s, _ in done.values()], len(ips) - sum(1 for _, ok in done.values() if ok), \
+        args.size_mb * 1024 * 1024
+
+
+_RUNNERS = {
+    "execute-sync": _execute_sync,
+    "execute-async": _execute_async,
+    "upload-copy": _upload_copy,
+    "copy-from-vm": _copy_from_vm,
+}
+
+
+def _run_scenario(name, port, ips, args, conn):
+    import logging
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    os.environ.update(
+        SSH_USERNAME="user",
+        SSH_PASSWORD="secret",
+        # The mock fleet makes up a new host key every run
+        SSH_HOST_KEY_POLICY="off",
+        SSH_DEFAULT_PORT=str(port),
+        SSH_TIMEOUT_SECONDS=str(args.timeout),
+        MAX_PARALLEL=str(args.threads),
+    )
+    from app import create_app
+
+    app = create_app()
+    client = app.test_client()
+    runs = []
+    for _ in range(args.repeat):
+        elapsed, latencies, failed, size = _RUNNERS[name](client, ips, args)
+        run = {
+            "seconds": round(elapsed, 3),
+            "hostsPerSec": round(len(ips) / elapsed, 1),
+            "p50": _percentile(latencies, 50),
+            "p99": _percentile(latencies, 99),
+            "failed": failed,
+        }
+        if size:
+            run["MBps"] = round(size * (len(ips) - failed) / elapsed / 1e6, 1)
+        runs.append(run)
+        _clear_stage(args.host_root)
+    conn.send({
+        "scenario": name,
+        "hosts": len(ips),
+        "runs": runs,
+        "peakRssMB": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    })
+
+
+def _clear_stage(host_root):
+    """Drop files the last run staged on the mock hosts (mv is simulated, so they stay)."""
+    for host in os.listdir(host_root):
+        tmp = os.path.join(host_root, host, "tmp")
+        for name in os.listdir(tmp) if os.path.isdir(tmp) else ():
+            os.remove(os.path.join(tmp, name))
+
+
+def _regressions(report, baseline, tolerance):
+    """Scenario metrics that fell more than tolerance below the baseline's best run."""
+    best = {}
+    for entry in baseline:
+        for key in ("hostsPerSec", "MBps"):
+            values = [r[key] for r in entry["runs"] if key in r]
+            if values:
+                best[(entry["scenario"], key)] = max(values)
+    found = []
+    for entry in report:
+        for key in ("hostsPerSec", "MBps"):
+            values = [r[key] for r in entry["runs"] if key in r]
+            before = best.get((entry["scenario"], key))
+            if values and before and max(values) < before * (1 - tolerance):
+                found.append(f"{entry['scenario']} {key}: {max(values)} < {before}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2, help="mock command latency (s)")
+    parser.add_argument("--handshake-delay", type=float, default=0.0, help="mock delay before key exchange (s)")
+    parser.add_argument("--output-bytes", type=int, default=1024)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of commands that fail")
+    parser.add_argument("--size-mb", type=int, default=4, help="file size for upload-copy and copy-from-vm")
+    parser.add_argument("--threads", type=int, default=30, help="MAX_PARALLEL")
+    parser.add_argument("--repeat", type=int, default=2, help="runs per scenario (first includes handshakes)")
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--baseline", help="earlier JSON report to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed throughput drop vs baseline")
+    args = parser.parse_args()
+
+    names = [n for n in args.scenarios.split(",") if n]
+    unknown = [n for n in names if n not in _RUNNERS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    import multiprocessing as mp
+
+    args.host_root = tempfile.mkdtemp(prefix="bench-fleet-")
+    behavior = MockBehavior(
+        handshake_delay=args.handshake_delay,
+        command_latency=args.latency,
+        output_bytes=args.output_bytes,
+        failure_rate=args.failure_rate,
+        run_commands=False,
+        host_root=args.host_root,
+    )
+    ctx = mp.get_context("spawn")
+    report = []
+    try:
+        with FleetProcess(args.hosts, behavior) as fleet:
+            source = os.path.join(args.host_root, fleet.ips[0], _SOURCE_PATH.lstrip("/"))
+            os.makedirs(os.path.dirname(source), exist_ok=True)
+            with open(source, "wb") as f:
+                f.write(os.urandom(args.size_mb * 1024 * 1024))
+            for name in names:
+                parent, child = ctx.Pipe()
+                proc = ctx.Process(target=_run_scenario, args=(name, fleet.port, fleet.ips, args, child))
+                proc.start()
+                report.append(parent.recv())
+                proc.join()
+    finally:
+        shutil.rmtree(args.host_root, ignore_errors=True)
+    print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = _regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"regression: {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
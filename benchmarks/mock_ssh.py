@@ -0,0 +1,489 @@
+"""In-process mock SSH/SFTP servers on loopback ports for local benchmarks."""
+import os
+import random
+import socket
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import paramiko
+
+
+@dataclass
+class MockBehavior:
+    username: str = "user"
+    password: str = "secret"
+    handshake_delay: float = 0.0
+    command_latency: float = 0.0
+    output_bytes: int = 0
+    failure_rate: float = 0.0
+    # Run the real command through /bin/bash (with a pass-through sudo shim)
+    run_commands: bool = True
+    # Give each host its own SFTP filesystem under <host_root>/<ip>. Commands
+    # still run on the shared one, so multi-host file benchmarks pair this
+    # with run_commands=False (placement then always "succeeds").
+    host_root: Optional[str] = None
+
+
+_SUDO_SHIM_DIR = None
+
+
+def _sudo_shim_dir() -> str:
+    """A PATH directory whose `sudo` drops its flags and runs the command."""
+    global _SUDO_SHIM_DIR
+    if _SUDO_SHIM_DIR is None:
+        import tempfile
+        d = tempfile.mkdtemp(prefix="mock-sudo-")
+        path = os.path.join(d, "sudo")
+        with open(path, "w") as f:
+            f.write(
+                "#!/bin/bash\n"
+                "while [ $# -gt 0 ]; do case \"$1\" in\n"
+                "  -S) [ -t 0 ] || IFS= read -r _pw; shift ;;\n"
+                "  -p) shift 2 ;;\n"
+                "  -v|-k|-n) [ \"$1\" = -v ] && [ $# -eq 1 ] && exit 0; shift ;;\n"
+                "  -*) shift ;;\n"
+                "  *) break ;;\n"
+                "esac; done\n"
+                "[ $# -eq 0 ] && exit 0\n"
+                "exec \"$@\"\n"
+            )
+        os.chmod(path, 0o755)
+        _SUDO_SHIM_DIR = d
+    return _SUDO_SHIM_DIR
+
+
+class _StubSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        try:
+            paramiko.SFTPServer.set_file_attr(self.filename, attr)
+            return paramiko.SFTP_OK
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class _StubSFTPServer(paramiko.SFTPServerInterface):
+    """Maps SFTP requests onto the local filesystem, below root if given."""
+
+    def __init__(self, server, *args, root: Optional[str] = None, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _local(self, path):
+        if self.root is None:
+            return path
+        return os.path.join(self.root, self.canonicalize(path).lstrip("/"))
+
+    def list_folder(self, path):
+        path = self._local(path)
+        try:
+            out = []
+            for name in os.listdir(path):
+                # lstat, like OpenSSH's readdir, so symlinks show as links
+                attr = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)))
+                attr.filename = name
+                out.append(attr)
+            return out
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        path = self._local(path)
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        path = self._local(path)
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        path = self._local(path)
+        try:
+            binary_flag = getattr(os, "O_BINARY", 0)
+            flags |= binary_flag
+            mode = getattr(attr, "st_mode", None) or 0o666
+            fd = os.open(path, flags, mode)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if (flags & os.O_CREAT) and (attr is not None):
+            attr._flags &= ~attr.FLAG_PERMISSIONS
+            paramiko.SFTPServer.set_file_attr(path, attr)
+        if flags & os.O_WRONLY:
+            fstr = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            fstr = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            fstr = "rb"
+        try:
+            f = os.fdopen(fd, fstr)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        fobj = _StubSFTPHandle(flags)
+        fobj.filename = path
+        fobj.readfile = f
+        fobj.writefile = f
+        return fobj
+
+    def remove(self, path):
+        path = self._local(path)
+        try:
+            os.remove(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        oldpath, newpath = self._local(oldpath), self._local(newpath)
+        try:
+            os.rename(oldpath, newpath)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    posix_rename = rename
+
+    def mkdir(self, path, attr):
+        path = self._local(path)
+        try:
+            os.mkdir(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rmdir(self, path):
+        path = self._local(path)
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        path = self._local(path)
+        try:
+            paramiko.SFTPServer.set_file_attr(path, attr)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def canonicalize(self, path):
+        return os.path.normpath(path if os.path.isabs(path) else os.path.join("/", path))
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, behavior: MockBehavior):
+        self.behavior = behavior
+
+    def check_auth_password(self, username, password):
+        b = self.behavior
+        if username == b.username and password == b.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL if username == self.behavior.username else paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password,publickey"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        threading.Thread(target=self._run, args=(channel, None), daemon=True).start()
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self._run, args=(channel, command.decode("utf-8", "replace")), daemon=True).start()
+        return True
+
+    def _run(self, channel, command: Optional[str]):
+        b = self.behavior
+        try:
+            if b.command_latency:
+                time.sleep(b.command_latency)
+            if b.failure_rate and random.random() < b.failure_rate:
+                channel.sendall_stderr(b"mock: injected failure\n")
+                channel.send_exit_status(1)
+                return
+            if not b.run_commands:
+                if b.output_bytes:
+                    chunk = b"x" * 8191 + b"\n"
+                    left = b.output_bytes
+                    while left > 0:
+                        channel.sendall(chunk[:left])
+                        left -= len(chunk)
+                channel.send_exit_status(0)
+                return
+            env = dict(os.environ)
+            env["PATH"] = _sudo_shim_dir() + os.pathsep + env.get("PATH", "")
+            if command is not None and command.startswith("/bin/bash -lc "):
+                # Skip login profiles so the sudo shim stays first on PATH
+                command = "/bin/bash -c " + command[len("/bin/bash -lc "):]
+            argv = ["/bin/bash", "-c", command] if command is not None else ["/bin/bash"]
+            proc = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, env=env)
+
+            def pump_in():
+                try:
+                    while True:
+                        data = channel.recv(32768)
+                        if not data:
+                            break
+                        proc.stdin.write(data)
+                        proc.stdin.flush()
+                except Exception:
+                    pass
+                finally:
+                    try:
+                        proc.stdin.close()
+                    except Exception:
+                        pass
+
+            def pump_err():
+                for data in iter(lambda: proc.stderr.read1(32768), b""):
+                    channel.sendall_stderr(data)
+
+            ti = threading.Thread(target=pump_in, daemon=True)
+            te = threading.Thread(target=pump_err, daemon=True)
+            ti.start()
+            te.start()
+            for data in iter(lambda: proc.stdout.read1(32768), b""):
+                channel.sendall(data)
+            te.join()
+            rc = proc.wait()
+            if b.output_bytes:
+                channel.sendall(b"x" * b.output_bytes)
+            channel.send_exit_status(rc)
+        except Exception:
+            try:
+                channel.send_exit_status(255)
+            except Exception:
+                pass
+        finally:
+            try:
+                channel.shutdown_write()
+                time.sleep(0.01)
+                channel.close()
+            except Exception:
+                pass
+
+
+class MockSSHFleet:
+    """N mock SSH hosts on distinct loopback addresses sharing one port."""
+
+    _host_key = None
+
+    def __init__(self, count: int = 1, behavior: Optional[MockBehavior] = None, port: int = 0):
+        self.count = count
+        self.behavior = behavior or MockBehavior()
+        self.port = port
+        self.ips: List[str] = []
+        self._socks: List[socket.socket] = []
+        self._stop = threading.Event()
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def host_key(cls):
+        if cls._host_key is None:
+            cls._host_key = paramiko.ECDSAKey.generate()
+        return cls._host_key
+
+    def start(self):
+        # Every mock host gets its own loopback address and they all share one
+        # port, so the app can address them exactly like a real fleet.
+        for i in range(self.count):
+            ip = f"127.0.{1 + i // 250}.{1 + i % 250}"
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((ip, self.port))
+            s.listen(1024)
+            self.port = s.getsockname()[1]
+            self._socks.append(s)
+            self.ips.append(ip)
+            threading.Thread(target=self._accept_loop, args=(s,), daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for s in self._socks:
+            try:
+                s.close()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _accept_loop(self, s):
+        while not self._stop.is_set():
+            try:
+                conn, _ = s.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with self._lock:
+            self.connections += 1
+        if self.behavior.handshake_delay:
+            time.sleep(self.behavior.handshake_delay)
+        t = paramiko.Transport(conn)
+        t.add_server_key(self.host_key())
+        root = None
+        if self.behavior.host_root:
+            root = os.path.join(self.behavior.host_root, conn.getsockname()[0])
+            os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+        t.set_subsystem_handler("sftp", paramiko.SFTPServer, _StubSFTPServer, root=root)
+        try:
+            t.start_server(server=_ServerInterface(self.behavior))
+        except Exception:
+            t.close()
+
+
+class LatencyProxy:
+    """TCP forwarder that delays each direction by rtt/2, to emulate a WAN link.
+
+    Data is delayed, not throttled: bytes keep flowing while earlier ones
+    are in flight, so pipelined protocols benefit exactly as over a real
+    high-latency link.
+    """
+
+    def __init__(self, listen_host: str, target_host: str, target_port: int, rtt: float, port: int = 0):
+        self.listen_host = listen_host
+        self.target = (target_host, target_port)
+        self.delay = rtt / 2
+        self.port = port
+        self._sock = None
+
+    def start(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind((self.listen_host, self.port))
+        s.listen(64)
+        self.port = s.getsockname()[1]
+        self._sock = s
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._sock is not None:
+            self._sock.close()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(self.target)
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._pipe(client, upstream)
+            self._pipe(upstream, client)
+
+    def _pipe(self, src, dst):
+        import queue
+
+        q = queue.Queue()
+
+        def read():
+            while True:
+                try:
+                    data = src.recv(65536)
+                except OSError:
+                    data = b""
+                q.put((time.monotonic() + self.delay, data))
+                if not data:
+                    return
+
+        def write():
+            while True:
+                due, data = q.get()
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                if not data:
+                    try:
+                        dst.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+                    return
+                try:
+                    dst.sendall(data)
+                except OSError:
+                    return
+
+        threading.Thread(target=read, daemon=True).start()
+        threading.Thread(target=write, daemon=True).start()
+
+
+def _fleet_main(count, behavior, conn):
+    import logging
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    fleet = MockSSHFleet(count, behavior).start()
+    conn.send((fleet.port, fleet.ips))
+    # Serve until the parent closes its end of the pipe
+    try:
+        conn.recv()
+    except EOFError:
+        pass
+    fleet.stop()
+
+
+class FleetProcess:
+    """Run a MockSSHFleet in a child process so it does not skew client-side measurements."""
+
+    def __init__(self, count: int, behavior: Optional[MockBehavior] = None):
+        self.count = count
+        self.behavior = behavior or MockBehavior()
+        self.port = 0
+        self.ips: List[str] = []
+        self._proc = None
+        self._conn = None
+
+    def start(self):
+        import multiprocessing as mp
+        ctx = mp.get_context("spawn")
+        parent, child = ctx.Pipe()
+        self._proc = ctx.Process(target=_fleet_main, args=(self.count, self.behavior, child), daemon=True)
+        self._proc.start()
+        self._conn = parent
+        self.port, self.ips = parent.recv()
+        return self
+
+    def stop(self):
+        if self._conn is not None:
+            self._conn.close()
+        if self._proc is not None:
+            self._proc.join(timeout=5)
+            if self._proc.is_alive():
+                self._proc.kill()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,14 @@
+import logging
+
+import pytest
+
+from benchmarks.mock_ssh import MockBehavior, MockSSHFleet
+
+
+@pytest.fixture
+def fleet():
+    """Two mock SSH hosts on loopback that accept user/secret."""
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    fleet = MockSSHFleet(2, MockBehavior(username="user", password="secret", run_commands=False)).start()
+    yield fleet
+    fleet.stop()
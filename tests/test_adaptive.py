@@ -0,0 +1,97 @@
+import paramiko
+
+from app import adaptive
+from app.adaptive import AdaptiveLimiter
+from app.scheduler import FleetScheduler
+
+
+def _run(limiter, connects=(), error=None, handshake=False):
+    """One operation at the limit, reporting what it saw of the SSH layer."""
+    held = [limiter.acquire() for _ in range(int(limiter.limit) - 1)]
+    feedback = limiter.acquire()
+    with adaptive.observe(feedback):
+        for seconds in connects:
+            adaptive.report_connect(seconds)
+        if error is not None:
+            adaptive.report_failure(error, handshake=handshake)
+    limiter.release(feedback)
+    for other in held:
+        # Only the observed operation may move the limit
+        other.failed = True
+        limiter.release(other)
+    return feedback
+
+
+def test_slow_start_adds_one_per_success_at_the_limit():
+    limiter = AdaptiveLimiter("test", initial=4, maximum=100)
+    for _ in range(3):
+        _run(limiter)
+    assert limiter.stats()["limit"] == 7
+
+
+def test_no_growth_below_the_limit():
+    limiter = AdaptiveLimiter("test", initial=4)
+    feedback = limiter.acquire()
+    limiter.release(feedback)
+    assert limiter.limit == 4
+
+
+def test_handshake_overload_halves_once_per_window():
+    limiter = AdaptiveLimiter("test", initial=16, minimum=2)
+    started = [limiter.acquire() for _ in range(4)]
+    for feedback in started:
+        feedback.failed = feedback.overload = True
+        limiter.release(feedback)
+    # Four failures of operations started before the cut only cut once
+    assert limiter.limit == 8
+    assert limiter.stats()["decisions"]["decrease"] == 1
+    assert not limiter.stats()["slowStart"]
+
+
+def test_backoff_never_goes_below_the_minimum():
+    limiter = AdaptiveLimiter("test", initial=3, minimum=2)
+    for _ in range(5):
+        _run(limiter, error=paramiko.SSHException("Error reading SSH protocol banner"), handshake=True)
+    assert limiter.limit == 2
+
+
+def test_congestion_avoidance_grows_about_one_per_window():
+    limiter = AdaptiveLimiter("test", initial=10)
+    _run(limiter, error=paramiko.SSHException("reset"), handshake=True)
+    assert limiter.limit == 5
+    for _ in range(5):
+        _run(limiter)
+    assert 5.9 < limiter.limit < 6.1
+
+
+def test_auth_and_host_key_failures_are_not_overload():
+    limiter = AdaptiveLimiter("test", initial=8)
+    feedback = _run(limiter, error=paramiko.AuthenticationException("denied"), handshake=True)
+    assert feedback.failed and not feedback.overload
+    assert limiter.limit == 8
+
+
+def test_slow_connects_hold_the_limit():
+    limiter = AdaptiveLimiter("test", initial=4, latency_tolerance=2.0)
+    _run(limiter, connects=[0.1])
+    grown = limiter.limit
+    _run(limiter, connects=[0.5])
+    assert limiter.limit == grown
+    assert limiter.stats()["decisions"]["hold"] == 1
+
+
+def test_scheduler_holds_each_kind_to_its_limit():
+    limiter = AdaptiveLimiter("command", initial=2, maximum=2)
+    scheduler = FleetScheduler(max_workers=8, per_host_limit=8, limiters={"command": limiter})
+    peak = [0]
+
+    def task():
+        peak[0] = max(peak[0], limiter.inflight)
+
+    futures = [scheduler.submit("job", f"10.0.0.{i}", task) for i in range(10)]
+    for fut in futures:
+        fut.result(5)
+    scheduler.shutdown()
+    assert peak[0] <= 2
+    assert adaptive.operation_kind("file-abc") == "transfer"
+    assert adaptive.operation_kind("gather-abc") == "gather"
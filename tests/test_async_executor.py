@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("asyncssh")
+
+from app.async_executor import AsyncExecutionEngine  # noqa: E402
+
+
+@pytest.fixture
+def engine():
+    engine = AsyncExecutionEngine(max_concurrency=10)
+    yield engine
+    engine.close()
+
+
+def test_runs_a_command_and_reports_total_time(fleet, engine):
+    result = engine.submit(fleet.ips[0], fleet.port, "user", "secret", "true", 5).result(10)
+    assert result["ok"]
+    assert result["timings"]["total"] >= result["timings"]["connect"]
+
+
+def test_channel_semaphores_only_outlive_runs_with_a_live_connection(fleet, engine):
+    assert engine.submit(fleet.ips[0], fleet.port, "user", "secret", "true", 5).result(10)["ok"]
+    with pytest.raises(RuntimeError):
+        engine.submit(fleet.ips[0], fleet.port, "user", "wrong", "true", 5).result(10)
+    with pytest.raises(RuntimeError):
+        engine.submit(fleet.ips[1], fleet.port, "user", "wrong", "true", 5).result(10)
+    assert len(engine._host_sems) == 1
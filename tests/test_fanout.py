@@ -0,0 +1,78 @@
+import os
+import threading
+
+import pytest
+
+from app.fanout import BlockFanout
+
+
+def _drain(reader):
+    data = b""
+    while True:
+        block = reader.read()
+        if not block:
+            return data
+        data += block
+
+
+def _publish(fanout, blocks):
+    for block in blocks:
+        fanout.publish(block)
+    fanout.close()
+
+
+def test_stream_that_fits_is_served_to_late_readers():
+    fanout = BlockFanout(max_buffer_bytes=100)
+    first, late = fanout.reader(), fanout.reader()
+    assert first.start()
+    _publish(fanout, [b"abc", b"def"])
+    assert late.start()
+    assert _drain(first) == b"abcdef"
+    assert _drain(late) == b"abcdef"
+
+
+def test_spill_lets_the_producer_run_ahead_of_every_reader(tmp_path):
+    path = str(tmp_path / "spill.bin")
+    fanout = BlockFanout(max_buffer_bytes=4, spill_path=path)
+    first, late = fanout.reader(), fanout.reader()
+    assert first.start()
+    # Nobody reads while this runs: with a spill file publish must not block
+    _publish(fanout, [b"aaaa", b"bbbb", b"cccc"])
+    assert fanout.spilled
+    assert late.start()
+    assert _drain(late) == b"aaaabbbbcccc"
+    assert _drain(first) == b"aaaabbbbcccc"
+    fanout.discard()
+    assert not os.path.exists(path)
+
+
+def test_without_spill_unstarted_readers_are_dropped_once_the_window_moves():
+    fanout = BlockFanout(max_buffer_bytes=4)
+    first, late = fanout.reader(), fanout.reader()
+    assert first.start()
+    received = []
+    consumer = threading.Thread(target=lambda: received.append(_drain(first)))
+    consumer.start()
+    _publish(fanout, [b"aaaa", b"bbbb", b"cccc"])
+    consumer.join(5)
+    assert received == [b"aaaabbbbcccc"]
+    assert not fanout.spilled
+    # The late reader missed the start and has to be served by another pass
+    assert not late.start()
+
+
+def test_publish_stops_once_every_reader_detached():
+    fanout = BlockFanout(max_buffer_bytes=4)
+    reader = fanout.reader()
+    assert reader.start()
+    reader.detach()
+    assert fanout.publish(b"data") is False
+
+
+def test_abort_fails_pending_reads():
+    fanout = BlockFanout()
+    reader = fanout.reader()
+    reader.start()
+    fanout.abort(OSError("source went away"))
+    with pytest.raises(RuntimeError, match="source went away"):
+        reader.read()
@@ -0,0 +1,85 @@
+import hashlib
+import logging
+import os
+
+import pytest
+
+from app.file_ops import FileDistribution
+from app.scheduler import FleetScheduler
+from app.sftp_transfer import SFTPUploader
+from app.ssh_pool import SSHConnectionPool
+from benchmarks.mock_ssh import MockBehavior, MockSSHFleet
+
+SIZE = 8 * 1024 * 1024
+
+
+@pytest.fixture
+def host():
+    """One mock SSH host that runs commands, so files really get placed."""
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    fleet = MockSSHFleet(1, MockBehavior(username="user", password="secret")).start()
+    yield fleet
+    fleet.stop()
+
+
+@pytest.fixture
+def dist(host, tmp_path):
+    pool = SSHConnectionPool()
+    scheduler = FleetScheduler()
+    dist = FileDistribution(
+        pool, scheduler, host.port, "user", "secret", 30, "payload.bin", str(tmp_path / "dest"),
+        owner="root", group="root", uploader=SFTPUploader(request_bytes=32 * 1024, max_outstanding=8),
+    )
+    yield dist
+    scheduler.shutdown()
+    pool.close_all()
+
+
+@pytest.fixture
+def local(tmp_path):
+    path = tmp_path / "payload.bin"
+    path.write_bytes(os.urandom(SIZE))
+    return str(path)
+
+
+def _drop_halfway(dist, ip, on_drop=None):
+    dropped = []
+
+    def progress(ip_, done, total):
+        if not dropped and total and done >= total // 2:
+            dropped.append(done)
+            if on_drop is not None:
+                on_drop()
+            dist.pool.invalidate(ip, dist.port, dist.username)
+
+    dist.on_progress = progress
+    return dropped
+
+
+def test_resumed_upload_is_verified_and_placed(host, dist, local):
+    ip = host.ips[0]
+    dropped = _drop_halfway(dist, ip)
+    dist.distribute([ip], local)
+    result = dist.results[ip]
+    assert dropped and result["ok"], result
+    assert 0 < result["resumedFrom"] < SIZE
+    # The digest was computed so finish() could check the resumed file
+    assert dist.digest == hashlib.sha256(open(local, "rb").read()).hexdigest()
+    with open(dist.dest, "rb") as placed, open(local, "rb") as src:
+        assert placed.read() == src.read()
+
+
+def test_resumed_upload_with_a_bad_prefix_is_not_moved(host, dist, local):
+    ip = host.ips[0]
+
+    def corrupt_staged_prefix():
+        with open(dist.stage_path, "r+b") as f:
+            f.write(b"\0" * 16)
+
+    _drop_halfway(dist, ip, corrupt_staged_prefix)
+    dist.distribute([ip], local)
+    result = dist.results[ip]
+    assert not result["ok"]
+    assert "Checksum mismatch" in result["error"]
+    assert not os.path.exists(dist.dest)
+    os.remove(dist.stage_path)
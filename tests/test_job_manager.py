@@ -0,0 +1,69 @@
+import time
+
+from app.job_manager import JobManager
+
+
+def _finished_job(manager, job_id, stdout=""):
+    manager.create_job(job_id, ["10.0.0.1"], "true")
+    manager.store_result(job_id, "10.0.0.1", {"ok": True, "stdout": stdout, "exit_code": 0})
+    manager.finalize_job(job_id)
+
+
+def test_reap_drops_finished_jobs_past_the_ttl():
+    manager = JobManager(ttl_seconds=60)
+    _finished_job(manager, "old")
+    _finished_job(manager, "new")
+    manager.jobs["old"]["completedAt"] = time.time() - 120
+    assert manager.reap() == 1
+    assert manager.get_job("old") is None
+    assert manager.get_job("new") is not None
+
+
+def test_reap_keeps_running_jobs():
+    manager = JobManager(ttl_seconds=0)
+    manager.create_job("running", ["10.0.0.1"], "sleep 1")
+    manager.jobs["running"]["createdAt"] = time.time() - 3600
+    assert manager.reap() == 0
+    assert manager.get_job("running") is not None
+
+
+def test_byte_cap_evicts_least_recently_viewed_finished_jobs():
+    manager = JobManager()
+    evicted = []
+    manager.configure(ttl_seconds=3600, max_bytes=10_000, on_evict=evicted.append)
+    _finished_job(manager, "a", "x" * 3000)
+    _finished_job(manager, "b", "y" * 3000)
+    # Viewing a makes b the least recently used
+    manager.get_job("a")
+    _finished_job(manager, "c", "z" * 5000)
+    assert evicted == ["b"]
+    assert manager.get_job("a") is not None
+    assert manager.get_job("c") is not None
+    assert manager.stats()["retainedBytes"] <= manager.max_bytes
+
+
+def test_byte_cap_never_evicts_running_jobs():
+    manager = JobManager(max_bytes=1000)
+    manager.create_job("running", ["10.0.0.1", "10.0.0.2"], "cat big")
+    manager.store_result("running", "10.0.0.1", {"ok": True, "stdout": "x" * 5000})
+    assert manager.get_job("running") is not None
+    assert manager.stats()["evicted"] == 0
+
+
+def test_identical_outputs_are_counted_once():
+    manager = JobManager()
+    manager.create_job("j", ["10.0.0.1", "10.0.0.2"], "uname")
+    manager.store_result("j", "10.0.0.1", {"ok": True, "stdout": "Linux\n" * 100})
+    one = manager.stats()["retainedBytes"]
+    manager.store_result("j", "10.0.0.2", {"ok": True, "stdout": "Linux\n" * 100})
+    # The second host only adds its record, not another copy of the output
+    assert manager.stats()["retainedBytes"] - one < len("Linux\n" * 100)
+
+
+def test_output_counts_utf8_bytes_not_characters():
+    manager = JobManager()
+    manager.create_job("j", ["10.0.0.1"], "cat")
+    manager.store_result("j", "10.0.0.1", {"ok": True, "stdout": "é" * 100})
+    before = manager.stats()["retainedBytes"]
+    manager.store_result("j", "10.0.0.1", {"ok": True, "stdout": ""})
+    assert before - manager.stats()["retainedBytes"] == 200
@@ -0,0 +1,95 @@
+import time
+
+from app.job_store import SQLiteJobManager
+
+
+def _store(tmp_path, **kwargs):
+    return SQLiteJobManager(str(tmp_path / "jobs.db"), **kwargs)
+
+
+def test_queued_jobs_are_claimed_once_in_order(tmp_path):
+    store = _store(tmp_path)
+    store.enqueue_job("first", ["10.0.0.1"], "uptime", probe=False)
+    time.sleep(0.01)
+    store.enqueue_job("second", ["10.0.0.2"], "df")
+    assert store.claim_job("w1") == {"jobId": "first", "ips": ["10.0.0.1"], "command": "uptime", "probe": False}
+    assert store.claim_job("w2")["jobId"] == "second"
+    assert store.claim_job("w1") is None
+
+
+def test_results_share_identical_output_and_release_it(tmp_path):
+    store = _store(tmp_path)
+    store.create_job("j", ["10.0.0.1", "10.0.0.2"], "uname")
+    for ip in ("10.0.0.1", "10.0.0.2"):
+        store.store_result("j", ip, {"ok": True, "stdout": "Linux\n", "exit_code": 0})
+    one_copy = store.stats()["retainedBytes"]
+    # Replacing both results releases the shared output once its last reference goes
+    for ip in ("10.0.0.1", "10.0.0.2"):
+        store.store_result("j", ip, {"ok": False, "stdout": "", "exit_code": 1})
+    assert store.stats()["retainedBytes"] == one_copy - len("Linux\n")
+    job = store.get_job("j")
+    assert job["results"]["10.0.0.1"]["exit_code"] == 1
+
+
+def test_changes_and_reaping(tmp_path):
+    store = _store(tmp_path, ttl_seconds=0)
+    store.create_job("j", ["10.0.0.1"], "true")
+    store.update_status("j", "10.0.0.1", "running")
+    changes = store.changes_since("j", 0)
+    assert changes["statuses"] == {"10.0.0.1": "running"}
+    store.store_result("j", "10.0.0.1", {"ok": True, "stdout": "done", "exit_code": 0})
+    store.finalize_job("j")
+    assert store.changes_since("j", changes["seq"])["completed"]
+    time.sleep(0.01)
+    assert store.reap() == 1
+    assert store.get_job("j") is None
+    stats = store.stats()
+    assert (stats["jobs"], stats["retainedBytes"], stats["evicted"]) == (0, 0, 1)
+
+
+def test_claims_whose_lease_ran_out_are_failed(tmp_path):
+    store = _store(tmp_path, lease_seconds=60)
+    store.enqueue_job("j", ["10.0.0.1", "10.0.0.2"], "sleep 600")
+    store.claim_job("elsewhere:1")
+    store.store_result("j", "10.0.0.1", {"ok": True, "stdout": "", "exit_code": 0})
+    assert store.fail_abandoned() == []
+    db = store._db()
+    db.execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = 'j'", (time.time() - 120,))
+    assert store.fail_abandoned() == ["j"]
+    job = store.get_job("j")
+    assert job["completed"]
+    assert job["results"]["10.0.0.1"]["ok"]
+    assert job["statuses"]["10.0.0.2"] == "failed"
+    assert "Abandoned" in job["results"]["10.0.0.2"]["error"]
+
+
+def test_jobs_of_an_exited_local_process_are_failed_at_once(tmp_path):
+    import socket
+    import subprocess
+
+    gone = subprocess.Popen(["true"])
+    gone.wait()
+    store = _store(tmp_path)
+    store.enqueue_job("j", ["10.0.0.1"], "true")
+    store.claim_job(f"{socket.gethostname()}:{gone.pid}")
+    assert store.fail_abandoned() == ["j"]
+
+
+def test_heartbeat_keeps_this_process_jobs_alive(tmp_path, monkeypatch):
+    store = _store(tmp_path, lease_seconds=60)
+    store.create_job("j", ["10.0.0.1"], "true")
+    store._db().execute("UPDATE jobs SET heartbeat_at = 0")
+    assert store.heartbeat() == 1
+    # Seen from another process, the renewed lease is still good
+    monkeypatch.setattr(SQLiteJobManager, "owner", property(lambda self: "elsewhere:1"))
+    assert _store(tmp_path).fail_abandoned() == []
+    assert not store.get_job("j")["completed"]
+
+
+def test_output_counts_utf8_bytes_not_characters(tmp_path):
+    store = _store(tmp_path)
+    store.create_job("j", ["10.0.0.1"], "cat")
+    store.store_result("j", "10.0.0.1", {"ok": True, "stdout": "日本" * 50})
+    before = store.stats()["retainedBytes"]
+    store.store_result("j", "10.0.0.1", {"ok": True, "stdout": ""})
+    assert before - store.stats()["retainedBytes"] == 300
@@ -0,0 +1,57 @@
+from app.output_buffer import OutputBuffer
+
+
+def test_keeps_everything_below_the_bounds():
+    buf = OutputBuffer(head_bytes=8, tail_bytes=8)
+    buf.write(b"hello ")
+    buf.write(b"world")
+    assert buf.text() == "hello world"
+    assert not buf.truncated
+    assert buf.total_bytes == 11
+
+
+def test_keeps_head_and_tail_and_marks_the_gap():
+    buf = OutputBuffer(head_bytes=4, tail_bytes=4)
+    for chunk in (b"abcd", b"efgh", b"ijkl", b"mnop"):
+        buf.write(chunk)
+    assert buf.truncated
+    assert buf.text() == "abcd\n... [8 bytes truncated] ...\nmnop"
+
+
+def test_tail_survives_many_small_writes():
+    buf = OutputBuffer(head_bytes=2, tail_bytes=3)
+    for i in range(1000):
+        buf.write(str(i % 10).encode())
+    assert buf.text().endswith("789")
+    assert buf.text().startswith("01")
+    assert buf.total_bytes == 1000
+
+
+def test_latest_spans_head_and_tail_while_contiguous():
+    buf = OutputBuffer(head_bytes=4, tail_bytes=4)
+    buf.write(b"abcdef")
+    assert buf.latest(4) == "cdef"
+    buf.write(b"ghijklmnopqrst")
+    # Once bytes between head and tail are dropped, only the tail is recent
+    assert buf.latest(10) == "qrst"
+
+
+def test_read_since_resumes_and_skips_dropped_bytes():
+    buf = OutputBuffer(head_bytes=4, tail_bytes=4)
+    buf.write(b"abcd")
+    text, offset = buf.read_since(0, 100)
+    assert (text, offset) == ("abcd", 4)
+    buf.write(b"efghijklmnop")
+    text, offset = buf.read_since(offset, 100)
+    assert text == "\n... [8 bytes skipped] ...\nmnop"
+    assert offset == 16
+    assert buf.read_since(offset, 100) == ("", 16)
+
+
+def test_spill_file_holds_the_full_stream(tmp_path):
+    path = tmp_path / "logs" / "host.stdout.log"
+    buf = OutputBuffer(head_bytes=2, tail_bytes=2, spill_path=str(path))
+    buf.write(b"0123456789")
+    buf.close()
+    assert path.read_bytes() == b"0123456789"
+    assert buf.truncated
@@ -0,0 +1,83 @@
+import pytest
+
+from app.output_buffer import OutputBuffer
+from app.pipeline import _Framer, parse_steps
+
+MARKER = b"\ntok:0 "
+
+
+def _framer(with_status=True):
+    buf = OutputBuffer()
+    return _Framer(MARKER, [buf], with_status=with_status), buf
+
+
+def test_output_before_the_sentinel_passes_through_byte_for_byte():
+    framer, buf = _framer()
+    framer.feed(b"line one\nline two")
+    framer.feed(b"\ntok:0 3\n")
+    assert framer.done
+    assert framer.status == 3
+    assert buf.text() == "line one\nline two"
+
+
+def test_sentinel_split_across_reads():
+    framer, buf = _framer()
+    for byte in b"out\ntok:0 17\n":
+        framer.feed(bytes([byte]))
+    assert framer.done and framer.status == 17
+    assert buf.text() == "out"
+
+
+def test_partial_sentinel_is_held_back_until_settled():
+    framer, buf = _framer()
+    framer.feed(b"data\ntok")
+    assert buf.text() == "da"
+    # It was not the sentinel after all
+    framer.feed(b"en\n")
+    assert not framer.done
+    framer.flush()
+    assert buf.text() == "data\ntoken\n"
+
+
+def test_status_waits_for_the_end_of_its_line():
+    framer, _ = _framer()
+    framer.feed(b"\ntok:0 12")
+    assert not framer.done
+    framer.feed(b"7\n")
+    assert framer.status == 127
+
+
+def test_bytes_after_the_sentinel_are_kept_for_the_next_step():
+    framer, buf = _framer()
+    framer.feed(b"a\ntok:0 0\nnext step output")
+    framer.feed(b" and more")
+    assert buf.text() == "a"
+    assert framer.leftover == b"next step output and more"
+
+
+def test_stderr_sentinel_has_no_status():
+    buf = OutputBuffer()
+    framer = _Framer(b"\ntok:0\n", [buf])
+    framer.feed(b"warning\n\ntok:0\n")
+    assert framer.done and framer.status is None
+    assert buf.text() == "warning\n"
+
+
+def test_parse_steps_accepts_strings_and_objects():
+    steps = parse_steps(["uptime", {"command": " df -h ", "name": "disk", "timeout": 5, "continueOnFailure": True}],
+                        default_timeout=30)
+    assert [s.command for s in steps] == ["uptime", "df -h"]
+    assert steps[0].timeout == 30 and not steps[0].continue_on_failure
+    assert steps[1].name == "disk" and steps[1].timeout == 5 and steps[1].continue_on_failure
+
+
+@pytest.mark.parametrize("raw, message", [
+    ([], "list of steps"),
+    (["ok", 3], "Step 2"),
+    ([{"command": ""}], "command is required"),
+    ([{"command": "ls", "timeout": 0}], "timeout"),
+    ([{"command": "ls", "timeout": True}], "timeout"),
+])
+def test_parse_steps_rejects_invalid_steps(raw, message):
+    with pytest.raises(ValueError, match=message):
+        parse_steps(raw, default_timeout=30)
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from app.scheduler import FleetScheduler, when_all_done
+
+
+def test_jobs_take_turns_on_a_saturated_scheduler():
+    scheduler = FleetScheduler(max_workers=1)
+    gate = threading.Event()
+    order = []
+
+    def task(name):
+        gate.wait(5)
+        order.append(name)
+
+    # The big job arrives first and queues far more work than there are workers
+    futures = [scheduler.submit("big", f"10.0.0.{i}", task, f"big-{i}") for i in range(6)]
+    futures += [scheduler.submit("small", f"10.0.1.{i}", task, f"small-{i}") for i in range(2)]
+    gate.set()
+    for fut in futures:
+        fut.result(5)
+    scheduler.shutdown()
+    assert len(order) == 8
+    # Round robin: the small job finishes long before the big one has drained
+    assert order.index("small-1") < order.index("big-4")
+
+
+def _peak_concurrency(scheduler, submits):
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def task():
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    futures = [scheduler.submit(job, host, task) for job, host in submits]
+    for fut in futures:
+        fut.result(5)
+    scheduler.shutdown()
+    return running[1]
+
+
+def test_per_host_limit_holds_across_jobs():
+    scheduler = FleetScheduler(max_workers=8, per_host_limit=2)
+    submits = [(f"job-{i % 3}", "10.0.0.1") for i in range(9)]
+    assert _peak_concurrency(scheduler, submits) == 2
+
+
+def test_per_job_limit_caps_one_job():
+    scheduler = FleetScheduler(max_workers=8, per_job_limit=3)
+    submits = [("job", f"10.0.0.{i}") for i in range(9)]
+    assert _peak_concurrency(scheduler, submits) == 3
+
+
+def test_global_cap_bounds_all_jobs():
+    scheduler = FleetScheduler(max_workers=4)
+    submits = [(f"job-{i % 3}", f"10.0.0.{i}") for i in range(12)]
+    assert _peak_concurrency(scheduler, submits) <= 4
+
+
+def test_task_errors_reach_the_future():
+    scheduler = FleetScheduler(max_workers=1)
+
+    def fail():
+        raise ValueError("boom")
+
+    fut = scheduler.submit("job", "10.0.0.1", fail)
+    assert isinstance(fut.exception(5), ValueError)
+    scheduler.shutdown()
+
+
+def test_when_all_done_fires_once_after_the_last_future():
+    scheduler = FleetScheduler(max_workers=2)
+    calls = []
+    done = threading.Event()
+    futures = [scheduler.submit("job", f"10.0.0.{i}", time.sleep, 0.01) for i in range(4)]
+    when_all_done(futures, lambda: (calls.append(1), done.set()))
+    assert done.wait(5)
+    assert calls == [1]
+    assert all(fut.done() for fut in futures)
+    scheduler.shutdown()
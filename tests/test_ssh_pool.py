@@ -0,0 +1,79 @@
+import time
+
+import paramiko
+import pytest
+
+from app.ssh_pool import SSHConnectionPool
+
+
+@pytest.fixture
+def pool():
+    pool = SSHConnectionPool()
+    yield pool
+    pool.close_all()
+
+
+def _run(pool, ip, port, password):
+    with pool.session(ip, port, "user", password, timeout=5) as chan:
+        chan.exec_command("true")
+        return chan.recv_exit_status()
+
+
+def test_repeat_runs_reuse_the_pooled_transport(fleet, pool):
+    ip = fleet.ips[0]
+    assert _run(pool, ip, fleet.port, "secret") == 0
+    assert _run(pool, ip, fleet.port, "secret") == 0
+    assert fleet.connections == 1
+    assert pool.stats() == {"connections": 1, "channelsInUse": 0}
+
+
+def test_wrong_password_is_rejected_after_the_pool_is_warm(fleet, pool):
+    ip = fleet.ips[0]
+    assert _run(pool, ip, fleet.port, "secret") == 0
+    # A transport authenticated with the right password must not serve this caller
+    with pytest.raises(paramiko.AuthenticationException):
+        _run(pool, ip, fleet.port, "wrong")
+    assert fleet.connections == 2
+    # The failed login leaves the good transport in place
+    assert _run(pool, ip, fleet.port, "secret") == 0
+    assert fleet.connections == 2
+    assert pool.stats()["connections"] == 1
+
+
+def test_invalidate_closes_transports_for_every_credential(fleet, pool):
+    ip = fleet.ips[0]
+    _run(pool, ip, fleet.port, "secret")
+    _run(pool, fleet.ips[1], fleet.port, "secret")
+    pool.invalidate(ip, fleet.port, "user")
+    assert pool.stats()["connections"] == 1
+    assert _run(pool, ip, fleet.port, "secret") == 0
+    assert fleet.connections == 3
+
+
+def test_unanswered_keepalive_drops_the_transport(fleet):
+    pool = SSHConnectionPool(health_check_interval=0, keepalive_timeout=0.2)
+    ip = fleet.ips[0]
+    try:
+        _run(pool, ip, fleet.port, "secret")
+        transport = next(iter(pool._entries.values())).transport
+        # A half-open peer: the keepalive reply never comes
+        transport.global_request = lambda *args, **kwargs: time.sleep(30)
+        started = time.monotonic()
+        assert _run(pool, ip, fleet.port, "secret") == 0
+        assert time.monotonic() - started < 5
+        assert fleet.connections == 2
+        assert not transport.is_active()
+    finally:
+        pool.close_all()
+
+
+def test_per_key_state_is_dropped_with_the_last_transport(fleet, pool):
+    for password in ("secret", "wrong"):
+        try:
+            _run(pool, fleet.ips[0], fleet.port, password)
+        except paramiko.AuthenticationException:
+            pass
+    # Only the key with a live transport keeps its semaphore and connect lock
+    assert len(pool._slots) == len(pool._connect_locks) == 1
+    pool.invalidate(fleet.ips[0], fleet.port, "user")
+    assert pool._slots == {} and pool._connect_locks == {}
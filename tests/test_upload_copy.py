@@ -0,0 +1,109 @@
+import hashlib
+import io
+import logging
+import os
+
+import pytest
+
+from app import create_app
+from benchmarks.mock_ssh import MockBehavior, MockSSHFleet
+
+PAYLOAD = os.urandom(256 * 1024)
+
+
+@pytest.fixture
+def host():
+    """One mock SSH host that runs commands, so files really get placed."""
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    fleet = MockSSHFleet(1, MockBehavior(username="user", password="secret")).start()
+    yield fleet
+    fleet.stop()
+
+
+@pytest.fixture
+def client(host, tmp_path, monkeypatch):
+    monkeypatch.setenv("SSH_USERNAME", "user")
+    monkeypatch.setenv("SSH_PASSWORD", "secret")
+    monkeypatch.setenv("SSH_DEFAULT_PORT", str(host.port))
+    monkeypatch.setenv("SSH_KNOWN_HOSTS_FILE", str(tmp_path / "known_hosts"))
+    app = create_app()
+    app.instance_path = str(tmp_path / "instance")
+    return app.test_client()
+
+
+def _upload(client, ip, dest_dir, **fields):
+    # Fields first and the file last, as the UI sends them
+    data = dict({"ips": ip, "destDir": dest_dir, "owner": "root", "group": "root", "mode": "sync"}, **fields)
+    data["file"] = (io.BytesIO(PAYLOAD), "payload.bin")
+    res = client.post("/api/upload-copy", data=data, content_type="multipart/form-data")
+    return res.get_json()
+
+
+@pytest.fixture
+def dest_dir(tmp_path):
+    """A destination already holding the payload, so the host should be skipped."""
+    path = tmp_path / "dest"
+    path.mkdir()
+    (path / "payload.bin").write_bytes(PAYLOAD)
+    os.chmod(path / "payload.bin", 0o644)
+    return str(path)
+
+
+def test_streamed_upload_with_a_digest_skips_unchanged_hosts(client, host, dest_dir):
+    ip = host.ips[0]
+    data = _upload(client, ip, dest_dir, sha256=hashlib.sha256(PAYLOAD).hexdigest())
+    assert data["ok"] and data["pipelined"]
+    assert data["results"][ip]["skipped"] is True
+    assert data["results"][ip]["transferredBytes"] == 0
+
+
+def test_upload_without_a_digest_is_saved_and_hashed_to_skip_unchanged_hosts(client, host, dest_dir):
+    ip = host.ips[0]
+    data = _upload(client, ip, dest_dir)
+    assert data["ok"] and not data["pipelined"]
+    assert data["results"][ip]["skipped"] is True
+    assert data["results"][ip]["transferredBytes"] == 0
+
+
+def test_upload_without_a_digest_streams_when_skipping_is_off(client, host, dest_dir):
+    ip = host.ips[0]
+    data = _upload(client, ip, dest_dir, skipUnchanged="0")
+    assert data["ok"] and data["pipelined"]
+    assert data["results"][ip]["skipped"] is False
+    with open(os.path.join(dest_dir, "payload.bin"), "rb") as f:
+        assert f.read() == PAYLOAD
+
+
+class _CutOff(io.BytesIO):
+    """A request body whose connection resets once its bytes run out."""
+
+    def readinto(self, b):
+        n = super().readinto(b)
+        if not n:
+            raise ConnectionResetError("client went away")
+        return n
+
+
+def test_client_leaving_after_every_host_was_skipped_still_gets_results(client, host, dest_dir):
+    ip = host.ips[0]
+    boundary = "cut-off"
+    fields = {"ips": ip, "destDir": dest_dir, "owner": "root", "group": "root", "mode": "sync",
+              "sha256": hashlib.sha256(PAYLOAD).hexdigest()}
+    body = "".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        for name, value in fields.items()
+    )
+    body += f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="payload.bin"\r\n\r\n'
+    body = body.encode() + PAYLOAD[: len(PAYLOAD) // 2]
+    # No host needs the file, so most of the body is only drained after the fact
+    client.application.config["PIPELINE_BLOCK_BYTES"] = 4096
+    res = client.post(
+        "/api/upload-copy",
+        input_stream=_CutOff(body),
+        content_type=f"multipart/form-data; boundary={boundary}",
+        # The client promised the whole file but went away halfway through it
+        environ_overrides={"CONTENT_LENGTH": str(len(body) + len(PAYLOAD))},
+    )
+    data = res.get_json()
+    assert res.status_code == 200 and data["pipelined"]
+    assert data["results"][ip]["skipped"] is True